@@ -1,26 +1,34 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import uuid
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
+from src.core.cancellation import CancelScope, cancel_scope
+from src.core.metrics import inc_counter
 from src.core.output_coercion import coerce_model_output, shorten_quote
-from src.graph.job_coach_graph import run_graph
+from src.core.settings import get_settings
+from src.graph.job_coach_graph import arun_graph, graph_checkpointing, run_graph
+from src.graph.request_flight import astart_flight
 from src.graph.redis_session_store import (
-    acquire_conversation_lock,
-    assert_redis_available,
+    TurnStart,
+    aappend_conversation_history,
+    abegin_turn,
+    afinish_turn,
+    aget_conversation_history,
+    arelease_conversation_lock,
     get_request_result,
-    get_resume_interview_state,
-    release_conversation_lock,
-    set_request_result,
-    set_resume_interview_state,
 )
-from src.rag.store import get_collection
+from src.rag.store import get_chunks
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
@@ -37,16 +45,24 @@ class ChatStreamRequest(BaseModel):
     request_id: str | None = None
 
 
-def _sse_event(event: str, data: dict) -> str:
+def _sse_event(event: str, data: dict, event_id: int | None = None) -> str:
     payload = json.dumps(data, ensure_ascii=False)
-    return f"event: {event}\ndata: {payload}\n\n"
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {payload}\n\n"
+
+
+def _parse_last_event_id(value: str | None) -> int:
+    try:
+        return max(0, int(str(value or "").strip() or 0))
+    except ValueError:
+        return 0
 
 
 def _chunk_text(text: str, size: int = 48) -> list[str]:
     return [text[i : i + size] for i in range(0, len(text), size)]
 
 
-def _requires_redis_session(payload: ChatStreamRequest) -> bool:
+def _is_resume_interview(payload: ChatStreamRequest) -> bool:
     return (
         (payload.mode or "chat") == "resume_interview"
         and (payload.active_source_type or "") == "resume"
@@ -54,13 +70,22 @@ def _requires_redis_session(payload: ChatStreamRequest) -> bool:
     )
 
 
-def _invoke_graph(
+def _requires_redis_session(payload: ChatStreamRequest) -> bool:
+    """Turns run under the conversation lock: resume interviews, whose state lives in Redis, and with checkpointing
+    every tracked conversation, whose checkpoint a concurrent turn would otherwise overwrite."""
+    if (payload.conversation_id or "").strip() and graph_checkpointing():
+        return True
+    return _is_resume_interview(payload)
+
+
+async def _invoke_graph(
     payload: ChatStreamRequest,
     *,
     conversation_id: str,
     resume_state: dict,
+    history: list,
+    checkpoint: bool = True,
 ) -> dict:
-    history = list(payload.history or [])
     session = {
         "mode": payload.mode or "chat",
         "active_source_id": payload.active_source_id,
@@ -68,8 +93,108 @@ def _invoke_graph(
         "conversation_id": conversation_id,
         "resume_interview_state": resume_state,
     }
-    history.insert(0, {"role": "system", "content": f"__SESSION__:{json.dumps(session, ensure_ascii=False)}"})
-    return run_graph(payload.question, history)
+    # Only conversations the client tracks get a checkpoint; anonymous one-offs run stateless.
+    thread_id = conversation_id if (payload.conversation_id or "").strip() and checkpoint else None
+    if get_settings().graph_async:
+        try:
+            return await arun_graph(payload.question, history, session, thread_id=thread_id)
+        except asyncio.CancelledError:
+            # The turn was abandoned; the LLM/embedding await in flight was cancelled along with this task.
+            inc_counter("chat_requests_cancelled_total")
+            raise
+
+    # GRAPH_ASYNC=false: the sync graph runs on a worker thread, stopped through the cancel scope.
+    scope = CancelScope(asyncio.get_running_loop())
+    try:
+        return await asyncio.to_thread(_run_graph_in_scope, scope, payload.question, history, session, thread_id)
+    except asyncio.CancelledError:
+        # The turn was abandoned: abort the LLM/embedding call in flight and stop the graph before its next one.
+        scope.cancel()
+        inc_counter("chat_requests_cancelled_total")
+        raise
+
+
+def _run_graph_in_scope(
+    scope: CancelScope,
+    question: str,
+    history: list,
+    session: dict,
+    thread_id: str | None,
+) -> dict:
+    with cancel_scope(scope):
+        return run_graph(question, history, session, thread_id=thread_id)
+
+
+def _server_history_needed(payload: ChatStreamRequest) -> bool:
+    """An empty client history on a known conversation; with checkpointing the graph resumes its own state."""
+    return not payload.history and bool((payload.conversation_id or "").strip()) and not graph_checkpointing()
+
+
+async def _load_history(payload: ChatStreamRequest, conversation_id: str) -> list:
+    """Client-sent history wins; an empty one on a known conversation is filled from the server transcript."""
+    if not _server_history_needed(payload):
+        return list(payload.history or [])
+    try:
+        return await aget_conversation_history(conversation_id)
+    except RuntimeError as exc:
+        logger.warning("server-side history unavailable for %s: %s", conversation_id, exc)
+        return []
+
+
+async def _begin_turn(
+    payload: ChatStreamRequest,
+    conversation_id: str,
+    lock_token: str,
+    request_id: str,
+) -> TurnStart | None:
+    """Start the turn under the conversation lock; None when Redis is down for a plain chat.
+
+    Only resume interviews need their Redis state. A chat that is locked just for checkpointing then runs the
+    stateless, uncheckpointed path, as it did before checkpointing existed.
+    """
+    try:
+        return await abegin_turn(
+            conversation_id,
+            lock_token,
+            request_id,
+            load_history=_server_history_needed(payload),
+        )
+    except RuntimeError as exc:
+        if _is_resume_interview(payload):
+            raise
+        logger.warning("conversation lock unavailable for %s, running uncheckpointed: %s", conversation_id, exc)
+        inc_counter("graph_checkpoint_bypassed_total")
+        return None
+
+
+async def _near_cached_result(payload: ChatStreamRequest, conversation_id: str, request_id: str) -> dict | None:
+    """A retry of a stored request id can be answered from the near-cache without queueing for the lock."""
+    if not _requires_redis_session(payload) or not get_settings().session_near_cache:
+        return None
+    if not (payload.conversation_id or "").strip() or not (payload.request_id or "").strip():
+        return None
+    try:
+        cached = await asyncio.to_thread(get_request_result, conversation_id, request_id)
+    except RuntimeError as exc:
+        logger.warning("near-cache read failed for %s: %s", conversation_id, exc)
+        return None
+    if cached is not None:
+        inc_counter("session_request_replays_total", source="near_cache")
+    return cached
+
+
+async def _store_turn(conversation_id: str, question: str, answer: str, client_history: list) -> bool:
+    """Append the turn; a longer client history first reseeds a transcript the server lost or never had."""
+    try:
+        await aappend_conversation_history(
+            conversation_id,
+            [{"role": "user", "content": question}, {"role": "assistant", "content": answer}],
+            seed=client_history,
+        )
+        return True
+    except RuntimeError as exc:
+        logger.warning("server-side history append failed for %s: %s", conversation_id, exc)
+        return False
 
 
 def _extract_citation_ids(citations: object) -> list[str]:
@@ -99,27 +224,21 @@ def _compact_result_for_request_cache(result: dict) -> dict:
 
 
 def _load_context_by_ids(citation_ids: list[str]) -> list[dict]:
-    ids = [cid for cid in citation_ids if isinstance(cid, str) and cid.strip()]
-    if not ids:
-        return []
-    collection = get_collection()
-    raw = collection.get(ids=ids, include=["documents", "metadatas"])
-    got_ids = raw.get("ids") or []
-    docs = raw.get("documents") or []
-    metas = raw.get("metadatas") or []
-
-    by_id: dict[str, dict] = {}
-    for idx, cid in enumerate(got_ids):
-        if not isinstance(cid, str):
-            continue
-        by_id[cid] = {
-            "id": cid,
-            "text": str(docs[idx]) if idx < len(docs) else "",
-            "metadata": metas[idx] if idx < len(metas) and isinstance(metas[idx], dict) else {},
-            "score": 0.0,
-        }
+    return [{**chunk, "score": 0.0} for chunk in get_chunks(citation_ids)]
 
-    return [by_id[cid] for cid in ids if cid in by_id]
+
+async def _cited_context(used_context: object, citations: object) -> list[dict]:
+    """The used_context entries the client renders: cited ones only, loading a text the tool did not carry."""
+    by_id = {c.get("id"): c for c in (used_context if isinstance(used_context, list) else []) if isinstance(c, dict)}
+    cited_ids = _extract_citation_ids(citations)
+    missing = [cid for cid in cited_ids if not by_id.get(cid, {}).get("text")]
+    if missing:
+        try:
+            for item in await asyncio.to_thread(_load_context_by_ids, missing):
+                by_id[item["id"]] = {**item, **by_id.get(item["id"], {}), "text": item["text"]}
+        except Exception as exc:
+            logger.warning("loading cited context failed: %s", exc)
+    return [by_id[cid] for cid in cited_ids if cid in by_id]
 
 
 def _result_from_cached_payload(cached: dict) -> dict:
@@ -139,80 +258,156 @@ def _result_from_cached_payload(cached: dict) -> dict:
     }
 
 
-@router.post("/chat/stream")
-async def chat_stream(payload: ChatStreamRequest):
-    async def event_generator():
-        try:
-            yield _sse_event("status", {"stage": "retrieve", "message": "检索中..."})
-            yield _sse_event("status", {"stage": "generate", "message": "生成回答..."})
-
-            conversation_id = (payload.conversation_id or "").strip() or f"conv_{uuid.uuid4().hex}"
-            request_id = (payload.request_id or "").strip() or f"req_{uuid.uuid4().hex}"
-            result: dict
-
-            if _requires_redis_session(payload):
-                assert_redis_available()
-                lock_token = f"lock_{uuid.uuid4().hex}"
-                if not acquire_conversation_lock(conversation_id, lock_token):
-                    raise RuntimeError("会话正在处理中，请稍后重试。")
+async def _turn_events(payload: ChatStreamRequest, conversation_id: str, request_id: str):
+    """(event, data) pairs for one chat turn; failures end the stream with an error event."""
+    try:
+        yield "status", {"stage": "retrieve", "message": "检索中..."}
+        yield "status", {"stage": "generate", "message": "生成回答..."}
+
+        result: dict
+        fresh_turn = True
+        # True only once this request has appended the turn to the server transcript.
+        history_stored = False
+
+        near_cached = await _near_cached_result(payload, conversation_id, request_id)
+        locked = near_cached is None and _requires_redis_session(payload)
+        lock_token = f"lock_{uuid.uuid4().hex}"
+        turn = await _begin_turn(payload, conversation_id, lock_token, request_id) if locked else None
+        if near_cached is not None:
+            result = _result_from_cached_payload(near_cached)
+            fresh_turn = False
+        elif turn is not None:
+            tracked = bool((payload.conversation_id or "").strip())
+            if not turn.acquired:
+                raise RuntimeError("会话正在处理中，请稍后重试。")
+            if turn.cached_result is not None:
+                # begin_turn already released the lock for a replayed request id.
+                inc_counter("session_request_replays_total", source="redis")
+                result = _result_from_cached_payload(turn.cached_result)
+                fresh_turn = False
+            else:
+                finished = False
+                resume_interview = _is_resume_interview(payload)
                 try:
-                    cached = get_request_result(conversation_id, request_id)
-                    if isinstance(cached, dict):
-                        result = _result_from_cached_payload(cached)
-                    else:
-                        resume_state = get_resume_interview_state(conversation_id)
-                        result = _invoke_graph(
-                            payload,
-                            conversation_id=conversation_id,
-                            resume_state=resume_state,
-                        )
-                        next_session = result.get("session") if isinstance(result.get("session"), dict) else {}
-                        next_resume_state = (
-                            next_session.get("resume_interview_state")
-                            if isinstance(next_session.get("resume_interview_state"), dict)
-                            else {}
-                        )
-                        set_resume_interview_state(conversation_id, next_resume_state)
-                        set_request_result(
-                            conversation_id,
-                            request_id,
-                            _compact_result_for_request_cache(result),
-                        )
+                    result = await _invoke_graph(
+                        payload,
+                        conversation_id=conversation_id,
+                        resume_state=turn.resume_state if resume_interview else {},
+                        history=list(payload.history or []) or turn.history,
+                    )
+                    next_session = result.get("session") if isinstance(result.get("session"), dict) else {}
+                    next_resume_state = (
+                        next_session.get("resume_interview_state")
+                        if isinstance(next_session.get("resume_interview_state"), dict)
+                        else {}
+                    )
+                    if not resume_interview:
+                        # A chat turn only borrows the lock; the interview state it loaded goes back unchanged.
+                        next_resume_state = turn.resume_state
+                    turn_answer, _ = coerce_model_output(result.get("answer", ""))
+                    await afinish_turn(
+                        conversation_id,
+                        lock_token,
+                        resume_state=next_resume_state,
+                        request_id=request_id,
+                        result=_compact_result_for_request_cache(result),
+                        history=(
+                            [
+                                {"role": "user", "content": payload.question},
+                                {"role": "assistant", "content": turn_answer},
+                            ]
+                            if tracked
+                            else []
+                        ),
+                        seed=list(payload.history or []) if tracked else [],
+                    )
+                    finished = True
+                    fresh_turn = False
+                    history_stored = tracked
                 finally:
-                    release_conversation_lock(conversation_id, lock_token)
-            else:
-                result = _invoke_graph(payload, conversation_id=conversation_id, resume_state={})
-
-            answer, _ = coerce_model_output(result.get("answer", ""))
-            for chunk in _chunk_text(answer):
-                yield _sse_event("token", {"delta": chunk})
-
-            yield _sse_event("status", {"stage": "finalize", "message": "整理引用..."})
-            candidate_map = {c.get("id"): c for c in (result.get("used_context", []) or []) if isinstance(c, dict)}
-            citations: list[dict] = []
-            for item in (result.get("citations", []) or []):
-                if isinstance(item, str):
-                    ctx = candidate_map.get(item, {})
-                    citations.append({"id": item, "quote": shorten_quote(ctx.get("text", ""))})
-                elif isinstance(item, dict):
-                    cid = item.get("id")
-                    if not cid:
-                        continue
-                    quote = item.get("quote") or candidate_map.get(cid, {}).get("text", "")
-                    citations.append({"id": cid, "quote": shorten_quote(quote)})
-
-            yield _sse_event(
-                "context",
-                {
-                    "citations": citations,
-                    "used_context": result.get("used_context", []),
-                    "conversation_id": conversation_id,
-                    "request_id": request_id,
-                },
+                    if not finished:
+                        # Shielded so a client disconnect still frees the lock now rather than at its TTL.
+                        await asyncio.shield(arelease_conversation_lock(conversation_id, lock_token))
+        else:
+            result = await _invoke_graph(
+                payload,
+                conversation_id=conversation_id,
+                resume_state={},
+                history=await _load_history(payload, conversation_id),
+                # A lock that could not be taken means no checkpoint either.
+                checkpoint=not locked,
             )
-            yield _sse_event("done", {"ok": True, "conversation_id": conversation_id, "request_id": request_id})
-        except Exception as exc:
-            yield _sse_event("error", {"ok": False, "error": str(exc)})
+
+        answer, _ = coerce_model_output(result.get("answer", ""))
+        # Only conversations the client already tracks get a server transcript; anonymous one-offs skip Redis.
+        if fresh_turn and (payload.conversation_id or "").strip():
+            history_stored = await _store_turn(conversation_id, payload.question, answer, list(payload.history or []))
+        for chunk in _chunk_text(answer):
+            yield "token", {"delta": chunk}
+
+        yield "status", {"stage": "finalize", "message": "整理引用..."}
+        # The client only renders cited evidence, so the rest of used_context never leaves the server.
+        cited_context = await _cited_context(result.get("used_context"), result.get("citations"))
+        candidate_map = {c.get("id"): c for c in cited_context}
+        citations: list[dict] = []
+        for item in (result.get("citations", []) or []):
+            if isinstance(item, str):
+                ctx = candidate_map.get(item, {})
+                citations.append({"id": item, "quote": shorten_quote(ctx.get("text", ""))})
+            elif isinstance(item, dict):
+                cid = item.get("id")
+                if not cid:
+                    continue
+                quote = item.get("quote") or candidate_map.get(cid, {}).get("text", "")
+                citations.append({"id": cid, "quote": shorten_quote(quote)})
+
+        yield "context", {
+            "citations": citations,
+            "used_context": cited_context,
+            "conversation_id": conversation_id,
+            "request_id": request_id,
+        }
+        yield "done", {
+            "ok": True,
+            "conversation_id": conversation_id,
+            "request_id": request_id,
+            "history_stored": history_stored,
+        }
+    except Exception as exc:
+        yield "error", {"ok": False, "error": str(exc)}
+
+
+@router.post("/chat/stream")
+async def chat_stream(
+    payload: ChatStreamRequest,
+    last_event_id: str | None = Header(default=None, alias="Last-Event-ID"),
+):
+    resume_after = _parse_last_event_id(last_event_id)
+    conversation_id = (payload.conversation_id or "").strip() or f"conv_{uuid.uuid4().hex}"
+    request_id = (payload.request_id or "").strip() or f"req_{uuid.uuid4().hex}"
+
+    async def event_generator():
+        # Only a client-chosen (conversation_id, request_id) pair can repeat, so only those requests coalesce.
+        flight = None
+        if (payload.conversation_id or "").strip() and (payload.request_id or "").strip():
+            flight = await astart_flight(conversation_id, request_id)
+        if flight is None:
+            # Nobody can resume an anonymous request, so it runs inline and a disconnect stops it right away.
+            async for event, data in _turn_events(payload, conversation_id, request_id):
+                yield _sse_event(event, data)
+            return
+        after = resume_after
+        if flight.leader:
+            if resume_after:
+                # The buffered stream is gone; run the request again (ids restart at 1, so the client starts over).
+                inc_counter("sse_resumes_total", outcome="expired")
+                after = 0
+            # The turn runs detached and this response only follows it, so a dropped connection can resume.
+            flight.lead(_turn_events(payload, conversation_id, request_id))
+        elif resume_after:
+            inc_counter("sse_resumes_total", outcome="resumed")
+        async for seq, event, data in flight.follow(after=after):
+            yield _sse_event(event, data, seq)
 
     headers = {
         "Cache-Control": "no-cache",
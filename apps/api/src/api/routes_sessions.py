@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+
+from src.graph.redis_session_store import session_memory_report
+
+
+router = APIRouter()
+
+
+@router.get("/sessions/memory")
+def sessions_memory(conversation_id: str | None = None, sample: int = 200):
+    try:
+        report = session_memory_report(conversation_id, sample=min(max(sample, 1), 5000))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return {"ok": True, **report}
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Coroutine, Iterator
+
+
+class RequestCancelled(BaseException):
+    """The client went away. Derives from BaseException so `except Exception` fallbacks do not swallow it."""
+
+
+class CancelScope:
+    """Cancellation shared by one request's async handler and the worker thread running its graph.
+
+    Blocking HTTP calls made inside the scope are dispatched to the request's event loop, so cancel() can abort
+    them mid-flight instead of waiting for the upstream to answer.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None):
+        self._loop = loop
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._futures: set[concurrent.futures.Future] = set()
+        self._children: set[CancelScope] = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        self._event.set()
+        with self._lock:
+            futures = list(self._futures)
+            children = list(self._children)
+        for future in futures:
+            future.cancel()
+        for child in children:
+            child.cancel()
+
+    @contextmanager
+    def child(self) -> Iterator[CancelScope]:
+        """A scope on the same loop that is cancelled along with this one but can also be cancelled on its own."""
+        child = CancelScope(self._loop)
+        with self._lock:
+            self._children.add(child)
+        if self._event.is_set():
+            child.cancel()
+        try:
+            yield child
+        finally:
+            with self._lock:
+                self._children.discard(child)
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise RequestCancelled()
+
+    def can_dispatch(self) -> bool:
+        """True on a worker thread of a scope bound to a running loop other than the current thread's."""
+        if self._loop is None or self._loop.is_closed():
+            return False
+        try:
+            return asyncio.get_running_loop() is not self._loop
+        except RuntimeError:
+            return True
+
+    def run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        """Run coro on the scope's loop and block for its result; raises RequestCancelled if cancelled meanwhile."""
+        self.check()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        with self._lock:
+            self._futures.add(future)
+        try:
+            if self._event.is_set():
+                future.cancel()
+            return future.result()
+        except concurrent.futures.CancelledError:
+            raise RequestCancelled() from None
+        finally:
+            with self._lock:
+                self._futures.discard(future)
+
+
+_SCOPE: contextvars.ContextVar[CancelScope | None] = contextvars.ContextVar("cancel_scope", default=None)
+
+
+def current_cancel_scope() -> CancelScope | None:
+    return _SCOPE.get()
+
+
+def check_cancelled() -> None:
+    scope = _SCOPE.get()
+    if scope is not None:
+        scope.check()
+
+
+@contextmanager
+def cancel_scope(scope: CancelScope) -> Iterator[CancelScope]:
+    token = _SCOPE.set(scope)
+    try:
+        yield scope
+    finally:
+        _SCOPE.reset(token)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import weakref
+
+import httpx
+
+from src.core.cancellation import current_cancel_scope
+from src.core.settings import get_settings
+
+
+DEFAULT_TIMEOUT_S = 30.0
+
+_SYNC_CLIENT: httpx.Client | None = None
+_SYNC_LOCK = threading.Lock()
+# httpx.AsyncClient connections are bound to the event loop that opened them,
+# so keep one pooled client per running loop.
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+def _client_kwargs() -> dict:
+    cfg = get_settings()
+    return {
+        "http2": bool(cfg.http2_enabled) and _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=max(1, int(cfg.http_max_connections)),
+            max_keepalive_connections=max(0, int(cfg.http_max_keepalive_connections)),
+            keepalive_expiry=max(0.0, float(cfg.http_keepalive_expiry_s)),
+        ),
+        "timeout": httpx.Timeout(DEFAULT_TIMEOUT_S, connect=float(cfg.http_connect_timeout_s)),
+    }
+
+
+def _call_timeout(timeout: float | None) -> httpx.Timeout:
+    cfg = get_settings()
+    total = float(timeout) if timeout is not None else DEFAULT_TIMEOUT_S
+    return httpx.Timeout(total, connect=min(total, float(cfg.http_connect_timeout_s)))
+
+
+def get_http_client() -> httpx.Client:
+    global _SYNC_CLIENT
+    if _SYNC_CLIENT is None:
+        with _SYNC_LOCK:
+            if _SYNC_CLIENT is None:
+                _SYNC_CLIENT = httpx.Client(**_client_kwargs())
+    return _SYNC_CLIENT
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_kwargs())
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+
+def _json_headers(headers: dict | None) -> dict:
+    out = {"Content-Type": "application/json"}
+    out.update(headers or {})
+    return out
+
+
+def post_json(url: str, payload: dict, *, headers: dict | None = None, timeout: float | None = None) -> dict:
+    scope = current_cancel_scope()
+    if scope is not None and scope.can_dispatch():
+        # Inside a cancellable request the call runs on the request's loop, so a disconnect aborts it mid-flight.
+        return scope.run(apost_json(url, payload, headers=headers, timeout=timeout))
+    client = get_http_client()
+    response = client.post(
+        url,
+        content=json.dumps(payload).encode("utf-8"),
+        headers=_json_headers(headers),
+        timeout=_call_timeout(timeout),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+async def apost_json(
+    url: str,
+    payload: dict,
+    *,
+    headers: dict | None = None,
+    timeout: float | None = None,
+) -> dict:
+    client = get_async_http_client()
+    response = await client.post(
+        url,
+        content=json.dumps(payload).encode("utf-8"),
+        headers=_json_headers(headers),
+        timeout=_call_timeout(timeout),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def close_http_client() -> None:
+    global _SYNC_CLIENT
+    with _SYNC_LOCK:
+        client = _SYNC_CLIENT
+        _SYNC_CLIENT = None
+    if client is not None:
+        client.close()
+
+
+async def aclose_http_client() -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    client = _ASYNC_CLIENTS.pop(loop, None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import threading
+
+
+_LOCK = threading.Lock()
+_COUNTERS: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+_GAUGES: dict[tuple[str, tuple[tuple[str, str], ...]], float] = {}
+
+
+def _key(name: str, labels: dict[str, object]) -> tuple[str, tuple[tuple[str, str], ...]]:
+    return name, tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def inc_counter(name: str, value: float = 1.0, **labels) -> None:
+    key = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0.0) + float(value)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    key = _key(name, labels)
+    with _LOCK:
+        _GAUGES[key] = float(value)
+
+
+def add_gauge(name: str, delta: float, **labels) -> float:
+    key = _key(name, labels)
+    with _LOCK:
+        value = _GAUGES.get(key, 0.0) + float(delta)
+        _GAUGES[key] = value
+    return value
+
+
+def get_value(name: str, **labels) -> float:
+    key = _key(name, labels)
+    with _LOCK:
+        if key in _COUNTERS:
+            return _COUNTERS[key]
+        return _GAUGES.get(key, 0.0)
+
+
+def reset_metrics() -> None:
+    with _LOCK:
+        _COUNTERS.clear()
+        _GAUGES.clear()
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + body + "}"
+
+
+def render_prometheus() -> str:
+    with _LOCK:
+        counters = sorted(_COUNTERS.items())
+        gauges = sorted(_GAUGES.items())
+
+    lines: list[str] = []
+    typed: set[str] = set()
+    for kind, items in (("counter", counters), ("gauge", gauges)):
+        for (name, labels), value in items:
+            if name not in typed:
+                lines.append(f"# TYPE {name} {kind}")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
@@ -1,28 +1,213 @@
 from __future__ import annotations
 
-from redis import Redis
+import asyncio
+import weakref
+
+from redis import BlockingConnectionPool, Redis
+from redis.asyncio import BlockingConnectionPool as AsyncBlockingConnectionPool
+from redis.asyncio import Redis as AsyncRedis
+from redis.asyncio.cluster import ClusterNode as AsyncClusterNode
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.asyncio.sentinel import Sentinel as AsyncSentinel
+from redis.cache import CacheConfig
+from redis.cluster import ClusterNode, RedisCluster
+from redis.sentinel import Sentinel
 
 from src.core.settings import get_settings
 
 
+REDIS_MODES = ("standalone", "cluster", "sentinel")
+
 _CLIENT: Redis | None = None
+_BINARY_CLIENT: Redis | None = None
+_CACHED_CLIENT: Redis | None = None
+# redis.asyncio connections belong to the loop that opened them, so the shared pool is per running loop.
+_ASYNC_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncRedis]" = weakref.WeakKeyDictionary()
+_ASYNC_BINARY_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncRedis]" = (
+    weakref.WeakKeyDictionary()
+)
+_ASYNC_PUBSUB_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncRedis]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def redis_mode() -> str:
+    mode = str(get_settings().redis_mode or "standalone").strip().lower()
+    if mode not in REDIS_MODES:
+        raise ValueError(f"REDIS_MODE must be one of {', '.join(REDIS_MODES)}, got {mode!r}")
+    return mode
+
+
+def redis_nodes() -> list[tuple[str, int]]:
+    """REDIS_NODES as (host, port) pairs: cluster startup nodes or sentinel addresses. Defaults to REDIS_HOST."""
+    cfg = get_settings()
+    nodes: list[tuple[str, int]] = []
+    for item in str(cfg.redis_nodes or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, sep, port = item.rpartition(":")
+        nodes.append((host, int(port)) if sep and host else (item, int(cfg.redis_port)))
+    return nodes or [(cfg.redis_host, int(cfg.redis_port))]
+
+
+def _client_kwargs(*, decode_responses: bool = True) -> dict:
+    cfg = get_settings()
+    return {
+        "host": cfg.redis_host,
+        "port": cfg.redis_port,
+        "db": cfg.redis_db,
+        "password": cfg.redis_password,
+        "username": cfg.redis_username,
+        "ssl": cfg.redis_ssl,
+        "decode_responses": decode_responses,
+        "socket_timeout": 5.0,
+        "socket_connect_timeout": 3.0,
+        "health_check_interval": 30,
+    }
+
+
+def _sentinel_kwargs() -> dict:
+    cfg = get_settings()
+    kwargs = {"socket_timeout": 3.0, "ssl": cfg.redis_ssl}
+    if cfg.redis_sentinel_password:
+        kwargs["password"] = cfg.redis_sentinel_password
+    return kwargs
+
+
+def _build_client(*, decode_responses: bool = True, **extra) -> Redis:
+    cfg = get_settings()
+    kwargs = _client_kwargs(decode_responses=decode_responses)
+    max_connections = max(1, int(cfg.redis_max_connections))
+    mode = redis_mode()
+    if mode == "cluster":
+        # Cluster nodes only have db 0; every session key carries a {conversation_id} hash tag instead.
+        for name in ("host", "port", "db"):
+            kwargs.pop(name)
+        return RedisCluster(
+            startup_nodes=[ClusterNode(host, port) for host, port in redis_nodes()],
+            max_connections=max_connections,
+            **kwargs,
+            **extra,
+        )
+    if mode == "sentinel":
+        kwargs.pop("host")
+        kwargs.pop("port")
+        sentinel = Sentinel(redis_nodes(), sentinel_kwargs=_sentinel_kwargs())
+        return sentinel.master_for(cfg.redis_sentinel_master, max_connections=max_connections, **kwargs, **extra)
+    if cfg.redis_pool_block:
+        pool = BlockingConnectionPool(
+            max_connections=max_connections,
+            timeout=float(cfg.redis_pool_timeout_s),
+            **kwargs,
+            **extra,
+        )
+        return Redis(connection_pool=pool)
+    return Redis(max_connections=max_connections, **kwargs, **extra)
+
+
+def _build_async_client(*, decode_responses: bool = True) -> AsyncRedis:
+    cfg = get_settings()
+    kwargs = _client_kwargs(decode_responses=decode_responses)
+    max_connections = max(1, int(cfg.redis_max_connections))
+    mode = redis_mode()
+    if mode == "cluster":
+        for name in ("host", "port", "db"):
+            kwargs.pop(name)
+        return AsyncRedisCluster(
+            startup_nodes=[AsyncClusterNode(host, port) for host, port in redis_nodes()],
+            max_connections=max_connections,
+            **kwargs,
+        )
+    if mode == "sentinel":
+        kwargs.pop("host")
+        kwargs.pop("port")
+        sentinel = AsyncSentinel(redis_nodes(), sentinel_kwargs=_sentinel_kwargs())
+        return sentinel.master_for(cfg.redis_sentinel_master, max_connections=max_connections, **kwargs)
+    if cfg.redis_pool_block:
+        pool = AsyncBlockingConnectionPool(
+            max_connections=max_connections,
+            timeout=float(cfg.redis_pool_timeout_s),
+            **kwargs,
+        )
+        return AsyncRedis(connection_pool=pool)
+    return AsyncRedis(max_connections=max_connections, **kwargs)
 
 
 def get_redis_client() -> Redis:
     global _CLIENT
     if _CLIENT is None:
+        _CLIENT = _build_client()
+    return _CLIENT
+
+
+def get_binary_redis_client() -> Redis:
+    """Client that returns raw bytes, for values written by the session codec."""
+    global _BINARY_CLIENT
+    if _BINARY_CLIENT is None:
+        _BINARY_CLIENT = _build_client(decode_responses=False)
+    return _BINARY_CLIENT
+
+
+def get_cached_redis_client() -> Redis:
+    """Binary RESP3 client with a local read cache.
+
+    The server tracks the keys each connection has read (CLIENT TRACKING) and pushes an invalidation when any
+    client, in any worker, writes them, so cached replies never outlive a write seen by Redis.
+    """
+    global _CACHED_CLIENT
+    if _CACHED_CLIENT is None:
         cfg = get_settings()
-        _CLIENT = Redis(
-            host=cfg.redis_host,
-            port=cfg.redis_port,
-            db=cfg.redis_db,
-            password=cfg.redis_password,
-            username=cfg.redis_username,
-            ssl=cfg.redis_ssl,
-            decode_responses=True,
-            socket_timeout=5.0,
-            socket_connect_timeout=3.0,
-            health_check_interval=30,
+        _CACHED_CLIENT = _build_client(
+            decode_responses=False,
+            protocol=3,
+            cache_config=CacheConfig(max_size=max(1, int(cfg.session_near_cache_size))),
         )
-    return _CLIENT
+    return _CACHED_CLIENT
+
+
+def get_async_redis_client() -> AsyncRedis:
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        client = _build_async_client()
+        _ASYNC_CLIENTS[loop] = client
+    return client
+
+
+def get_async_binary_redis_client() -> AsyncRedis:
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_BINARY_CLIENTS.get(loop)
+    if client is None:
+        client = _build_async_client(decode_responses=False)
+        _ASYNC_BINARY_CLIENTS[loop] = client
+    return client
+
+
+def get_async_pubsub_client() -> AsyncRedis:
+    """Text client for (P)SUBSCRIBE.
+
+    The async cluster client has no pub/sub, but cluster PUBLISH reaches every node, so one node is enough.
+    """
+    if redis_mode() != "cluster":
+        return get_async_redis_client()
+    loop = asyncio.get_running_loop()
+    client = _ASYNC_PUBSUB_CLIENTS.get(loop)
+    if client is None:
+        host, port = redis_nodes()[0]
+        kwargs = _client_kwargs()
+        kwargs.update(host=host, port=port, db=0)
+        client = AsyncRedis(**kwargs)
+        _ASYNC_PUBSUB_CLIENTS[loop] = client
+    return client
+
 
+async def aclose_redis_client() -> None:
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    for clients in (_ASYNC_CLIENTS, _ASYNC_BINARY_CLIENTS, _ASYNC_PUBSUB_CLIENTS):
+        client = clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
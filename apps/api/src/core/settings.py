@@ -20,6 +20,32 @@ class Settings(BaseModel):
     zhipu_temperature: float = 0.2
     zhipu_timeout_s: float = 30.0
     zhipu_embed_model: str = "embedding-3"
+    http2_enabled: bool = True
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry_s: float = 30.0
+    http_connect_timeout_s: float = 5.0
+    llm_limiter_backend: str = "redis"
+    llm_max_concurrency: int = 8
+    llm_rate_per_s: float = 5.0
+    llm_rate_burst: int = 10
+    llm_queue_timeout_ms: int = 10000
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_s: float = 30.0
+    llm_breaker_half_open_probes: int = 1
+    llm_hedge_enabled: bool = False
+    llm_hedge_min_delay_ms: int = 1500
+    llm_hedge_min_samples: int = 20
+    llm_cache_modes: str = ""
+    llm_semantic_cache_modes: str = ""
+    llm_cache_ttl_s: int = 3600
+    llm_semantic_cache_threshold: float = 0.95
+    llm_semantic_cache_max_entries: int = 500
+    history_max_tokens: int = 3000
+    history_keep_turns: int = 4
+    history_summary_max_tokens: int = 400
+    history_summary_llm: bool = False
+    chat_history_max_messages: int = 200
     max_upload_mb: int = 10
     max_citations: int = 3
     filesystem_sync_enabled: bool = True
@@ -30,8 +56,42 @@ class Settings(BaseModel):
     redis_password: str | None = None
     redis_username: str | None = None
     redis_ssl: bool = False
+    redis_mode: str = "standalone"
+    redis_nodes: str = ""
+    redis_sentinel_master: str = "mymaster"
+    redis_sentinel_password: str | None = None
+    redis_max_connections: int = 50
+    redis_pool_block: bool = False
+    redis_pool_timeout_s: float = 5.0
+    redis_async: bool = True
     redis_lock_ttl_ms: int = 15000
     redis_lock_wait_ms: int = 3000
+    redis_hexpire: str = "auto"
+    session_ttl_s: int = 604800
+    request_cache_ttl_s: int = 86400
+    request_cache_max: int = 50
+    session_codec: str = "auto"
+    session_near_cache: bool = False
+    session_near_cache_size: int = 2000
+    request_coalescing: str = "redis"
+    request_flight_ttl_s: int = 120
+    request_flight_grace_s: int = 30
+    request_resume_grace_s: float = 15.0
+    graph_async: bool = True
+    graph_checkpointer: str = "redis"
+    chunk_cache_size: int = 2000
+    chunk_cache_ttl_s: int = 300
+    chroma_space: str = "cosine"
+    chroma_hnsw_m: int = 16
+    chroma_hnsw_ef_construction: int = 100
+    chroma_hnsw_ef_search: int = 100
+    chroma_partitioning: str = "source_type"
+    vector_store: str = "chroma"
+    numpy_store_dir: Path = REPO_ROOT / "data" / "vectors"
+    embedding_quantization: str = "none"
+    vector_rescore_factor: int = 4
+    zhipu_embed_dim: int = 0
+    dummy_embeddings: str = "random"
 
 def get_settings() -> Settings:
     import os
@@ -46,6 +106,14 @@ def get_settings() -> Settings:
         chroma_dir = REPO_ROOT / "data" / "chroma"
 
     chroma_dir.mkdir(parents=True, exist_ok=True)
+
+    numpy_store_dir_raw = os.getenv("NUMPY_STORE_DIR", "")
+    if numpy_store_dir_raw:
+        p = Path(numpy_store_dir_raw)
+        numpy_store_dir = p if p.is_absolute() else (REPO_ROOT / p)
+    else:
+        numpy_store_dir = REPO_ROOT / "data" / "vectors"
+
     return Settings(
         web_origin=web_origin,
         chroma_dir=chroma_dir,
@@ -55,6 +123,32 @@ def get_settings() -> Settings:
         zhipu_temperature=float(os.getenv("ZHIPUAI_TEMPERATURE", "0.2")),
         zhipu_timeout_s=float(os.getenv("ZHIPUAI_TIMEOUT_S", "30")),
         zhipu_embed_model=os.getenv("ZHIPUAI_EMBED_MODEL", "embedding-3"),
+        http2_enabled=os.getenv("HTTP2_ENABLED", "true").lower() in {"1", "true", "yes", "on"},
+        http_max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        http_max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        http_keepalive_expiry_s=float(os.getenv("HTTP_KEEPALIVE_EXPIRY_S", "30")),
+        http_connect_timeout_s=float(os.getenv("HTTP_CONNECT_TIMEOUT_S", "5")),
+        llm_limiter_backend=os.getenv("LLM_LIMITER_BACKEND", "redis"),
+        llm_max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+        llm_rate_per_s=float(os.getenv("LLM_RATE_PER_S", "5")),
+        llm_rate_burst=int(os.getenv("LLM_RATE_BURST", "10")),
+        llm_queue_timeout_ms=int(os.getenv("LLM_QUEUE_TIMEOUT_MS", "10000")),
+        llm_breaker_failure_threshold=int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5")),
+        llm_breaker_reset_s=float(os.getenv("LLM_BREAKER_RESET_S", "30")),
+        llm_breaker_half_open_probes=int(os.getenv("LLM_BREAKER_HALF_OPEN_PROBES", "1")),
+        llm_hedge_enabled=os.getenv("LLM_HEDGE_ENABLED", "false").lower() in {"1", "true", "yes", "on"},
+        llm_hedge_min_delay_ms=int(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "1500")),
+        llm_hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+        llm_cache_modes=os.getenv("LLM_CACHE_MODES", ""),
+        llm_semantic_cache_modes=os.getenv("LLM_SEMANTIC_CACHE_MODES", ""),
+        llm_cache_ttl_s=int(os.getenv("LLM_CACHE_TTL_S", "3600")),
+        llm_semantic_cache_threshold=float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        llm_semantic_cache_max_entries=int(os.getenv("LLM_SEMANTIC_CACHE_MAX_ENTRIES", "500")),
+        history_max_tokens=int(os.getenv("HISTORY_MAX_TOKENS", "3000")),
+        history_keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "4")),
+        history_summary_max_tokens=int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "400")),
+        history_summary_llm=os.getenv("HISTORY_SUMMARY_LLM", "false").lower() in {"1", "true", "yes", "on"},
+        chat_history_max_messages=int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "200")),
         max_upload_mb=int(os.getenv("MAX_UPLOAD_MB", "10")),
         max_citations=int(os.getenv("MAX_CITATIONS", "3")),
         filesystem_sync_enabled=os.getenv("FILESYSTEM_SYNC_ENABLED", "true").lower() in {"1", "true", "yes", "on"},
@@ -65,6 +159,40 @@ def get_settings() -> Settings:
         redis_password=os.getenv("REDIS_PASSWORD"),
         redis_username=os.getenv("REDIS_USERNAME"),
         redis_ssl=os.getenv("REDIS_SSL", "false").lower() in {"1", "true", "yes", "on"},
+        redis_mode=os.getenv("REDIS_MODE", "standalone").strip().lower(),
+        redis_nodes=os.getenv("REDIS_NODES", ""),
+        redis_sentinel_master=os.getenv("REDIS_SENTINEL_MASTER", "mymaster"),
+        redis_sentinel_password=os.getenv("REDIS_SENTINEL_PASSWORD") or None,
+        redis_max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+        redis_pool_block=os.getenv("REDIS_POOL_BLOCK", "false").lower() in {"1", "true", "yes", "on"},
+        redis_pool_timeout_s=float(os.getenv("REDIS_POOL_TIMEOUT_S", "5")),
+        redis_async=os.getenv("REDIS_ASYNC", "true").lower() in {"1", "true", "yes", "on"},
         redis_lock_ttl_ms=int(os.getenv("REDIS_LOCK_TTL_MS", "15000")),
         redis_lock_wait_ms=int(os.getenv("REDIS_LOCK_WAIT_MS", "3000")),
+        redis_hexpire=os.getenv("REDIS_HEXPIRE", "auto"),
+        session_ttl_s=int(os.getenv("SESSION_TTL_S", "604800")),
+        request_cache_ttl_s=int(os.getenv("REQUEST_CACHE_TTL_S", "86400")),
+        request_cache_max=int(os.getenv("REQUEST_CACHE_MAX", "50")),
+        session_codec=os.getenv("SESSION_CODEC", "auto").strip().lower(),
+        session_near_cache=os.getenv("SESSION_NEAR_CACHE", "false").lower() in {"1", "true", "yes", "on"},
+        session_near_cache_size=int(os.getenv("SESSION_NEAR_CACHE_SIZE", "2000")),
+        request_coalescing=os.getenv("REQUEST_COALESCING", "redis").strip().lower(),
+        request_flight_ttl_s=int(os.getenv("REQUEST_FLIGHT_TTL_S", "120")),
+        request_flight_grace_s=int(os.getenv("REQUEST_FLIGHT_GRACE_S", "30")),
+        request_resume_grace_s=float(os.getenv("REQUEST_RESUME_GRACE_S", "15")),
+        graph_async=os.getenv("GRAPH_ASYNC", "true").lower() in {"1", "true", "yes", "on"},
+        graph_checkpointer=os.getenv("GRAPH_CHECKPOINTER", "redis"),
+        chunk_cache_size=int(os.getenv("CHUNK_CACHE_SIZE", "2000")),
+        chunk_cache_ttl_s=int(os.getenv("CHUNK_CACHE_TTL_S", "300")),
+        chroma_space=os.getenv("CHROMA_SPACE", "cosine").strip().lower(),
+        chroma_hnsw_m=int(os.getenv("CHROMA_HNSW_M", "16")),
+        chroma_hnsw_ef_construction=int(os.getenv("CHROMA_HNSW_EF_CONSTRUCTION", "100")),
+        chroma_hnsw_ef_search=int(os.getenv("CHROMA_HNSW_EF_SEARCH", "100")),
+        chroma_partitioning=os.getenv("CHROMA_PARTITIONING", "source_type").strip().lower(),
+        vector_store=os.getenv("VECTOR_STORE", "chroma").strip().lower(),
+        numpy_store_dir=numpy_store_dir,
+        embedding_quantization=os.getenv("EMBEDDING_QUANTIZATION", "none").strip().lower(),
+        vector_rescore_factor=int(os.getenv("VECTOR_RESCORE_FACTOR", "4")),
+        zhipu_embed_dim=int(os.getenv("ZHIPUAI_EMBED_DIM", "").strip() or 0),
+        dummy_embeddings=os.getenv("DUMMY_EMBEDDINGS", "random").strip().lower(),
     )
@@ -1,32 +1,54 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
 import re
 import uuid
 from typing import Annotated, TypedDict
 
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
-
-from src.llm.zhipu import chat
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+
+from src.core.metrics import inc_counter
+from src.core.settings import get_settings
+from src.graph.redis_session_store import (
+    aget_conversation_history,
+    get_conversation_history,
+    get_history_summary,
+    set_history_summary,
+)
+from src.llm.errors import LLMUnavailableError
+from src.llm.response_cache import llm_cache_mode
+from src.llm.token_budget import compact_history, count_message_tokens, count_tokens, is_summary_message
+from src.llm.zhipu import achat, chat
 from src.skills.interview_qa import run_interview_turn
 from src.skills.resume_note_interview import run_resume_note_interview_turn
 
 try:
     from langgraph.graph import END, START, StateGraph
-    from langgraph.graph.message import add_messages
+    from langgraph.graph.message import REMOVE_ALL_MESSAGES, add_messages
     from langgraph.prebuilt import ToolNode
 
+    from src.graph.redis_checkpointer import RedisCheckpointSaver
+
     _LANGGRAPH_AVAILABLE = True
 except Exception:
     END = "__end__"
     START = "__start__"
+    REMOVE_ALL_MESSAGES = "__remove_all__"
 
     def add_messages(x):  # type: ignore
         return x
 
     ToolNode = None  # type: ignore
+    RedisCheckpointSaver = None  # type: ignore
     _LANGGRAPH_AVAILABLE = False
 
+logger = logging.getLogger(__name__)
+
+# Stateless callers may still embed the session in a system message; checkpointed turns carry it in the
+# graph's session channel and never see the marker.
 SESSION_MARKER = "__SESSION__:"
 DEFAULT_SESSION = {
     "mode": "chat",
@@ -43,6 +65,7 @@ class AgentState(TypedDict, total=False):
 
 
 _TOOLS = [run_interview_turn, run_resume_note_interview_turn]
+_TOOLS_BY_NAME = {tool.name: tool for tool in _TOOLS}
 _TOOL_NODE = ToolNode(_TOOLS) if _LANGGRAPH_AVAILABLE else None
 
 
@@ -81,6 +104,13 @@ def _parse_tool_payload(content: str) -> dict | None:
     return data
 
 
+def _tool_payload(content, artifact=None) -> dict | None:
+    """Structured tool output: the artifact as-is, or the JSON payload of tools that still return strings."""
+    if isinstance(artifact, dict) and "answer" in artifact:
+        return artifact
+    return _parse_tool_payload(_ensure_str(content))
+
+
 def _history_to_lc_messages(history: list | None) -> list[BaseMessage]:
     messages: list[BaseMessage] = []
     for item in history or []:
@@ -128,6 +158,8 @@ def _history_for_tool(messages: list[BaseMessage]) -> list[dict]:
             history.append({"role": "user", "content": _ensure_str(msg.content)})
         elif isinstance(msg, AIMessage) and not msg.tool_calls:
             history.append({"role": "assistant", "content": _ensure_str(msg.content)})
+        elif isinstance(msg, SystemMessage) and is_summary_message(_ensure_str(msg.content)):
+            history.append({"role": "system", "content": _ensure_str(msg.content)})
     return history
 
 
@@ -158,6 +190,71 @@ def _extract_session_from_history(history: list | None) -> tuple[list, dict]:
     return cleaned, session
 
 
+def _summarize_history(previous: str, items: list) -> str:
+    transcript = "\n".join(
+        f"{_ensure_str(item.get('role') or 'user')}: {_ensure_str(item.get('content'))}"
+        for item in items
+        if isinstance(item, dict)
+    )
+    return chat(
+        [
+            {
+                "role": "system",
+                "content": (
+                    "Summarize the earlier part of a job-coaching conversation for the assistant's own memory. "
+                    "Keep questions asked, the candidate's key answers, scores and open weak points. "
+                    "Plain bullet points, same language as the conversation, no preamble."
+                ),
+            },
+            {"role": "user", "content": f"Existing summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"},
+        ]
+    )
+
+
+def _history_budget(question: str) -> int:
+    return max(256, int(get_settings().history_max_tokens) - count_tokens(question))
+
+
+def _compact_history(history: list, question: str, session: dict) -> list:
+    """Trim client history to the prompt token budget; the rolling summary is cached per conversation."""
+    cfg = get_settings()
+    budget = _history_budget(question)
+    if count_message_tokens(history) <= budget:
+        return history
+
+    cid = _ensure_str(session.get("conversation_id")).strip()
+    previous = None
+    if cid:
+        try:
+            previous = get_history_summary(cid)
+        except RuntimeError as exc:
+            logger.warning("history summary cache unavailable: %s", exc)
+
+    result = compact_history(
+        history,
+        max_tokens=budget,
+        keep_last_turns=max(1, int(cfg.history_keep_turns)),
+        summary_max_tokens=max(32, int(cfg.history_summary_max_tokens)),
+        previous_summary=previous,
+        summarize=_summarize_history if cfg.history_summary_llm else None,
+    )
+    inc_counter("history_compactions_total")
+    inc_counter("history_tokens_saved_total", max(0, result.tokens_before - result.tokens_after))
+    if cid and result.summary_state and result.summary_state != previous:
+        try:
+            set_history_summary(cid, result.summary_state)
+        except RuntimeError as exc:
+            logger.warning("history summary cache write failed: %s", exc)
+    return result.messages
+
+
+async def _acompact_history(history: list, question: str, session: dict) -> list:
+    if count_message_tokens(history) <= _history_budget(question):
+        return history
+    # Compaction goes through the sync summary store and LLM client; it only runs on long conversations.
+    return await asyncio.to_thread(_compact_history, history, question, session)
+
+
 def _build_router_prompt(session: dict) -> str:
     return (
         "You are a senior AI job coach. Decide user intent intelligently.\n"
@@ -224,12 +321,9 @@ def _infer_tool(decision: dict, session: dict, messages: list[BaseMessage]) -> t
     return None
 
 
-def agent_node(state: AgentState) -> AgentState:
-    messages = state.get("messages", [])
-    session = state.get("session") or dict(DEFAULT_SESSION)
-
+def _routed_without_llm(messages: list[BaseMessage], session: dict) -> AgentState | None:
     if messages and isinstance(messages[-1], ToolMessage):
-        payload = _parse_tool_payload(_ensure_str(messages[-1].content))
+        payload = _tool_payload(messages[-1].content, messages[-1].artifact)
         if payload:
             return {"messages": [AIMessage(content=_ensure_str(payload.get("answer", "")))]}
         return {"messages": [AIMessage(content=_ensure_str(messages[-1].content))]}
@@ -261,10 +355,14 @@ def agent_node(state: AgentState) -> AgentState:
                 )
             ]
         }
+    return None
+
 
-    router_prompt = _build_router_prompt(session)
-    prompt_messages: list[BaseMessage] = [SystemMessage(content=router_prompt), *messages]
-    raw = chat(_to_openai_messages(prompt_messages))
+def _router_messages(session: dict, messages: list[BaseMessage]) -> list[dict]:
+    return _to_openai_messages([SystemMessage(content=_build_router_prompt(session)), *messages])
+
+
+def _routed_by_llm(raw: str, messages: list[BaseMessage], session: dict) -> AgentState:
     decision = _extract_json(raw) or {}
     tool_plan = _infer_tool(decision, session, messages)
 
@@ -290,6 +388,24 @@ def agent_node(state: AgentState) -> AgentState:
     return {"messages": [AIMessage(content=answer)]}
 
 
+def agent_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    session = state.get("session") or dict(DEFAULT_SESSION)
+    routed = _routed_without_llm(messages, session)
+    if routed is not None:
+        return routed
+    return _routed_by_llm(chat(_router_messages(session, messages)), messages, session)
+
+
+async def aagent_node(state: AgentState) -> AgentState:
+    messages = state.get("messages", [])
+    session = state.get("session") or dict(DEFAULT_SESSION)
+    routed = _routed_without_llm(messages, session)
+    if routed is not None:
+        return routed
+    return _routed_by_llm(await achat(_router_messages(session, messages)), messages, session)
+
+
 def _route_next(state: AgentState) -> str:
     messages = state.get("messages", [])
     if not messages:
@@ -300,112 +416,316 @@ def _route_next(state: AgentState) -> str:
     return END
 
 
-def _build_graph():
+def _build_graph(checkpointer=None):
     if not _LANGGRAPH_AVAILABLE or _TOOL_NODE is None:
         return None
     graph = StateGraph(AgentState)
-    graph.add_node("agent", agent_node)
+    # invoke() runs agent_node, ainvoke() awaits aagent_node; ToolNode likewise picks each tool's func or coroutine.
+    graph.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
     graph.add_node("tools", _TOOL_NODE)
     graph.add_edge(START, "agent")
     graph.add_conditional_edges("agent", _route_next, {"tools": "tools", END: END})
     graph.add_edge("tools", "agent")
-    return graph.compile()
+    return graph.compile(checkpointer=checkpointer)
 
 
 _GRAPH = _build_graph()
+# The same graph resuming each tracked conversation from its latest Redis checkpoint.
+_CHECKPOINTED_GRAPH = _build_graph(RedisCheckpointSaver()) if _LANGGRAPH_AVAILABLE else None
+
+
+def graph_checkpointing() -> bool:
+    """GRAPH_CHECKPOINTER=redis (default) or off."""
+    mode = str(get_settings().graph_checkpointer or "redis").strip().lower()
+    return mode == "redis" and _CHECKPOINTED_GRAPH is not None
+
+
+def _thread_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def _invoke_options(config: dict | None) -> dict:
+    if config is None:
+        return {}
+    # durability="exit": the checkpoint is written once when the turn ends, not after every step.
+    return {"config": config, "durability": "exit"}
+
+
+def _is_tool_plumbing(msg: BaseMessage) -> bool:
+    return isinstance(msg, ToolMessage) or (isinstance(msg, AIMessage) and bool(msg.tool_calls))
+
+
+def _turn_messages(
+    question: str,
+    history: list,
+    stored: list[BaseMessage] | None,
+    checkpointed: bool,
+) -> tuple[list[BaseMessage], list[BaseMessage]]:
+    """(messages to send into the graph, the turn's conversation ending with the new question).
+
+    stored is the resumed checkpoint's messages, or None when the turn starts from history instead.
+    """
+    question_msg = HumanMessage(content=_ensure_str(question))
+    if stored:
+        # Only the new question goes in. The previous turn's tool calls and JSON payloads are dropped from the
+        # checkpoint so they neither reach the router prompt nor pile up in the stored state.
+        kept = [msg for msg in stored if not _is_tool_plumbing(msg)]
+        stale = [RemoveMessage(id=msg.id) for msg in stored if msg.id and _is_tool_plumbing(msg)]
+        return [*stale, question_msg], [*kept, question_msg]
+    input_messages = [*_history_to_lc_messages(history), question_msg]
+    if checkpointed:
+        # Client-sent or compacted history replaces whatever the thread held.
+        return [RemoveMessage(id=REMOVE_ALL_MESSAGES), *input_messages], input_messages
+    return input_messages, input_messages
+
+
+def _resolve_session(history: list | None, session: dict | None) -> tuple[list, dict]:
+    clean_history, parsed_session = _extract_session_from_history(history)
+    if isinstance(session, dict):
+        parsed_session.update({key: session[key] for key in DEFAULT_SESSION if key in session})
+    return clean_history, parsed_session
+
+
+def run_graph(
+    question: str,
+    history: list | None = None,
+    session: dict | None = None,
+    *,
+    thread_id: str | None = None,
+) -> dict:
+    """thread_id resumes that conversation's checkpoint when history is empty, and reseeds it otherwise."""
+    clean_history, session = _resolve_session(history, session)
+    with llm_cache_mode(_ensure_str(session.get("mode")) or "chat"):
+        return _run_graph(question, clean_history, session, thread_id)
+
+
+async def arun_graph(
+    question: str,
+    history: list | None = None,
+    session: dict | None = None,
+    *,
+    thread_id: str | None = None,
+) -> dict:
+    """run_graph on the event loop: LLM and embedding calls are awaited, so a turn holds no thread while it waits."""
+    clean_history, session = _resolve_session(history, session)
+    with llm_cache_mode(_ensure_str(session.get("mode")) or "chat"):
+        return await _arun_graph(question, clean_history, session, thread_id)
+
+
+def _planned_tool_kwargs(name: str, args: dict) -> dict:
+    if name == "run_resume_note_interview_turn":
+        return {
+            "user_input": _ensure_str(args.get("user_input", "")),
+            "history": args.get("history") or [],
+            "source_id": _ensure_str(args.get("source_id", "")),
+            "top_k": int(args.get("top_k", 12)),
+            "session": args.get("session") if isinstance(args.get("session"), dict) else {},
+        }
+    return {
+        "user_input": _ensure_str(args.get("user_input", "")),
+        "history": args.get("history") or [],
+        "topic": args.get("topic"),
+    }
+
+
+def _fallback_tool_call(
+    exc: Exception,
+    question: str,
+    session: dict,
+    input_messages: list[BaseMessage],
+) -> tuple[str, dict]:
+    """The tool to retry directly when the graph itself failed."""
+    latest = _ensure_str(question)
+    prior = _history_for_tool(input_messages)
+    if session.get("active_source_type") == "resume" and session.get("active_source_id"):
+        return "run_resume_note_interview_turn", {
+            "user_input": latest,
+            "history": prior,
+            "source_id": _ensure_str(session.get("active_source_id")),
+            "top_k": 12,
+            "session": session.get("resume_interview_state") if isinstance(session.get("resume_interview_state"), dict) else {},
+        }
+    if isinstance(exc, LLMUnavailableError):
+        # Calling the LLM again from the fallback would only feed the overload.
+        raise exc
+    return "run_interview_turn", {"user_input": latest, "history": prior, "topic": "technical interview"}
+
+
+def _tool_turn_result(name: str, tool_answer) -> dict:
+    artifact = None
+    if isinstance(tool_answer, tuple) and len(tool_answer) == 2:
+        # content_and_artifact tools called directly return the pair ToolNode would split into a ToolMessage.
+        tool_answer, artifact = tool_answer
+    parsed_tool = _tool_payload(tool_answer, artifact)
+    return {
+        "answer": _ensure_str(parsed_tool.get("answer", tool_answer)) if parsed_tool else _ensure_str(tool_answer),
+        "tool_results": [{"name": name, "result": _ensure_str(tool_answer)}],
+        "citations": parsed_tool.get("citations", []) if parsed_tool else [],
+        "used_context": parsed_tool.get("used_context", []) if parsed_tool else [],
+        "session": parsed_tool.get("session", {}) if parsed_tool else {},
+    }
 
 
-def run_graph(question: str, history: list | None = None) -> dict:
-    clean_history, session = _extract_session_from_history(history)
-    input_messages: list[BaseMessage] = [
-        *_history_to_lc_messages(clean_history),
-        HumanMessage(content=_ensure_str(question)),
-    ]
+def _direct_result(decision: dict, raw: str) -> dict:
+    return {
+        "answer": _ensure_str(decision.get("answer") or raw),
+        "tool_results": [],
+        "citations": [],
+        "used_context": [],
+        "session": {},
+    }
+
 
-    if _GRAPH is None:
-        router_prompt = _build_router_prompt(session)
-        raw = chat(_to_openai_messages([SystemMessage(content=router_prompt), *input_messages]))
+def _failed_result(exc: Exception, inner_exc: Exception) -> dict:
+    return {
+        "answer": f"Agent execution failed: {inner_exc}",
+        "tool_results": [{"name": "error", "result": str(exc)}],
+        "citations": [],
+        "used_context": [],
+        "session": {},
+    }
+
+
+def _transcript(thread_id: str) -> list:
+    try:
+        return get_conversation_history(thread_id)
+    except RuntimeError as exc:
+        logger.warning("server-side history unavailable for %s: %s", thread_id, exc)
+        return []
+
+
+async def _atranscript(thread_id: str) -> list:
+    try:
+        return await aget_conversation_history(thread_id)
+    except RuntimeError as exc:
+        logger.warning("server-side history unavailable for %s: %s", thread_id, exc)
+        return []
+
+
+def _seeded_messages(conversation: list[BaseMessage], answer: str) -> dict:
+    return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *conversation, AIMessage(content=_ensure_str(answer))]}
+
+
+def _seed_checkpoint(config: dict, conversation: list[BaseMessage], answer: str) -> None:
+    """Record a fallback turn in the checkpoint, as the transcript does, so the next turn does not resume the state
+    from before it."""
+    try:
+        _CHECKPOINTED_GRAPH.update_state(config, _seeded_messages(conversation, answer), as_node="agent")
+    except Exception as exc:
+        logger.warning("checkpoint seed failed for %s: %s", config["configurable"]["thread_id"], exc)
+
+
+async def _aseed_checkpoint(config: dict, conversation: list[BaseMessage], answer: str) -> None:
+    try:
+        await _CHECKPOINTED_GRAPH.aupdate_state(config, _seeded_messages(conversation, answer), as_node="agent")
+    except Exception as exc:
+        logger.warning("checkpoint seed failed for %s: %s", config["configurable"]["thread_id"], exc)
+
+
+def _run_graph(question: str, clean_history: list, session: dict, thread_id: str | None = None) -> dict:
+    graph, config, stored = _GRAPH, None, []
+    if thread_id and graph_checkpointing():
+        config = _thread_config(thread_id)
+        try:
+            if not clean_history:
+                stored = _CHECKPOINTED_GRAPH.get_state(config).values.get("messages") or []
+                if not stored:
+                    # No checkpoint yet (new, expired or pre-checkpoint conversation): seed from the transcript.
+                    clean_history = get_conversation_history(thread_id)
+            graph = _CHECKPOINTED_GRAPH
+        except RuntimeError as exc:
+            logger.warning("graph checkpoint unavailable for %s: %s", thread_id, exc)
+            config, stored = None, []
+            if not clean_history:
+                # The caller skipped the transcript because the checkpoint was meant to carry the conversation.
+                clean_history = _transcript(thread_id)
+
+    history = _history_for_tool(stored) if stored else clean_history
+    compacted = _compact_history(history, question, session)
+    # _compact_history hands back the same list when nothing had to be trimmed.
+    graph_messages, input_messages = _turn_messages(
+        question,
+        compacted,
+        stored if compacted is history else None,
+        config is not None,
+    )
+
+    if graph is None:
+        raw = chat(_router_messages(session, input_messages))
         decision = _extract_json(raw) or {}
         tool_plan = _infer_tool(decision, session, input_messages)
-        if tool_plan:
-            name, args = tool_plan
-            if name == "run_resume_note_interview_turn":
-                tool_answer = run_resume_note_interview_turn.func(
-                    user_input=_ensure_str(args.get("user_input", "")),
-                    history=args.get("history") or [],
-                    source_id=_ensure_str(args.get("source_id", "")),
-                    top_k=int(args.get("top_k", 12)),
-                    session=args.get("session") if isinstance(args.get("session"), dict) else {},
-                )
-            else:
-                tool_answer = run_interview_turn.func(
-                    user_input=_ensure_str(args.get("user_input", "")),
-                    history=args.get("history") or [],
-                    topic=args.get("topic"),
-                )
-            parsed_tool = _parse_tool_payload(_ensure_str(tool_answer))
-            return {
-                "answer": _ensure_str(parsed_tool.get("answer", tool_answer)) if parsed_tool else _ensure_str(tool_answer),
-                "tool_results": [{"name": name, "result": _ensure_str(tool_answer)}],
-                "citations": parsed_tool.get("citations", []) if parsed_tool else [],
-                "used_context": parsed_tool.get("used_context", []) if parsed_tool else [],
-                "session": parsed_tool.get("session", {}) if parsed_tool else {},
-            }
-        return {
-            "answer": _ensure_str(decision.get("answer") or raw),
-            "tool_results": [],
-            "citations": [],
-            "used_context": [],
-            "session": {},
-        }
+        if not tool_plan:
+            return _direct_result(decision, raw)
+        name, args = tool_plan
+        return _tool_turn_result(name, _TOOLS_BY_NAME[name].func(**_planned_tool_kwargs(name, args)))
 
     try:
-        result = _GRAPH.invoke({"messages": input_messages, "session": session})
+        result = graph.invoke({"messages": graph_messages, "session": session}, **_invoke_options(config))
         messages = result.get("messages", [])
     except Exception as exc:
         # Safety fallback: keep the chat alive even if graph/tool execution fails.
-        latest = _ensure_str(question)
-        prior = _history_for_tool(input_messages)
         try:
-            if session.get("active_source_type") == "resume" and session.get("active_source_id"):
-                tool_answer = run_resume_note_interview_turn.func(
-                    user_input=latest,
-                    history=prior,
-                    source_id=_ensure_str(session.get("active_source_id")),
-                    top_k=12,
-                    session=session.get("resume_interview_state") if isinstance(session.get("resume_interview_state"), dict) else {},
-                )
-                parsed_tool = _parse_tool_payload(_ensure_str(tool_answer))
-                return {
-                    "answer": _ensure_str(parsed_tool.get("answer", tool_answer)) if parsed_tool else _ensure_str(tool_answer),
-                    "tool_results": [
-                        {"name": "run_resume_note_interview_turn", "result": _ensure_str(tool_answer)}
-                    ],
-                    "citations": parsed_tool.get("citations", []) if parsed_tool else [],
-                    "used_context": parsed_tool.get("used_context", []) if parsed_tool else [],
-                    "session": parsed_tool.get("session", {}) if parsed_tool else {},
-                }
-            tool_answer = run_interview_turn.func(
-                user_input=latest,
-                history=prior,
-                topic="technical interview",
-            )
-            return {
-                "answer": _ensure_str(tool_answer),
-                "tool_results": [{"name": "run_interview_turn", "result": _ensure_str(tool_answer)}],
-                "citations": [],
-                "used_context": [],
-                "session": {},
-            }
+            name, kwargs = _fallback_tool_call(exc, question, session, input_messages)
+            result = _tool_turn_result(name, _TOOLS_BY_NAME[name].func(**kwargs))
+        except Exception as inner_exc:
+            result = _failed_result(exc, inner_exc)
+        if config is not None:
+            _seed_checkpoint(config, input_messages, result["answer"])
+        return result
+    return _graph_result(messages)
+
+
+async def _arun_graph(question: str, clean_history: list, session: dict, thread_id: str | None = None) -> dict:
+    graph, config, stored = _GRAPH, None, []
+    if thread_id and graph_checkpointing():
+        config = _thread_config(thread_id)
+        try:
+            if not clean_history:
+                snapshot = await _CHECKPOINTED_GRAPH.aget_state(config)
+                stored = snapshot.values.get("messages") or []
+                if not stored:
+                    clean_history = await aget_conversation_history(thread_id)
+            graph = _CHECKPOINTED_GRAPH
+        except RuntimeError as exc:
+            logger.warning("graph checkpoint unavailable for %s: %s", thread_id, exc)
+            config, stored = None, []
+            if not clean_history:
+                clean_history = await _atranscript(thread_id)
+
+    history = _history_for_tool(stored) if stored else clean_history
+    compacted = await _acompact_history(history, question, session)
+    graph_messages, input_messages = _turn_messages(
+        question,
+        compacted,
+        stored if compacted is history else None,
+        config is not None,
+    )
+
+    if graph is None:
+        raw = await achat(_router_messages(session, input_messages))
+        decision = _extract_json(raw) or {}
+        tool_plan = _infer_tool(decision, session, input_messages)
+        if not tool_plan:
+            return _direct_result(decision, raw)
+        name, args = tool_plan
+        return _tool_turn_result(name, await _TOOLS_BY_NAME[name].coroutine(**_planned_tool_kwargs(name, args)))
+
+    try:
+        result = await graph.ainvoke({"messages": graph_messages, "session": session}, **_invoke_options(config))
+        messages = result.get("messages", [])
+    except Exception as exc:
+        try:
+            name, kwargs = _fallback_tool_call(exc, question, session, input_messages)
+            result = _tool_turn_result(name, await _TOOLS_BY_NAME[name].coroutine(**kwargs))
         except Exception as inner_exc:
-            return {
-                "answer": f"Agent execution failed: {inner_exc}",
-                "tool_results": [{"name": "error", "result": str(exc)}],
-                "citations": [],
-                "used_context": [],
-                "session": {},
-            }
+            result = _failed_result(exc, inner_exc)
+        if config is not None:
+            await _aseed_checkpoint(config, input_messages, result["answer"])
+        return result
+    return _graph_result(messages)
+
 
+def _graph_result(messages: list[BaseMessage]) -> dict:
     answer = ""
     for msg in reversed(messages):
         if isinstance(msg, AIMessage) and not msg.tool_calls:
@@ -418,7 +738,7 @@ def run_graph(question: str, history: list | None = None) -> dict:
     session_out: dict = {}
     for msg in messages:
         if isinstance(msg, ToolMessage):
-            parsed = _parse_tool_payload(_ensure_str(msg.content))
+            parsed = _tool_payload(msg.content, msg.artifact)
             if parsed:
                 if not citations and isinstance(parsed.get("citations"), list):
                     citations = parsed.get("citations", [])
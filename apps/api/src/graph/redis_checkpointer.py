@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from redis.exceptions import RedisError
+
+from src.core.metrics import inc_counter
+from src.core.redis_client import get_async_binary_redis_client, get_binary_redis_client
+from src.core.settings import get_settings
+from src.graph.redis_session_store import _checkpoint_key as _thread_key
+from src.graph.redis_session_store import _checkpoint_writes_key as _thread_writes_key
+from src.graph.redis_session_store import _session_ttl_s
+
+
+logger = logging.getLogger(__name__)
+
+
+def _checkpoint_key(thread_id: str, checkpoint_ns: str) -> str:
+    # Subgraph namespaces get their own key; the chat graph only ever uses the root namespace "".
+    suffix = f":{checkpoint_ns}" if checkpoint_ns else ""
+    return _thread_key(thread_id) + suffix
+
+
+def _writes_key(thread_id: str, checkpoint_ns: str) -> str:
+    suffix = f":{checkpoint_ns}" if checkpoint_ns else ""
+    return _thread_writes_key(thread_id) + suffix
+
+
+def _pack(typed: tuple[str, bytes]) -> bytes:
+    kind, data = typed
+    return kind.encode("utf-8") + b"\x00" + bytes(data)
+
+
+def _unpack(raw: bytes) -> tuple[str, bytes]:
+    kind, _, data = bytes(raw).partition(b"\x00")
+    return kind.decode("utf-8"), data
+
+
+def _text(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8")
+    return str(value)
+
+
+def _thread(config: RunnableConfig) -> tuple[str, str]:
+    configurable = config["configurable"]
+    return str(configurable["thread_id"]), str(configurable.get("checkpoint_ns", ""))
+
+
+def _sync_client_only() -> bool:
+    return not get_settings().redis_async
+
+
+class RedisCheckpointSaver(BaseCheckpointSaver[int]):
+    """LangGraph checkpointer that keeps only the latest checkpoint of each conversation in Redis.
+
+    A turn only ever resumes from the newest state, so older checkpoints are overwritten instead of kept as
+    history. The checkpoint hash and its pending-writes hash share the conversation's hash tag and expire with
+    the rest of the session (SESSION_TTL_S).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (thread_id, checkpoint_ns) whose checkpoint could neither be written nor deleted; this worker reseeds them.
+        self._stale: set[tuple[str, str]] = set()
+
+    def _tuple_from(self, thread_id: str, checkpoint_ns: str, saved: dict, writes: dict) -> CheckpointTuple:
+        checkpoint_id = _text(saved[b"id"])
+        parent_id = _text(saved.get(b"parent_id") or b"")
+        pending: list[tuple[str, str, str, int, Any]] = []
+        for field, raw in writes.items():
+            task_id, _, idx = _text(field).rpartition(":")
+            entry = self.serde.loads_typed(_unpack(raw))
+            pending.append((entry["task_path"], task_id, int(idx), entry["channel"], entry["value"]))
+        pending.sort(key=lambda item: item[:3])
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed(_unpack(saved[b"checkpoint"])),
+            metadata=self.serde.loads_typed(_unpack(saved[b"metadata"])),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_id,
+                    }
+                }
+                if parent_id
+                else None
+            ),
+            pending_writes=[(task_id, channel, value) for _, task_id, _, channel, value in pending],
+        )
+
+    def _lookup(self, config: RunnableConfig, saved: dict, writes: dict) -> CheckpointTuple | None:
+        if not saved:
+            return None
+        wanted = get_checkpoint_id(config)
+        if wanted and wanted != _text(saved[b"id"]):
+            return None
+        thread_id, checkpoint_ns = _thread(config)
+        if (thread_id, checkpoint_ns) in self._stale:
+            return None
+        return self._tuple_from(thread_id, checkpoint_ns, saved, writes)
+
+    def _checkpoint_fields(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+    ) -> dict[str, bytes]:
+        return {
+            "id": str(checkpoint["id"]).encode("utf-8"),
+            "parent_id": str(config["configurable"].get("checkpoint_id") or "").encode("utf-8"),
+            "checkpoint": _pack(self.serde.dumps_typed(checkpoint)),
+            "metadata": _pack(self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))),
+        }
+
+    def _write_fields(self, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str) -> tuple[dict, dict]:
+        """(fields that replace, fields that must not overwrite an earlier attempt's write)."""
+        replace: dict[str, bytes] = {}
+        keep_first: dict[str, bytes] = {}
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            blob = _pack(self.serde.dumps_typed({"channel": channel, "task_path": task_path, "value": value}))
+            (replace if write_idx < 0 else keep_first)[f"{task_id}:{write_idx}"] = blob
+        return replace, keep_first
+
+    @staticmethod
+    def _saved_config(config: RunnableConfig, checkpoint: Checkpoint) -> RunnableConfig:
+        thread_id, checkpoint_ns = _thread(config)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id, checkpoint_ns = _thread(config)
+        try:
+            pipe = get_binary_redis_client().pipeline()
+            pipe.hgetall(_checkpoint_key(thread_id, checkpoint_ns))
+            pipe.hgetall(_writes_key(thread_id, checkpoint_ns))
+            saved, writes = pipe.execute()
+        except RedisError as exc:
+            raise RuntimeError(f"Redis read checkpoint failed: {exc}") from exc
+        return self._lookup(config, saved, writes)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is None or (limit is not None and limit <= 0):
+            return
+        found = self.get_tuple(config)
+        if found is not None and self._listed(found, filter, before):
+            yield found
+
+    @staticmethod
+    def _listed(found: CheckpointTuple, filter: dict[str, Any] | None, before: RunnableConfig | None) -> bool:
+        before_id = get_checkpoint_id(before) if before else None
+        if before_id and found.config["configurable"]["checkpoint_id"] >= before_id:
+            return False
+        return not filter or all(found.metadata.get(key) == value for key, value in filter.items())
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id, checkpoint_ns = _thread(config)
+        key = _checkpoint_key(thread_id, checkpoint_ns)
+        ttl = _session_ttl_s()
+        try:
+            pipe = get_binary_redis_client().pipeline()
+            pipe.hset(key, mapping=self._checkpoint_fields(config, checkpoint, metadata))
+            # Pending writes belong to the checkpoint they were made against, which this one supersedes.
+            pipe.delete(_writes_key(thread_id, checkpoint_ns))
+            if ttl:
+                pipe.expire(key, ttl)
+            pipe.execute()
+        except RedisError as exc:
+            self._write_failed(thread_id, checkpoint_ns, exc)
+        else:
+            self._stale.discard((thread_id, checkpoint_ns))
+        return self._saved_config(config, checkpoint)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id, checkpoint_ns = _thread(config)
+        key = _writes_key(thread_id, checkpoint_ns)
+        replace, keep_first = self._write_fields(writes, task_id, task_path)
+        ttl = _session_ttl_s()
+        try:
+            pipe = get_binary_redis_client().pipeline()
+            if replace:
+                pipe.hset(key, mapping=replace)
+            for field, blob in keep_first.items():
+                pipe.hsetnx(key, field, blob)
+            if ttl:
+                pipe.expire(key, ttl)
+            pipe.execute()
+        except RedisError as exc:
+            self._write_failed(thread_id, checkpoint_ns, exc)
+
+    def delete_thread(self, thread_id: str) -> None:
+        try:
+            get_binary_redis_client().delete(_checkpoint_key(thread_id, ""), _writes_key(thread_id, ""))
+        except RedisError as exc:
+            raise RuntimeError(f"Redis delete checkpoint failed: {exc}") from exc
+
+    def _write_failed(self, thread_id: str, checkpoint_ns: str, exc: RedisError) -> None:
+        # The turn's answer is already computed. The checkpoint left in Redis is a turn behind the transcript, so
+        # drop it and let the next turn reseed from the transcript instead of resuming stale state.
+        logger.warning("checkpoint write failed for %s: %s", thread_id, exc)
+        inc_counter("graph_checkpoint_write_failures_total")
+        try:
+            get_binary_redis_client().delete(
+                _checkpoint_key(thread_id, checkpoint_ns), _writes_key(thread_id, checkpoint_ns)
+            )
+        except RedisError as delete_exc:
+            self._invalidation_failed(thread_id, checkpoint_ns, delete_exc)
+
+    async def _awrite_failed(self, thread_id: str, checkpoint_ns: str, exc: RedisError) -> None:
+        logger.warning("checkpoint write failed for %s: %s", thread_id, exc)
+        inc_counter("graph_checkpoint_write_failures_total")
+        try:
+            await get_async_binary_redis_client().delete(
+                _checkpoint_key(thread_id, checkpoint_ns), _writes_key(thread_id, checkpoint_ns)
+            )
+        except RedisError as delete_exc:
+            self._invalidation_failed(thread_id, checkpoint_ns, delete_exc)
+
+    def _invalidation_failed(self, thread_id: str, checkpoint_ns: str, exc: RedisError) -> None:
+        # Other workers may still resume the stale checkpoint until it expires; this one at least reseeds.
+        logger.warning("stale checkpoint for %s could not be deleted: %s", thread_id, exc)
+        self._stale.add((thread_id, checkpoint_ns))
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        if _sync_client_only():
+            return await asyncio.to_thread(self.get_tuple, config)
+        thread_id, checkpoint_ns = _thread(config)
+        try:
+            pipe = get_async_binary_redis_client().pipeline()
+            pipe.hgetall(_checkpoint_key(thread_id, checkpoint_ns))
+            pipe.hgetall(_writes_key(thread_id, checkpoint_ns))
+            saved, writes = await pipe.execute()
+        except RedisError as exc:
+            raise RuntimeError(f"Redis read checkpoint failed: {exc}") from exc
+        return self._lookup(config, saved, writes)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is None or (limit is not None and limit <= 0):
+            return
+        found = await self.aget_tuple(config)
+        if found is not None and self._listed(found, filter, before):
+            yield found
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        if _sync_client_only():
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+        thread_id, checkpoint_ns = _thread(config)
+        key = _checkpoint_key(thread_id, checkpoint_ns)
+        ttl = _session_ttl_s()
+        try:
+            pipe = get_async_binary_redis_client().pipeline()
+            pipe.hset(key, mapping=self._checkpoint_fields(config, checkpoint, metadata))
+            pipe.delete(_writes_key(thread_id, checkpoint_ns))
+            if ttl:
+                pipe.expire(key, ttl)
+            await pipe.execute()
+        except RedisError as exc:
+            await self._awrite_failed(thread_id, checkpoint_ns, exc)
+        else:
+            self._stale.discard((thread_id, checkpoint_ns))
+        return self._saved_config(config, checkpoint)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        if _sync_client_only():
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+        thread_id, checkpoint_ns = _thread(config)
+        key = _writes_key(thread_id, checkpoint_ns)
+        replace, keep_first = self._write_fields(writes, task_id, task_path)
+        ttl = _session_ttl_s()
+        try:
+            pipe = get_async_binary_redis_client().pipeline()
+            if replace:
+                pipe.hset(key, mapping=replace)
+            for field, blob in keep_first.items():
+                pipe.hsetnx(key, field, blob)
+            if ttl:
+                pipe.expire(key, ttl)
+            await pipe.execute()
+        except RedisError as exc:
+            await self._awrite_failed(thread_id, checkpoint_ns, exc)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        if _sync_client_only():
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+        try:
+            await get_async_binary_redis_client().delete(_checkpoint_key(thread_id, ""), _writes_key(thread_id, ""))
+        except RedisError as exc:
+            raise RuntimeError(f"Redis delete checkpoint failed: {exc}") from exc
@@ -1,24 +1,264 @@
-from __future__ import annotations
+﻿from __future__ import annotations
 
-import json
+import asyncio
+import itertools
+import logging
 import re
 import time
+import weakref
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 
 from redis.exceptions import RedisError
 
-from src.core.redis_client import get_redis_client
+from src.core.redis_client import (
+    get_async_binary_redis_client,
+    get_async_pubsub_client,
+    get_binary_redis_client,
+    get_cached_redis_client,
+)
 from src.core.settings import get_settings
+from src.graph.session_codec import decode_value, encode_value
 
 
+logger = logging.getLogger(__name__)
+
+_RELEASED_PATTERN = "jc:*:released"
+# Waiters also re-check on this interval, covering locks that expire by TTL or a queue head that gave up.
+_WAIT_RECHECK_S = 0.5
+
 _LOCK_RELEASE_LUA = """
 if redis.call("GET", KEYS[1]) == ARGV[1] then
-  return redis.call("DEL", KEYS[1])
+  redis.call("DEL", KEYS[1])
+  redis.call("PUBLISH", ARGV[2], ARGV[1])
+  return 1
 else
   return 0
 end
 """
 
+# One round trip at turn start. Waiters queue in a ZSET by first-attempt time and only the head may take
+# the lock, so same-conversation requests are served in arrival order. Then either return the cached
+# result for this request id (releasing the lock again) or the interview state, asked ids and transcript.
+# ARGV: owner, lock_ttl_ms, request_id, history_limit, queue_stale_ms, released_channel
+_BEGIN_TURN_LUA = """
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call("ZREMRANGEBYSCORE", KEYS[6], "-inf", now - tonumber(ARGV[5]))
+if not redis.call("ZSCORE", KEYS[6], ARGV[1]) then
+  redis.call("ZADD", KEYS[6], now, ARGV[1])
+end
+local head = redis.call("ZRANGE", KEYS[6], 0, 0)
+if head[1] ~= ARGV[1] or not redis.call("SET", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+  redis.call("PEXPIRE", KEYS[6], ARGV[5])
+  return {0}
+end
+redis.call("ZREM", KEYS[6], ARGV[1])
+local cached = redis.call("HGET", KEYS[2], ARGV[3])
+if cached then
+  redis.call("DEL", KEYS[1])
+  redis.call("PUBLISH", ARGV[6], ARGV[1])
+  return {2, cached}
+end
+local state = redis.call("HGET", KEYS[3], "resume_interview_state")
+local asked = redis.call("SMEMBERS", KEYS[4])
+local history = {}
+local limit = tonumber(ARGV[4])
+if limit > 0 then
+  history = redis.call("LRANGE", KEYS[5], -limit, -1)
+end
+return {1, state or "", asked, history}
+"""
+
+# Shared by the request-result writers. The ZSET index (score = store time in ms) caps results per
+# conversation, oldest first. On Redis 7.4+ each field also gets HEXPIRE; older servers age fields out
+# through the same index whenever a new result is stored.
+_STORE_REQUEST_LUA_FN = """
+local function store_request(req_key, idx_key, rid, result, request_ttl_s, request_max, use_hexpire)
+  local t = redis.call("TIME")
+  local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+  redis.call("HSET", req_key, rid, result)
+  redis.call("ZADD", idx_key, now, rid)
+  local dropped = {}
+  if request_ttl_s > 0 then
+    if use_hexpire == "1" then
+      redis.call("HEXPIRE", req_key, request_ttl_s, "FIELDS", 1, rid)
+    end
+    dropped = redis.call("ZRANGEBYSCORE", idx_key, "-inf", now - request_ttl_s * 1000)
+  end
+  local overflow = redis.call("ZCARD", idx_key) - #dropped - request_max
+  if overflow > 0 then
+    local oldest = redis.call("ZRANGE", idx_key, #dropped, #dropped + overflow - 1)
+    for _, member in ipairs(oldest) do
+      table.insert(dropped, member)
+    end
+  end
+  if #dropped > 0 then
+    redis.call("HDEL", req_key, unpack(dropped))
+    redis.call("ZREM", idx_key, unpack(dropped))
+  end
+end
+"""
+
+_STORE_REQUEST_LUA = _STORE_REQUEST_LUA_FN + """
+store_request(KEYS[1], KEYS[2], ARGV[1], ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4]), ARGV[5])
+local ttl = tonumber(ARGV[6])
+if ttl > 0 then
+  redis.call("EXPIRE", KEYS[1], ttl)
+  redis.call("EXPIRE", KEYS[2], ttl)
+end
+return 1
+"""
+
+# One round trip at turn end: persist state, asked ids, the request result and new transcript lines,
+# refresh the session TTL on every per-conversation key, then release the lock if this worker still owns it.
+# A client history (seed) longer than the stored transcript replaces it before the new lines are appended.
+# KEYS: state, asked, req, history, lock, req index, summary
+# ARGV: owner, state_json, updated_at, request_id, result_json, history_limit, released_channel,
+#       session_ttl_s, request_ttl_s, request_max, use_hexpire, asked_count, seed_count, asked..., seed...,
+#       history...
+_FINISH_TURN_LUA = _STORE_REQUEST_LUA_FN + """
+redis.call("HSET", KEYS[1], "resume_interview_state", ARGV[2], "updated_at", ARGV[3])
+local asked_count = tonumber(ARGV[12])
+local seed_count = tonumber(ARGV[13])
+if asked_count > 0 then
+  redis.call("SADD", KEYS[2], unpack(ARGV, 14, 13 + asked_count))
+end
+if ARGV[4] ~= "" then
+  store_request(KEYS[3], KEYS[6], ARGV[4], ARGV[5], tonumber(ARGV[9]), tonumber(ARGV[10]), ARGV[11])
+end
+local first_seed = 14 + asked_count
+local first_history = first_seed + seed_count
+if seed_count > 0 and redis.call("LLEN", KEYS[4]) < seed_count then
+  redis.call("DEL", KEYS[4])
+  redis.call("RPUSH", KEYS[4], unpack(ARGV, first_seed, first_history - 1))
+end
+if #ARGV >= first_history then
+  redis.call("RPUSH", KEYS[4], unpack(ARGV, first_history, #ARGV))
+  redis.call("LTRIM", KEYS[4], -tonumber(ARGV[6]), -1)
+end
+local ttl = tonumber(ARGV[8])
+if ttl > 0 then
+  for _, idx in ipairs({1, 2, 3, 4, 6, 7}) do
+    redis.call("EXPIRE", KEYS[idx], ttl)
+  end
+end
+if redis.call("GET", KEYS[5]) == ARGV[1] then
+  redis.call("DEL", KEYS[5])
+  redis.call("PUBLISH", ARGV[7], ARGV[1])
+  return 1
+end
+return 0
+"""
+
+# Appends a turn, first replacing a transcript the server lost (expired, or kept only since some later turn)
+# with the client's longer copy.
+# KEYS: history
+# ARGV: history_limit, session_ttl_s, seed_count, seed..., turn...
+_SEED_HISTORY_LUA = """
+local seed_count = tonumber(ARGV[3])
+local seeded = 0
+if redis.call("LLEN", KEYS[1]) < seed_count then
+  redis.call("DEL", KEYS[1])
+  redis.call("RPUSH", KEYS[1], unpack(ARGV, 4, 3 + seed_count))
+  seeded = 1
+end
+if #ARGV > 3 + seed_count then
+  redis.call("RPUSH", KEYS[1], unpack(ARGV, 4 + seed_count, #ARGV))
+end
+redis.call("LTRIM", KEYS[1], -tonumber(ARGV[1]), -1)
+local ttl = tonumber(ARGV[2])
+if ttl > 0 then
+  redis.call("EXPIRE", KEYS[1], ttl)
+end
+return seeded
+"""
+
+_SCRIPTS: dict[str, object] = {}
+_ASYNC_SCRIPTS: dict[str, object] = {}
+
+
+@dataclass(frozen=True)
+class TurnStart:
+    acquired: bool
+    cached_result: dict | None = None
+    resume_state: dict = field(default_factory=dict)
+    history: list[dict] = field(default_factory=list)
+
+
+def _script(client, source: str):
+    script = _SCRIPTS.get(source)
+    if script is None:
+        script = client.register_script(source)
+        _SCRIPTS[source] = script
+    return script
+
+
+def _async_script(client, source: str):
+    script = _ASYNC_SCRIPTS.get(source)
+    if script is None:
+        script = client.register_script(source)
+        _ASYNC_SCRIPTS[source] = script
+    return script
+
+
+_HEXPIRE_SUPPORT: bool | None = None
+
+
+def _version_supports_hexpire(version: str) -> bool:
+    parts = [int(p) for p in re.findall(r"\d+", str(version or ""))[:2]]
+    while len(parts) < 2:
+        parts.append(0)
+    return tuple(parts) >= (7, 4)
+
+
+def _node_infos(info) -> list[dict]:
+    """INFO from a cluster client is one dict per node; a single-node client returns the dict itself."""
+    if isinstance(info, dict) and info and all(isinstance(value, dict) for value in info.values()):
+        return list(info.values())
+    return [info] if isinstance(info, dict) else []
+
+
+def _server_supports_hexpire(info) -> bool:
+    nodes = _node_infos(info)
+    return bool(nodes) and all(_version_supports_hexpire(node.get("redis_version", "")) for node in nodes)
+
+
+def _hexpire_flag(cfg) -> str | None:
+    """"1"/"0" when configured or already probed; None when the server version still has to be checked."""
+    mode = str(cfg.redis_hexpire or "auto").strip().lower()
+    if mode in {"1", "true", "yes", "on"}:
+        return "1"
+    if mode in {"0", "false", "no", "off"}:
+        return "0"
+    if _HEXPIRE_SUPPORT is None:
+        return None
+    return "1" if _HEXPIRE_SUPPORT else "0"
+
+
+def _use_hexpire(client) -> str:
+    global _HEXPIRE_SUPPORT
+    cfg = get_settings()
+    flag = _hexpire_flag(cfg)
+    if flag is None:
+        _HEXPIRE_SUPPORT = _server_supports_hexpire(client.info("server"))
+        flag = "1" if _HEXPIRE_SUPPORT else "0"
+    return flag
+
+
+async def _ause_hexpire(client) -> str:
+    global _HEXPIRE_SUPPORT
+    cfg = get_settings()
+    flag = _hexpire_flag(cfg)
+    if flag is None:
+        _HEXPIRE_SUPPORT = _server_supports_hexpire(await client.info("server"))
+        flag = "1" if _HEXPIRE_SUPPORT else "0"
+    return flag
+
+
+def _session_ttl_s() -> int:
+    return max(0, int(get_settings().session_ttl_s))
+
 
 def _safe_conversation_id(conversation_id: str) -> str:
     cid = (conversation_id or "").strip()
@@ -41,39 +281,130 @@ def _request_key(conversation_id: str) -> str:
     return f"jc:{{{cid}}}:req"
 
 
+def _request_index_key(conversation_id: str) -> str:
+    cid = _safe_conversation_id(conversation_id)
+    return f"jc:{{{cid}}}:reqidx"
+
+
+def _history_key(conversation_id: str) -> str:
+    cid = _safe_conversation_id(conversation_id)
+    return f"jc:{{{cid}}}:history"
+
+
+def _summary_key(conversation_id: str) -> str:
+    cid = _safe_conversation_id(conversation_id)
+    return f"jc:{{{cid}}}:summary"
+
+
+def _checkpoint_key(conversation_id: str) -> str:
+    cid = _safe_conversation_id(conversation_id)
+    return f"jc:{{{cid}}}:checkpoint"
+
+
+def _checkpoint_writes_key(conversation_id: str) -> str:
+    cid = _safe_conversation_id(conversation_id)
+    return f"jc:{{{cid}}}:checkpoint_writes"
+
+
 def _lock_key(conversation_id: str) -> str:
     cid = _safe_conversation_id(conversation_id)
     return f"jc:{{{cid}}}:lock"
 
 
+def _lock_queue_key(conversation_id: str) -> str:
+    cid = _safe_conversation_id(conversation_id)
+    return f"jc:{{{cid}}}:lockq"
+
+
+def _released_channel(conversation_id: str) -> str:
+    cid = _safe_conversation_id(conversation_id)
+    return f"jc:{{{cid}}}:released"
+
+
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
 def assert_redis_available() -> None:
-    client = get_redis_client()
+    client = get_binary_redis_client()
     try:
         client.ping()
     except RedisError as exc:
         raise RuntimeError(f"Redis unavailable: {exc}") from exc
 
 
+# Card text is re-read by current_context_id when the interview resumes, so it is not copied into every save.
+_CARD_FIELDS = ("current_question", "current_standard_answer", "current_key_points")
+
+
+def _text(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _decode_state(raw, asked_ids) -> dict:
+    state = decode_value(raw) if raw else {}
+    if not isinstance(state, dict):
+        state = {}
+    asked = [_text(item) for item in asked_ids or []]
+    if asked:
+        state["asked_question_ids"] = asked
+    return state
+
+
+def _split_state(state: dict, codec: str | None = None) -> tuple[bytes, list[str]]:
+    asked_ids = state.get("asked_question_ids")
+    asked = asked_ids if isinstance(asked_ids, list) else []
+    cleaned_asked = [str(item).strip() for item in asked if str(item).strip()]
+    state_body = dict(state)
+    state_body.pop("asked_question_ids", None)
+    if str(state_body.get("current_context_id") or "").strip():
+        for name in _CARD_FIELDS:
+            state_body.pop(name, None)
+    return encode_value(state_body, codec=codec), cleaned_asked
+
+
+def _decode_result(raw) -> dict | None:
+    data = decode_value(raw)
+    return data if isinstance(data, dict) else None
+
+
+def _decode_history(raw_items) -> list[dict]:
+    history: list[dict] = []
+    for raw in raw_items or []:
+        item = decode_value(raw)
+        if isinstance(item, dict) and item.get("role") in {"user", "assistant"}:
+            history.append({"role": item["role"], "content": str(item.get("content", ""))})
+    return history
+
+
+def _encode_history(messages: list[dict], codec: str | None = None) -> list[bytes]:
+    return [
+        encode_value({"role": item.get("role"), "content": str(item.get("content", ""))}, codec=codec)
+        for item in messages or []
+        if isinstance(item, dict) and item.get("role") in {"user", "assistant"}
+    ]
+
+
+def _near_cache_enabled() -> bool:
+    return bool(get_settings().session_near_cache)
+
+
 def get_resume_interview_state(conversation_id: str) -> dict:
     cid = _safe_conversation_id(conversation_id)
     if not cid:
         return {}
-    client = get_redis_client()
+    # Not near-cached: interview state is read by the turn-start Lua under the lock, where a stale copy would lose
+    # asked questions.
     try:
-        raw = client.hget(_state_key(cid), "resume_interview_state")
-        state = json.loads(raw) if raw else {}
-        if not isinstance(state, dict):
-            state = {}
-        asked_ids = list(client.smembers(_asked_key(cid)))
-        if asked_ids:
-            state["asked_question_ids"] = asked_ids
-        return state
+        pipe = get_binary_redis_client().pipeline(transaction=False)
+        pipe.hget(_state_key(cid), "resume_interview_state")
+        pipe.smembers(_asked_key(cid))
+        raw, asked_ids = pipe.execute()
     except RedisError as exc:
         raise RuntimeError(f"Redis read session failed: {exc}") from exc
+    return _decode_state(raw, asked_ids)
 
 
 def set_resume_interview_state(conversation_id: str, state: dict) -> None:
@@ -82,25 +413,24 @@ def set_resume_interview_state(conversation_id: str, state: dict) -> None:
         return
     if not isinstance(state, dict):
         return
-    client = get_redis_client()
-    asked_ids = state.get("asked_question_ids")
-    asked = asked_ids if isinstance(asked_ids, list) else []
-    cleaned_asked = [str(item).strip() for item in asked if str(item).strip()]
-
-    state_body = dict(state)
-    state_body.pop("asked_question_ids", None)
+    client = get_binary_redis_client()
+    state_blob, cleaned_asked = _split_state(state)
 
     try:
         pipe = client.pipeline()
         pipe.hset(
             _state_key(cid),
             mapping={
-                "resume_interview_state": json.dumps(state_body, ensure_ascii=False),
+                "resume_interview_state": state_blob,
                 "updated_at": _now_iso(),
             },
         )
         if cleaned_asked:
             pipe.sadd(_asked_key(cid), *cleaned_asked)
+        ttl_s = _session_ttl_s()
+        if ttl_s:
+            pipe.expire(_state_key(cid), ttl_s)
+            pipe.expire(_asked_key(cid), ttl_s)
         pipe.execute()
     except RedisError as exc:
         raise RuntimeError(f"Redis write session failed: {exc}") from exc
@@ -111,18 +441,12 @@ def get_request_result(conversation_id: str, request_id: str) -> dict | None:
     rid = (request_id or "").strip()
     if not cid or not rid:
         return None
-    client = get_redis_client()
+    client = get_cached_redis_client() if _near_cache_enabled() else get_binary_redis_client()
     try:
         raw = client.hget(_request_key(cid), rid)
     except RedisError as exc:
         raise RuntimeError(f"Redis read request result failed: {exc}") from exc
-    if not raw:
-        return None
-    try:
-        data = json.loads(raw)
-    except Exception:
-        return None
-    return data if isinstance(data, dict) else None
+    return _decode_result(raw)
 
 
 def set_request_result(conversation_id: str, request_id: str, result: dict) -> None:
@@ -132,14 +456,97 @@ def set_request_result(conversation_id: str, request_id: str, result: dict) -> N
         return
     if not isinstance(result, dict):
         return
-    client = get_redis_client()
-    payload = json.dumps(result, ensure_ascii=False)
+    cfg = get_settings()
+    client = get_binary_redis_client()
+    payload = encode_value(result, codec=cfg.session_codec)
     try:
-        client.hset(_request_key(cid), rid, payload)
+        _script(client, _STORE_REQUEST_LUA)(
+            keys=[_request_key(cid), _request_index_key(cid)],
+            args=[
+                rid,
+                payload,
+                max(0, int(cfg.request_cache_ttl_s)),
+                max(1, int(cfg.request_cache_max)),
+                _use_hexpire(client),
+                _session_ttl_s(),
+            ],
+            client=client,
+        )
     except RedisError as exc:
         raise RuntimeError(f"Redis write request result failed: {exc}") from exc
 
 
+def get_conversation_history(conversation_id: str) -> list[dict]:
+    cid = _safe_conversation_id(conversation_id)
+    if not cid:
+        return []
+    cfg = get_settings()
+    client = get_binary_redis_client()
+    try:
+        raw_items = client.lrange(_history_key(cid), -max(1, int(cfg.chat_history_max_messages)), -1)
+    except RedisError as exc:
+        raise RuntimeError(f"Redis read history failed: {exc}") from exc
+    return _decode_history(raw_items)
+
+
+def append_conversation_history(conversation_id: str, messages: list[dict], *, seed: list[dict] | None = None) -> None:
+    """Append a turn. seed is the client's copy of the conversation before it, which replaces the stored
+    transcript when that one is shorter."""
+    cid = _safe_conversation_id(conversation_id)
+    if not cid:
+        return
+    items = _encode_history(messages)
+    if not items:
+        return
+    cfg = get_settings()
+    client = get_binary_redis_client()
+    try:
+        seed_call = _seed_history_call(cid, items, seed)
+        if seed_call is not None:
+            _script(client, _SEED_HISTORY_LUA)(keys=seed_call[0], args=seed_call[1], client=client)
+            return
+        pipe = client.pipeline()
+        pipe.rpush(_history_key(cid), *items)
+        pipe.ltrim(_history_key(cid), -max(1, int(cfg.chat_history_max_messages)), -1)
+        if _session_ttl_s():
+            pipe.expire(_history_key(cid), _session_ttl_s())
+        pipe.execute()
+    except RedisError as exc:
+        raise RuntimeError(f"Redis append history failed: {exc}") from exc
+
+
+def _seed_history_call(cid: str, items: list[bytes], seed: list[dict] | None) -> tuple[list, list] | None:
+    limit = max(1, int(get_settings().chat_history_max_messages))
+    seed_items = _encode_history(seed or [])[-limit:]
+    if not seed_items:
+        return None
+    return [_history_key(cid)], [limit, _session_ttl_s(), len(seed_items), *seed_items, *items]
+
+
+def get_history_summary(conversation_id: str) -> dict | None:
+    cid = _safe_conversation_id(conversation_id)
+    if not cid:
+        return None
+    client = get_binary_redis_client()
+    try:
+        raw = client.get(_summary_key(cid))
+    except RedisError as exc:
+        raise RuntimeError(f"Redis read history summary failed: {exc}") from exc
+    data = decode_value(raw)
+    return data if isinstance(data, dict) else None
+
+
+def set_history_summary(conversation_id: str, summary: dict) -> None:
+    cid = _safe_conversation_id(conversation_id)
+    if not cid or not isinstance(summary, dict):
+        return
+    client = get_binary_redis_client()
+    try:
+        client.set(_summary_key(cid), encode_value(summary), ex=_session_ttl_s() or None)
+    except RedisError as exc:
+        raise RuntimeError(f"Redis write history summary failed: {exc}") from exc
+
+
 def acquire_conversation_lock(conversation_id: str, owner_token: str) -> bool:
     cid = _safe_conversation_id(conversation_id)
     owner = (owner_token or "").strip()
@@ -148,7 +555,7 @@ def acquire_conversation_lock(conversation_id: str, owner_token: str) -> bool:
     cfg = get_settings()
     wait_ms = max(0, int(cfg.redis_lock_wait_ms))
     ttl_ms = max(1000, int(cfg.redis_lock_ttl_ms))
-    client = get_redis_client()
+    client = get_binary_redis_client()
     deadline = time.monotonic() + (wait_ms / 1000.0)
     try:
         while True:
@@ -167,9 +574,481 @@ def release_conversation_lock(conversation_id: str, owner_token: str) -> None:
     owner = (owner_token or "").strip()
     if not cid or not owner:
         return
-    client = get_redis_client()
+    client = get_binary_redis_client()
+    try:
+        client.eval(_LOCK_RELEASE_LUA, 1, _lock_key(cid), owner, _released_channel(cid))
+    except RedisError as exc:
+        raise RuntimeError(f"Redis release lock failed: {exc}") from exc
+
+
+_SHARED_KEY_PREFIX = "jc:{llm}:"
+
+_SESSION_KEY_BUILDERS = (
+    _state_key,
+    _asked_key,
+    _request_key,
+    _request_index_key,
+    _history_key,
+    _summary_key,
+    _checkpoint_key,
+    _checkpoint_writes_key,
+    _lock_key,
+    _lock_queue_key,
+)
+
+
+def _is_shared_key(key) -> bool:
+    return _text(key).startswith(_SHARED_KEY_PREFIX)
+
+
+def session_memory_report(conversation_id: str | None = None, *, sample: int = 200) -> dict:
+    """MEMORY USAGE and TTL of one conversation's keys, or of a SCAN sample of all conversations, by key kind."""
+    cid = _safe_conversation_id(conversation_id or "")
+    client = get_binary_redis_client()
+    try:
+        if cid:
+            keys = [build(cid) for build in _SESSION_KEY_BUILDERS]
+        else:
+            # The LLM limiter shares the jc: prefix under the {llm} hash tag; its keys are not session state.
+            scanned = (key for key in client.scan_iter(match="jc:{*}:*", count=500) if not _is_shared_key(key))
+            keys = list(itertools.islice(scanned, max(1, int(sample))))
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key)
+            pipe.ttl(key)
+        values = pipe.execute() if keys else []
+        memory = client.info("memory")
+    except RedisError as exc:
+        raise RuntimeError(f"Redis memory report failed: {exc}") from exc
+
+    by_kind: dict[str, dict] = {}
+    details: list[dict] = []
+    for idx, key in enumerate(keys):
+        usage, ttl = values[2 * idx], values[2 * idx + 1]
+        if usage is None:
+            continue
+        key = _text(key)
+        kind = key.rsplit(":", 1)[-1]
+        bucket = by_kind.setdefault(kind, {"keys": 0, "bytes": 0, "without_ttl": 0})
+        bucket["keys"] += 1
+        bucket["bytes"] += int(usage)
+        if ttl is not None and int(ttl) < 0:
+            bucket["without_ttl"] += 1
+        if cid:
+            details.append({"key": key, "bytes": int(usage), "ttl_s": int(ttl) if ttl is not None else None})
+
+    nodes = _node_infos(memory)
+    report = {
+        "used_memory": sum(int(node.get("used_memory") or 0) for node in nodes) if nodes else None,
+        "used_memory_human": nodes[0].get("used_memory_human") if len(nodes) == 1 else None,
+        "maxmemory": sum(int(node.get("maxmemory") or 0) for node in nodes) if nodes else None,
+        "nodes": len(nodes),
+        "sampled_keys": sum(bucket["keys"] for bucket in by_kind.values()),
+        "by_kind": by_kind,
+    }
+    if cid:
+        report["conversation_id"] = cid
+        report["keys"] = details
+    return report
+
+
+def _begin_turn_call(cid: str, owner: str, request_id: str, load_history: bool) -> tuple[list, list, float]:
+    cfg = get_settings()
+    wait_ms = max(0, int(cfg.redis_lock_wait_ms))
+    ttl_ms = max(1000, int(cfg.redis_lock_ttl_ms))
+    history_limit = max(1, int(cfg.chat_history_max_messages)) if load_history else 0
+    keys = [
+        _lock_key(cid),
+        _request_key(cid),
+        _state_key(cid),
+        _asked_key(cid),
+        _history_key(cid),
+        _lock_queue_key(cid),
+    ]
+    # A queued entry older than the longest legitimate wait belongs to a waiter that died.
+    args = [owner, ttl_ms, (request_id or "").strip(), history_limit, wait_ms + 1000, _released_channel(cid)]
+    return keys, args, wait_ms / 1000.0
+
+
+def _turn_start_from_reply(reply) -> TurnStart | None:
+    status = int(reply[0])
+    if status == 2:
+        return TurnStart(acquired=True, cached_result=_decode_result(reply[1]))
+    if status == 1:
+        return TurnStart(
+            acquired=True,
+            resume_state=_decode_state(reply[1], reply[2]),
+            history=_decode_history(reply[3]),
+        )
+    return None
+
+
+def _finish_turn_call(
+    cid: str,
+    owner: str,
+    *,
+    resume_state: dict,
+    request_id: str,
+    result: dict,
+    history: list[dict] | None,
+    use_hexpire: str,
+    seed: list[dict] | None = None,
+) -> tuple[list, list]:
+    cfg = get_settings()
+    state_blob, asked = _split_state(resume_state if isinstance(resume_state, dict) else {}, cfg.session_codec)
+    rid = (request_id or "").strip()
+    result_blob = encode_value(result, codec=cfg.session_codec) if rid and isinstance(result, dict) else b""
+    history_limit = max(1, int(cfg.chat_history_max_messages))
+    seed_items = _encode_history(seed or [], cfg.session_codec)[-history_limit:]
+    keys = [
+        _state_key(cid),
+        _asked_key(cid),
+        _request_key(cid),
+        _history_key(cid),
+        _lock_key(cid),
+        _request_index_key(cid),
+        _summary_key(cid),
+    ]
+    args = [
+        owner,
+        state_blob,
+        _now_iso(),
+        rid if result_blob else "",
+        result_blob,
+        history_limit,
+        _released_channel(cid),
+        _session_ttl_s(),
+        max(0, int(cfg.request_cache_ttl_s)),
+        max(1, int(cfg.request_cache_max)),
+        use_hexpire,
+        len(asked),
+        len(seed_items),
+        *asked,
+        *seed_items,
+        *_encode_history(history or [], cfg.session_codec),
+    ]
+    return keys, args
+
+
+def _leave_lock_queue(client, cid: str, owner: str) -> None:
+    """Drop a waiter that gave up without the lock (timeout, error, cancellation) from the FIFO queue."""
+    try:
+        client.zrem(_lock_queue_key(cid), owner)
+    except RedisError as exc:
+        logger.warning("leaving the lock queue of %s failed: %s", cid, exc)
+
+
+async def _aleave_lock_queue(client, cid: str, owner: str) -> None:
+    try:
+        await client.zrem(_lock_queue_key(cid), owner)
+    except RedisError as exc:
+        logger.warning("leaving the lock queue of %s failed: %s", cid, exc)
+
+
+def begin_turn(
+    conversation_id: str,
+    owner_token: str,
+    request_id: str,
+    *,
+    load_history: bool = False,
+) -> TurnStart:
+    """Lock the conversation and load everything a resume-interview turn needs in one round trip per attempt."""
+    cid = _safe_conversation_id(conversation_id)
+    owner = (owner_token or "").strip()
+    if not cid or not owner:
+        return TurnStart(acquired=False)
+    keys, args, wait_s = _begin_turn_call(cid, owner, request_id, load_history)
+    client = get_binary_redis_client()
+    script = _script(client, _BEGIN_TURN_LUA)
+    deadline = time.monotonic() + wait_s
+    start = None
+    try:
+        while True:
+            start = _turn_start_from_reply(script(keys=keys, args=args, client=client))
+            if start is not None:
+                return start
+            if time.monotonic() >= deadline:
+                return TurnStart(acquired=False)
+            time.sleep(0.05)
+    except RedisError as exc:
+        raise RuntimeError(f"Redis begin turn failed: {exc}") from exc
+    finally:
+        if start is None:
+            _leave_lock_queue(client, cid, owner)
+
+
+def finish_turn(
+    conversation_id: str,
+    owner_token: str,
+    *,
+    resume_state: dict,
+    request_id: str,
+    result: dict,
+    history: list[dict] | None = None,
+    seed: list[dict] | None = None,
+) -> bool:
+    """Persist the turn and release the lock in one round trip; returns False if the lock had expired.
+
+    seed is the client's copy of the conversation before this turn; it replaces a shorter stored transcript.
+    """
+    cid = _safe_conversation_id(conversation_id)
+    owner = (owner_token or "").strip()
+    if not cid or not owner:
+        return False
+    client = get_binary_redis_client()
+    try:
+        use_hexpire = _use_hexpire(client)
+    except RedisError as exc:
+        raise RuntimeError(f"Redis finish turn failed: {exc}") from exc
+    keys, args = _finish_turn_call(
+        cid,
+        owner,
+        resume_state=resume_state,
+        request_id=request_id,
+        result=result,
+        history=history,
+        use_hexpire=use_hexpire,
+        seed=seed,
+    )
+    try:
+        return bool(_script(client, _FINISH_TURN_LUA)(keys=keys, args=args, client=client))
+    except RedisError as exc:
+        raise RuntimeError(f"Redis finish turn failed: {exc}") from exc
+
+
+class _ReleaseListener:
+    """One pattern subscription per event loop that wakes local waiters when any conversation lock is released."""
+
+    def __init__(self):
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+        self._task: asyncio.Task | None = None
+        self._ready: asyncio.Event | None = None
+
+    def watch(self, channel: str) -> asyncio.Event:
+        event = asyncio.Event()
+        self._waiters.setdefault(channel, set()).add(event)
+        return event
+
+    def unwatch(self, channel: str, event: asyncio.Event) -> None:
+        waiters = self._waiters.get(channel)
+        if waiters is None:
+            return
+        waiters.discard(event)
+        if not waiters:
+            self._waiters.pop(channel, None)
+
+    async def ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=_WAIT_RECHECK_S)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        pubsub = get_async_pubsub_client().pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.psubscribe(_RELEASED_PATTERN)
+            if self._ready is not None:
+                self._ready.set()
+            while True:
+                message = await pubsub.get_message(timeout=30.0)
+                if not message:
+                    continue
+                for event in self._waiters.get(str(message.get("channel", "")), ()):
+                    event.set()
+        except RedisError as exc:
+            # Waiters fall back to periodic re-checks until the next wait restarts the listener.
+            logger.warning("lock release listener stopped: %s", exc)
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+
+_LISTENERS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _ReleaseListener]" = weakref.WeakKeyDictionary()
+
+
+def _release_listener() -> _ReleaseListener:
+    loop = asyncio.get_running_loop()
+    listener = _LISTENERS.get(loop)
+    if listener is None:
+        listener = _ReleaseListener()
+        _LISTENERS[loop] = listener
+    return listener
+
+
+async def aclose_release_listener() -> None:
+    listener = _LISTENERS.pop(asyncio.get_running_loop(), None)
+    if listener is not None:
+        await listener.aclose()
+
+
+def _sync_client_only() -> bool:
+    """REDIS_ASYNC=false serves the async API from the sync client on worker threads."""
+    return not get_settings().redis_async
+
+
+async def abegin_turn(
+    conversation_id: str,
+    owner_token: str,
+    request_id: str,
+    *,
+    load_history: bool = False,
+) -> TurnStart:
+    """Async begin_turn; between attempts it sleeps until a release notification instead of polling."""
+    if _sync_client_only():
+        return await asyncio.to_thread(begin_turn, conversation_id, owner_token, request_id, load_history=load_history)
+    cid = _safe_conversation_id(conversation_id)
+    owner = (owner_token or "").strip()
+    if not cid or not owner:
+        return TurnStart(acquired=False)
+    keys, args, wait_s = _begin_turn_call(cid, owner, request_id, load_history)
+    client = get_async_binary_redis_client()
+    script = _async_script(client, _BEGIN_TURN_LUA)
+    channel = _released_channel(cid)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait_s
+    listener: _ReleaseListener | None = None
+    released: asyncio.Event | None = None
+    start = None
+    try:
+        while True:
+            if released is not None:
+                released.clear()
+            start = _turn_start_from_reply(await script(keys=keys, args=args, client=client))
+            if start is not None:
+                return start
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return TurnStart(acquired=False)
+            if listener is None:
+                # Subscribe before the next attempt so a release between attempts is not missed.
+                listener = _release_listener()
+                released = listener.watch(channel)
+                await listener.ensure_started()
+                continue
+            try:
+                await asyncio.wait_for(released.wait(), timeout=min(remaining, _WAIT_RECHECK_S))
+            except asyncio.TimeoutError:
+                pass
+    except RedisError as exc:
+        raise RuntimeError(f"Redis begin turn failed: {exc}") from exc
+    finally:
+        if listener is not None and released is not None:
+            listener.unwatch(channel, released)
+        if start is None:
+            # Shielded so a waiter cancelled by a client disconnect still leaves the queue now, instead of
+            # holding up every successor until its entry goes stale.
+            await asyncio.shield(_aleave_lock_queue(client, cid, owner))
+
+
+async def afinish_turn(
+    conversation_id: str,
+    owner_token: str,
+    *,
+    resume_state: dict,
+    request_id: str,
+    result: dict,
+    history: list[dict] | None = None,
+    seed: list[dict] | None = None,
+) -> bool:
+    if _sync_client_only():
+        return await asyncio.to_thread(
+            finish_turn,
+            conversation_id,
+            owner_token,
+            resume_state=resume_state,
+            request_id=request_id,
+            result=result,
+            history=history,
+            seed=seed,
+        )
+    cid = _safe_conversation_id(conversation_id)
+    owner = (owner_token or "").strip()
+    if not cid or not owner:
+        return False
+    client = get_async_binary_redis_client()
+    try:
+        keys, args = _finish_turn_call(
+            cid,
+            owner,
+            resume_state=resume_state,
+            request_id=request_id,
+            result=result,
+            history=history,
+            use_hexpire=await _ause_hexpire(client),
+            seed=seed,
+        )
+        return bool(await _async_script(client, _FINISH_TURN_LUA)(keys=keys, args=args, client=client))
+    except RedisError as exc:
+        raise RuntimeError(f"Redis finish turn failed: {exc}") from exc
+
+
+async def arelease_conversation_lock(conversation_id: str, owner_token: str) -> None:
+    if _sync_client_only():
+        return await asyncio.to_thread(release_conversation_lock, conversation_id, owner_token)
+    cid = _safe_conversation_id(conversation_id)
+    owner = (owner_token or "").strip()
+    if not cid or not owner:
+        return
+    client = get_async_binary_redis_client()
     try:
-        client.eval(_LOCK_RELEASE_LUA, 1, _lock_key(cid), owner)
+        await client.eval(_LOCK_RELEASE_LUA, 1, _lock_key(cid), owner, _released_channel(cid))
     except RedisError as exc:
         raise RuntimeError(f"Redis release lock failed: {exc}") from exc
 
+
+async def aget_conversation_history(conversation_id: str) -> list[dict]:
+    if _sync_client_only():
+        return await asyncio.to_thread(get_conversation_history, conversation_id)
+    cid = _safe_conversation_id(conversation_id)
+    if not cid:
+        return []
+    cfg = get_settings()
+    client = get_async_binary_redis_client()
+    try:
+        raw_items = await client.lrange(_history_key(cid), -max(1, int(cfg.chat_history_max_messages)), -1)
+    except RedisError as exc:
+        raise RuntimeError(f"Redis read history failed: {exc}") from exc
+    return _decode_history(raw_items)
+
+
+async def aappend_conversation_history(
+    conversation_id: str,
+    messages: list[dict],
+    *,
+    seed: list[dict] | None = None,
+) -> None:
+    if _sync_client_only():
+        return await asyncio.to_thread(append_conversation_history, conversation_id, messages, seed=seed)
+    cid = _safe_conversation_id(conversation_id)
+    items = _encode_history(messages)
+    if not cid or not items:
+        return
+    cfg = get_settings()
+    client = get_async_binary_redis_client()
+    try:
+        seed_call = _seed_history_call(cid, items, seed)
+        if seed_call is not None:
+            await _async_script(client, _SEED_HISTORY_LUA)(keys=seed_call[0], args=seed_call[1], client=client)
+            return
+        pipe = client.pipeline()
+        pipe.rpush(_history_key(cid), *items)
+        pipe.ltrim(_history_key(cid), -max(1, int(cfg.chat_history_max_messages)), -1)
+        if _session_ttl_s():
+            pipe.expire(_history_key(cid), _session_ttl_s())
+        await pipe.execute()
+    except RedisError as exc:
+        raise RuntimeError(f"Redis append history failed: {exc}") from exc
\ No newline at end of file
@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import re
+import uuid
+import weakref
+from typing import AsyncIterator
+
+from redis.exceptions import RedisError
+
+from src.core.metrics import inc_counter
+from src.core.redis_client import get_async_redis_client
+from src.core.settings import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = frozenset({"done", "error"})
+# (sequence number, SSE event name, data); the sequence is None for errors synthesized by a follower.
+FlightEvent = tuple[int | None, str, dict]
+_FOLLOW_BLOCK_MS = 1000
+# Leader tasks and their watchdogs, referenced here so they are not garbage-collected mid-turn.
+_TASKS: set[asyncio.Task] = set()
+
+# Claim leadership for one (conversation, request) pair and drop the event stream a previous, expired
+# flight may have left behind.
+_CLAIM_LUA = """
+if redis.call("SET", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+  redis.call("DEL", KEYS[2])
+  return 1
+end
+return 0
+"""
+
+
+def _mode() -> str:
+    """REQUEST_COALESCING: redis (across workers), local (this process only) or off."""
+    mode = str(get_settings().request_coalescing or "redis").strip().lower()
+    return mode if mode in {"redis", "local", "off"} else "redis"
+
+
+def _safe_id(value: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_-]", "_", (value or "").strip())
+
+
+def _lease_key(cid: str, rid: str) -> str:
+    return f"jc:{{{cid}}}:flight:{rid}:lease"
+
+
+def _events_key(cid: str, rid: str) -> str:
+    return f"jc:{{{cid}}}:flight:{rid}:events"
+
+
+def _watch_key(cid: str, rid: str) -> str:
+    return f"jc:{{{cid}}}:flight:{rid}:watch"
+
+
+def _flight_ttl_ms() -> int:
+    return max(1, int(get_settings().request_flight_ttl_s)) * 1000
+
+
+def _resume_grace_s() -> float:
+    return max(0.1, float(get_settings().request_resume_grace_s))
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
+    return task
+
+
+class _LocalFlight:
+    """Events of one in-process leader, replayed to followers in the same event loop."""
+
+    def __init__(self):
+        self.events: list[tuple[str, dict]] = []
+        self.changed = asyncio.Event()
+        self.closed = False
+        self.followers = 0
+
+    def push(self, event: str, data: dict) -> None:
+        self.events.append((event, data))
+        self._notify()
+
+    def close(self) -> None:
+        self.closed = True
+        self._notify()
+
+    def _notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+_LOCAL_FLIGHTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[tuple[str, str], _LocalFlight]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _local_flights() -> dict[tuple[str, str], _LocalFlight]:
+    loop = asyncio.get_running_loop()
+    flights = _LOCAL_FLIGHTS.get(loop)
+    if flights is None:
+        flights = {}
+        _LOCAL_FLIGHTS[loop] = flights
+    return flights
+
+
+class Flight:
+    """One side of a coalesced request: the leader runs the turn and publishes, followers replay its events."""
+
+    def __init__(self, cid: str, rid: str, *, leader: bool, local: _LocalFlight | None, remote: bool):
+        self.cid = cid
+        self.rid = rid
+        self.leader = leader
+        self._local = local
+        self._remote = remote
+        self._pending: list[tuple[int, str, dict]] = []
+        self._terminated = False
+        self._seq = 0
+
+    def lead(self, events: AsyncIterator[tuple[str, dict]]) -> asyncio.Task:
+        """Publish events from a task detached from any response, so a dropped connection does not stop the turn.
+
+        Every response, the one that started the flight included, attaches with follow(). The task is cancelled
+        once no follower has been attached for REQUEST_RESUME_GRACE_S.
+        """
+        task = _spawn(self._publish_all(events))
+        _spawn(self._watch(task))
+        return task
+
+    async def _publish_all(self, events: AsyncIterator[tuple[str, dict]]) -> None:
+        try:
+            async for event, data in events:
+                await self.publish(event, data)
+        finally:
+            await events.aclose()
+            await asyncio.shield(self.finish())
+
+    async def _watch(self, task: asyncio.Task) -> None:
+        grace = _resume_grace_s()
+        loop = asyncio.get_running_loop()
+        idle_since: float | None = None
+        renew_at = loop.time() + _flight_ttl_ms() / 3000
+        while not task.done():
+            await asyncio.wait({task}, timeout=min(1.0, grace / 2))
+            if task.done():
+                return
+            if self._remote and loop.time() >= renew_at:
+                await self._renew_lease()
+                renew_at = loop.time() + _flight_ttl_ms() / 3000
+            if await self._has_followers():
+                idle_since = None
+            elif idle_since is None:
+                idle_since = loop.time()
+            elif loop.time() - idle_since >= grace:
+                inc_counter("request_flights_abandoned_total")
+                task.cancel()
+                return
+
+    async def _renew_lease(self) -> None:
+        """Keep the lease alive while the turn runs, even past REQUEST_FLIGHT_TTL_S. Otherwise a retry would claim
+        a new flight, which drops the live event stream and computes the turn again."""
+        ttl_ms = _flight_ttl_ms()
+        try:
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            pipe.pexpire(_lease_key(self.cid, self.rid), ttl_ms)
+            pipe.pexpire(_events_key(self.cid, self.rid), ttl_ms)
+            await pipe.execute()
+        except RedisError as exc:
+            logger.warning("request flight lease renewal failed for %s/%s: %s", self.cid, self.rid, exc)
+
+    async def _has_followers(self) -> bool:
+        if self._local is not None and self._local.followers:
+            return True
+        if not self._remote:
+            return False
+        try:
+            return bool(await get_async_redis_client().exists(_watch_key(self.cid, self.rid)))
+        except RedisError:
+            # Without a view of remote followers keep the turn running; it still ends with the graph.
+            return True
+
+    async def publish(self, event: str, data: dict) -> int | None:
+        """Record one event and return its sequence number (the SSE id), starting at 1."""
+        if not self.leader or self._terminated:
+            return None
+        self._seq += 1
+        if self._local is not None:
+            self._local.push(event, data)
+        if event in TERMINAL_EVENTS:
+            self._terminated = True
+        if self._remote:
+            self._pending.append((self._seq, event, data))
+            # Token chunks arrive in a burst after the answer is ready; batch them into the next XADD pipeline.
+            if event != "token":
+                await self._flush()
+        return self._seq
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        ttl_ms = _flight_ttl_ms()
+        key = _events_key(self.cid, self.rid)
+        try:
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            for seq, event, data in pending:
+                # Explicit ids 0-<seq> let a reconnecting client resume with XREAD from its Last-Event-ID.
+                pipe.xadd(key, {"event": event, "data": json.dumps(data, ensure_ascii=False)}, id=f"0-{seq}")
+            pipe.pexpire(key, ttl_ms)
+            pipe.pexpire(_lease_key(self.cid, self.rid), ttl_ms)
+            await pipe.execute()
+        except RedisError as exc:
+            # Remote followers time out on their own; the leader's response is unaffected.
+            logger.warning("request flight publish failed for %s/%s: %s", self.cid, self.rid, exc)
+            self._remote = False
+
+    async def finish(self) -> None:
+        """Close the flight. Followers of a leader that stopped early get an error instead of waiting out the TTL."""
+        if not self.leader:
+            return
+        if not self._terminated:
+            await self.publish("error", {"ok": False, "error": "原请求已中断，请重试。"})
+        await self._flush()
+        if self._local is not None:
+            self._local.close()
+            flights = _local_flights()
+            if flights.get((self.cid, self.rid)) is self._local:
+                flights.pop((self.cid, self.rid), None)
+        if not self._remote:
+            return
+        # Keep the finished stream for a grace period so late retries replay it instead of recomputing.
+        grace_ms = max(1, int(get_settings().request_flight_grace_s)) * 1000
+        try:
+            pipe = get_async_redis_client().pipeline(transaction=False)
+            pipe.pexpire(_lease_key(self.cid, self.rid), grace_ms)
+            pipe.pexpire(_events_key(self.cid, self.rid), grace_ms)
+            await pipe.execute()
+        except RedisError as exc:
+            logger.warning("request flight close failed for %s/%s: %s", self.cid, self.rid, exc)
+
+    async def follow(self, after: int = 0) -> AsyncIterator[FlightEvent]:
+        """Replay the leader's events with sequence numbers above after, then follow live ones."""
+        if self._local is not None:
+            async for item in self._follow_local(self._local, after):
+                yield item
+            return
+        async for item in self._follow_remote(after):
+            yield item
+
+    async def _follow_local(self, flight: _LocalFlight, after: int) -> AsyncIterator[FlightEvent]:
+        idx = max(0, after)
+        flight.followers += 1
+        try:
+            while True:
+                changed = flight.changed
+                while idx < len(flight.events):
+                    event, data = flight.events[idx]
+                    idx += 1
+                    yield idx, event, data
+                    if event in TERMINAL_EVENTS:
+                        return
+                if flight.closed:
+                    return
+                await changed.wait()
+        finally:
+            flight.followers -= 1
+
+    async def _follow_remote(self, after: int) -> AsyncIterator[FlightEvent]:
+        client = get_async_redis_client()
+        key = _events_key(self.cid, self.rid)
+        loop = asyncio.get_running_loop()
+        last_id = f"0-{max(0, after)}"
+        grace = _resume_grace_s()
+        refresh_at = 0.0
+        try:
+            while True:
+                if loop.time() >= refresh_at:
+                    # Tells the leader's worker someone still reads the stream, so it keeps the turn running.
+                    await client.set(_watch_key(self.cid, self.rid), "1", px=max(1, int(grace * 1000)))
+                    refresh_at = loop.time() + grace / 2
+                reply = await client.xread({key: last_id}, count=100, block=_FOLLOW_BLOCK_MS)
+                for _, entries in reply or []:
+                    for entry_id, fields in entries:
+                        last_id = entry_id
+                        event = str(fields.get("event", ""))
+                        try:
+                            data = json.loads(fields.get("data") or "{}")
+                        except ValueError:
+                            data = {}
+                        yield int(str(entry_id).rpartition("-")[2]), event, data
+                        if event in TERMINAL_EVENTS:
+                            return
+                if reply:
+                    continue
+                # The leader renews its lease for as long as the turn runs, so only a dead leader lets it lapse.
+                if not await client.exists(_lease_key(self.cid, self.rid)):
+                    yield None, "error", {"ok": False, "error": "原请求已中断，请重试。"}
+                    return
+        except RedisError as exc:
+            yield None, "error", {"ok": False, "error": f"Redis follow request failed: {exc}"}
+
+
+async def astart_flight(conversation_id: str, request_id: str) -> Flight | None:
+    """Lead or join the in-flight request keyed by (conversation_id, request_id); None when coalescing is off."""
+    cid = _safe_id(conversation_id)
+    rid = _safe_id(request_id)
+    mode = _mode()
+    if not cid or not rid or mode == "off":
+        return None
+    flights = _local_flights()
+    existing = flights.get((cid, rid))
+    if existing is not None and not existing.closed:
+        inc_counter("request_coalesced_total", scope="local")
+        return Flight(cid, rid, leader=False, local=existing, remote=False)
+
+    remote = mode == "redis"
+    if remote:
+        try:
+            client = get_async_redis_client()
+            claimed = await client.eval(
+                _CLAIM_LUA,
+                2,
+                _lease_key(cid, rid),
+                _events_key(cid, rid),
+                f"flight_{uuid.uuid4().hex}",
+                _flight_ttl_ms(),
+            )
+        except RedisError as exc:
+            logger.warning("request flight claim failed for %s/%s, coalescing locally: %s", cid, rid, exc)
+            claimed, remote = 1, False
+        if not int(claimed):
+            inc_counter("request_coalesced_total", scope="redis")
+            return Flight(cid, rid, leader=False, local=None, remote=True)
+
+    local = _LocalFlight()
+    flights[(cid, rid)] = local
+    return Flight(cid, rid, leader=True, local=local, remote=remote)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import json
+import threading
+from typing import Any, Callable
+
+from src.core.settings import get_settings
+
+try:
+    import msgpack
+
+    _MSGPACK_AVAILABLE = True
+except Exception:
+    msgpack = None  # type: ignore
+    _MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+
+    _ZSTD_AVAILABLE = True
+except Exception:
+    zstandard = None  # type: ignore
+    _ZSTD_AVAILABLE = False
+
+
+# Blob layout: one version byte, then the body. The low 7 bits name the serializer and the high bit marks a
+# zstd-compressed body. Legacy values were bare JSON text, which always starts with "{" or "[", so they never
+# collide with a version byte and are read as-is.
+JSON_FORMAT = 0x01
+MSGPACK_FORMAT = 0x02
+ZSTD_FLAG = 0x80
+ZSTD_MIN_BYTES = 256
+ZSTD_LEVEL = 3
+
+_LEGACY_JSON_LEADS = (ord("{"), ord("["))
+_ZSTD_LOCAL = threading.local()
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(body: bytes) -> Any:
+    return json.loads(body)
+
+
+def _msgpack_dumps(obj: Any) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _msgpack_loads(body: bytes) -> Any:
+    return msgpack.unpackb(body, raw=False)
+
+
+_SERIALIZERS: dict[int, tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    JSON_FORMAT: (_json_dumps, _json_loads),
+}
+if _MSGPACK_AVAILABLE:
+    _SERIALIZERS[MSGPACK_FORMAT] = (_msgpack_dumps, _msgpack_loads)
+
+
+def _zstd():
+    # Compressor/decompressor objects are not safe to share between threads.
+    pair = getattr(_ZSTD_LOCAL, "pair", None)
+    if pair is None:
+        pair = (zstandard.ZstdCompressor(level=ZSTD_LEVEL), zstandard.ZstdDecompressor())
+        _ZSTD_LOCAL.pair = pair
+    return pair
+
+
+def _write_format(codec: str | None) -> tuple[int, bool]:
+    """(serializer, compress) from SESSION_CODEC: auto, msgpack, msgpack+zstd, json, json+zstd."""
+    name = str((get_settings().session_codec if codec is None else codec) or "auto").strip().lower()
+    if name == "auto":
+        return (MSGPACK_FORMAT if _MSGPACK_AVAILABLE else JSON_FORMAT), _ZSTD_AVAILABLE
+    base, _, extra = name.partition("+")
+    fmt = MSGPACK_FORMAT if base == "msgpack" and _MSGPACK_AVAILABLE else JSON_FORMAT
+    return fmt, extra == "zstd" and _ZSTD_AVAILABLE
+
+
+def encode_value(obj: Any, *, codec: str | None = None) -> bytes:
+    """Pass codec when the caller already holds settings; it saves a settings read per value."""
+    fmt, compress = _write_format(codec)
+    body = _SERIALIZERS[fmt][0](obj)
+    if compress and len(body) >= ZSTD_MIN_BYTES:
+        packed = _zstd()[0].compress(body)
+        if len(packed) < len(body):
+            return bytes([fmt | ZSTD_FLAG]) + packed
+    return bytes([fmt]) + body
+
+
+def decode_value(raw: bytes | str | None) -> Any:
+    """Decode any stored blob, including legacy JSON text; returns None for missing or unreadable values."""
+    if raw is None:
+        return None
+    data = raw.encode("utf-8") if isinstance(raw, str) else bytes(raw)
+    if not data:
+        return None
+    try:
+        if data[0] in _LEGACY_JSON_LEADS:
+            return json.loads(data)
+        fmt = data[0] & ~ZSTD_FLAG
+        body = data[1:]
+        if data[0] & ZSTD_FLAG:
+            if not _ZSTD_AVAILABLE:
+                return None
+            body = _zstd()[1].decompress(body)
+        serializer = _SERIALIZERS.get(fmt)
+        if serializer is None:
+            return None
+        return serializer[1](body)
+    except Exception:
+        return None
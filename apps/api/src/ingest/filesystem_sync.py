@@ -7,7 +7,7 @@ from dataclasses import dataclass
 from pathlib import Path
 
 from src.ingest.pipeline import ALLOWED_EXTENSIONS, extract_text_from_upload, ingest_text
-from src.rag.store import delete_by_source, get_collection
+from src.rag.store import delete_by_source, get_where
 
 
 logger = logging.getLogger(__name__)
@@ -68,8 +68,7 @@ def _iter_source_files(data_root: Path) -> list[SourceFile]:
 
 
 def _existing_fs_sources() -> dict[str, dict]:
-    collection = get_collection()
-    raw = collection.get(where={"ingest_mode": "filesystem"}, include=["metadatas"])
+    raw = get_where({"ingest_mode": "filesystem"}, include=["metadatas"])
     ids = raw.get("ids") or []
     metadatas = raw.get("metadatas") or []
     out: dict[str, dict] = {}
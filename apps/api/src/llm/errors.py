@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+
+class LLMUnavailableError(RuntimeError):
+    """The LLM provider cannot take this call right now; callers should not retry immediately."""
+
+
+class LLMRateLimitTimeout(LLMUnavailableError):
+    """No limiter slot became free before the queue deadline."""
+
+
+class LLMCircuitOpenError(LLMUnavailableError):
+    """The circuit breaker is open after repeated upstream failures."""
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+from redis.exceptions import RedisError
+
+from src.core.cancellation import check_cancelled
+from src.core.metrics import add_gauge, inc_counter
+from src.core.redis_client import get_redis_client
+from src.core.settings import get_settings
+from src.llm.errors import LLMRateLimitTimeout
+
+
+logger = logging.getLogger(__name__)
+
+# Both keys share the {llm} hash tag so the script stays single-slot on Redis Cluster.
+_BUCKET_KEY = "jc:{llm}:bucket"
+_SLOTS_KEY = "jc:{llm}:slots"
+_QUEUE_GAUGE = "llm_limiter_queue_depth"
+_REDIS_RETRY_S = 30.0
+_FULL_POLL_MS = 50
+
+# Returns 0 when a slot is granted, -1 while all concurrency slots are leased,
+# or the number of milliseconds until the token bucket refills one token.
+_ACQUIRE_LUA = """
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_conc = tonumber(ARGV[3])
+local lease_ms = tonumber(ARGV[4])
+if max_conc > 0 then
+  redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", now)
+  if redis.call("ZCARD", KEYS[2]) >= max_conc then
+    return -1
+  end
+end
+if rate > 0 then
+  local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+  local tokens = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+  local ttl = math.ceil(burst * 1000 / rate) + 1000
+  if tokens < 1 then
+    redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now))
+    redis.call("PEXPIRE", KEYS[1], ttl)
+    return math.max(1, math.ceil((1 - tokens) * 1000 / rate))
+  end
+  redis.call("HSET", KEYS[1], "tokens", tostring(tokens - 1), "ts", tostring(now))
+  redis.call("PEXPIRE", KEYS[1], ttl)
+end
+if max_conc > 0 then
+  redis.call("ZADD", KEYS[2], now + lease_ms, ARGV[5])
+  redis.call("PEXPIRE", KEYS[2], lease_ms * 2)
+end
+return 0
+"""
+
+_RELEASE_LUA = """
+return redis.call("ZREM", KEYS[1], ARGV[1])
+"""
+
+
+@dataclass(frozen=True)
+class _Limits:
+    rate_per_s: float
+    burst: int
+    max_concurrency: int
+    lease_ms: int
+    wait_ms: int
+    backend: str
+
+
+@dataclass(frozen=True)
+class LLMSlot:
+    token: str
+    backend: str
+
+
+class _LocalLimiter:
+    """Per-process fallback with the same semantics as the Redis script."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: float | None = None
+        self._ts = 0.0
+        self._leases: dict[str, float] = {}
+
+    def try_acquire(self, token: str, limits: _Limits) -> int:
+        now = time.monotonic()
+        with self._lock:
+            if limits.max_concurrency > 0:
+                self._leases = {k: exp for k, exp in self._leases.items() if exp > now}
+                if len(self._leases) >= limits.max_concurrency:
+                    return -1
+            if limits.rate_per_s > 0:
+                tokens = float(limits.burst) if self._tokens is None else self._tokens
+                tokens = min(float(limits.burst), tokens + max(0.0, now - self._ts) * limits.rate_per_s)
+                self._ts = now
+                if tokens < 1:
+                    self._tokens = tokens
+                    return max(1, int((1 - tokens) * 1000 / limits.rate_per_s) + 1)
+                self._tokens = tokens - 1
+            if limits.max_concurrency > 0:
+                self._leases[token] = now + limits.lease_ms / 1000.0
+        return 0
+
+    def release(self, token: str) -> None:
+        with self._lock:
+            self._leases.pop(token, None)
+
+
+_LOCAL = _LocalLimiter()
+_REDIS_DOWN_UNTIL = 0.0
+
+
+def _limits() -> _Limits:
+    cfg = get_settings()
+    rate = max(0.0, float(cfg.llm_rate_per_s))
+    return _Limits(
+        rate_per_s=rate,
+        burst=max(1, int(cfg.llm_rate_burst)),
+        max_concurrency=max(0, int(cfg.llm_max_concurrency)),
+        # A lease outlives the slowest possible call so crashed workers cannot leak slots forever.
+        lease_ms=int(float(cfg.zhipu_timeout_s) * 1000) + 5000,
+        wait_ms=max(0, int(cfg.llm_queue_timeout_ms)),
+        backend=(cfg.llm_limiter_backend or "redis").lower(),
+    )
+
+
+def _try_acquire(token: str, limits: _Limits) -> tuple[int, str]:
+    global _REDIS_DOWN_UNTIL
+    if limits.backend == "redis" and time.monotonic() >= _REDIS_DOWN_UNTIL:
+        try:
+            status = get_redis_client().eval(
+                _ACQUIRE_LUA,
+                2,
+                _BUCKET_KEY,
+                _SLOTS_KEY,
+                limits.rate_per_s,
+                limits.burst,
+                limits.max_concurrency,
+                limits.lease_ms,
+                token,
+            )
+            return int(status), "redis"
+        except RedisError as exc:
+            logger.warning("llm limiter using local fallback, redis failed: %s", exc)
+            _REDIS_DOWN_UNTIL = time.monotonic() + _REDIS_RETRY_S
+    return _LOCAL.try_acquire(token, limits), "local"
+
+
+def _retry_delay_s(status: int, remaining_s: float) -> float:
+    delay_ms = _FULL_POLL_MS if status < 0 else status
+    return max(0.0, min(delay_ms / 1000.0, remaining_s))
+
+
+def try_acquire_llm_slot() -> LLMSlot | None:
+    """Take a slot only if one is free right now, without queueing."""
+    limits = _limits()
+    if limits.rate_per_s <= 0 and limits.max_concurrency <= 0:
+        return LLMSlot(token="", backend="none")
+    token = f"slot_{uuid.uuid4().hex}"
+    status, backend = _try_acquire(token, limits)
+    if status != 0:
+        return None
+    inc_counter("llm_limiter_acquired_total", backend=backend)
+    return LLMSlot(token=token, backend=backend)
+
+
+async def atry_acquire_llm_slot() -> LLMSlot | None:
+    return await asyncio.to_thread(try_acquire_llm_slot)
+
+
+def acquire_llm_slot() -> LLMSlot:
+    limits = _limits()
+    if limits.rate_per_s <= 0 and limits.max_concurrency <= 0:
+        return LLMSlot(token="", backend="none")
+
+    token = f"slot_{uuid.uuid4().hex}"
+    started = time.monotonic()
+    deadline = started + limits.wait_ms / 1000.0
+    queued = False
+    try:
+        while True:
+            status, backend = _try_acquire(token, limits)
+            if status == 0:
+                inc_counter("llm_limiter_acquired_total", backend=backend)
+                inc_counter("llm_limiter_wait_seconds_total", time.monotonic() - started)
+                return LLMSlot(token=token, backend=backend)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                inc_counter("llm_limiter_timeouts_total")
+                raise LLMRateLimitTimeout(f"LLM limiter queue timeout after {limits.wait_ms} ms")
+            if not queued:
+                queued = True
+                add_gauge(_QUEUE_GAUGE, 1)
+            check_cancelled()
+            time.sleep(_retry_delay_s(status, remaining))
+    finally:
+        if queued:
+            add_gauge(_QUEUE_GAUGE, -1)
+
+
+async def aacquire_llm_slot() -> LLMSlot:
+    limits = _limits()
+    if limits.rate_per_s <= 0 and limits.max_concurrency <= 0:
+        return LLMSlot(token="", backend="none")
+
+    token = f"slot_{uuid.uuid4().hex}"
+    started = time.monotonic()
+    deadline = started + limits.wait_ms / 1000.0
+    queued = False
+    try:
+        while True:
+            status, backend = await asyncio.to_thread(_try_acquire, token, limits)
+            if status == 0:
+                inc_counter("llm_limiter_acquired_total", backend=backend)
+                inc_counter("llm_limiter_wait_seconds_total", time.monotonic() - started)
+                return LLMSlot(token=token, backend=backend)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                inc_counter("llm_limiter_timeouts_total")
+                raise LLMRateLimitTimeout(f"LLM limiter queue timeout after {limits.wait_ms} ms")
+            if not queued:
+                queued = True
+                add_gauge(_QUEUE_GAUGE, 1)
+            await asyncio.sleep(_retry_delay_s(status, remaining))
+    finally:
+        if queued:
+            add_gauge(_QUEUE_GAUGE, -1)
+
+
+def release_llm_slot(slot: LLMSlot | None) -> None:
+    if slot is None or not slot.token:
+        return
+    if slot.backend == "redis":
+        try:
+            get_redis_client().eval(_RELEASE_LUA, 1, _SLOTS_KEY, slot.token)
+        except RedisError as exc:
+            # The lease expires on its own; log and move on.
+            logger.warning("llm limiter release failed: %s", exc)
+        return
+    _LOCAL.release(slot.token)
+
+
+@contextmanager
+def llm_slot():
+    slot = acquire_llm_slot()
+    try:
+        yield slot
+    finally:
+        release_llm_slot(slot)
+
+
+@asynccontextmanager
+async def allm_slot():
+    slot = await aacquire_llm_slot()
+    try:
+        yield slot
+    finally:
+        await asyncio.to_thread(release_llm_slot, slot)
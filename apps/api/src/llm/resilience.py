@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Awaitable, Callable, TypeVar
+
+import httpx
+
+from src.core.cancellation import CancelScope, RequestCancelled, cancel_scope, current_cancel_scope
+from src.core.metrics import inc_counter, set_gauge
+from src.core.settings import get_settings
+from src.llm.errors import LLMCircuitOpenError, LLMRateLimitTimeout, LLMUnavailableError
+
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """Only provider-side trouble trips the breaker; our own queue timeouts and 4xx do not."""
+    if isinstance(exc, (LLMRateLimitTimeout, LLMCircuitOpenError)):
+        return False
+    if isinstance(exc, LLMUnavailableError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, *, failure_threshold: int, reset_timeout_s: float, half_open_probes: int):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout_s = max(0.0, float(reset_timeout_s))
+        self.half_open_probes = max(1, int(half_open_probes))
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        set_gauge("llm_circuit_state", _STATE_GAUGE[state], breaker=self.name)
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout_s:
+                    inc_counter("llm_circuit_rejected_total", breaker=self.name)
+                    raise LLMCircuitOpenError(f"{self.name} circuit open after {self._failures} failures")
+                self._set_state(HALF_OPEN)
+                self._probes_in_flight = 0
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    inc_counter("llm_circuit_rejected_total", breaker=self.name)
+                    raise LLMCircuitOpenError(f"{self.name} circuit half-open, probe in flight")
+                self._probes_in_flight += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probes_in_flight = 0
+            if self._state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._probes_in_flight = 0
+                self._set_state(OPEN)
+
+    def record_ignored(self) -> None:
+        """Release a half-open probe whose outcome says nothing about upstream health."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(float(seconds))
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+        return samples[idx]
+
+
+_BREAKER: CircuitBreaker | None = None
+_LATENCY = LatencyWindow()
+_HEDGE_POOL: ThreadPoolExecutor | None = None
+_HEDGE_POOL_LOCK = threading.Lock()
+
+
+def get_llm_breaker() -> CircuitBreaker:
+    global _BREAKER
+    if _BREAKER is None:
+        cfg = get_settings()
+        _BREAKER = CircuitBreaker(
+            "zhipu_chat",
+            failure_threshold=cfg.llm_breaker_failure_threshold,
+            reset_timeout_s=cfg.llm_breaker_reset_s,
+            half_open_probes=cfg.llm_breaker_half_open_probes,
+        )
+    return _BREAKER
+
+
+def get_llm_latency() -> LatencyWindow:
+    return _LATENCY
+
+
+def hedge_delay_s() -> float | None:
+    """Delay before sending a hedge, or None when hedging is off or latency is not known yet."""
+    cfg = get_settings()
+    if not cfg.llm_hedge_enabled:
+        return None
+    if _LATENCY.count() < max(1, int(cfg.llm_hedge_min_samples)):
+        return None
+    p95 = _LATENCY.quantile(0.95) or 0.0
+    return max(p95, cfg.llm_hedge_min_delay_ms / 1000.0)
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _HEDGE_POOL
+    if _HEDGE_POOL is None:
+        with _HEDGE_POOL_LOCK:
+            if _HEDGE_POOL is None:
+                _HEDGE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+    return _HEDGE_POOL
+
+
+def hedged_call(primary: Callable[[], T], hedge: Callable[[], T], delay_s: float) -> T:
+    """Run primary on the calling thread; if it is still pending after delay_s, start hedge in the pool and keep the
+    first success.
+
+    Each side runs in its own child of the current cancel scope, so the winner aborts the loser's HTTP call on the
+    request loop. Outside a scope that can dispatch, a blocking primary cannot be interrupted and runs unhedged.
+    """
+    parent = current_cancel_scope()
+    if parent is None or not parent.can_dispatch():
+        return primary()
+
+    with parent.child() as first_scope, parent.child() as second_scope:
+        # The hedge runs in a copy of the caller's context so request-scoped state follows it into the pool.
+        context = contextvars.copy_context()
+        settled = threading.Event()
+        second: list[Future] = []
+        lock = threading.Lock()
+
+        def start_hedge() -> None:
+            with lock:
+                if settled.is_set():
+                    return
+                future = _hedge_pool().submit(context.run, _run_in_scope, second_scope, hedge)
+                second.append(future)
+            inc_counter("llm_hedged_requests_total")
+            future.add_done_callback(lambda fut: None if fut.cancelled() or fut.exception() else first_scope.cancel())
+
+        timer = threading.Timer(delay_s, start_hedge)
+        timer.daemon = True
+        timer.start()
+        error: BaseException | None = None
+        try:
+            with cancel_scope(first_scope):
+                result = primary()
+        except RequestCancelled as exc:
+            parent.check()
+            error = exc
+        except Exception as exc:
+            error = exc
+        finally:
+            timer.cancel()
+            with lock:
+                settled.set()
+        if error is None:
+            second_scope.cancel()
+            return result
+        if not second:
+            raise error
+        try:
+            result = second[0].result()
+        except Exception:
+            if isinstance(error, RequestCancelled):
+                raise
+            raise error from None
+        inc_counter("llm_hedge_wins_total")
+        return result
+
+
+def _run_in_scope(scope: CancelScope, call: Callable[[], T]) -> T:
+    with cancel_scope(scope):
+        return call()
+
+
+async def ahedged_call(
+    primary: Callable[[], Awaitable[T]],
+    hedge: Callable[[], Awaitable[T]],
+    delay_s: float,
+) -> T:
+    first = asyncio.ensure_future(primary())
+    futures = [first]
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay_s)
+        if done:
+            return first.result()
+
+        second = asyncio.ensure_future(hedge())
+        futures.append(second)
+        inc_counter("llm_hedged_requests_total")
+        pending = {first, second}
+        errors: dict[asyncio.Future, BaseException] = {}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for fut in done:
+                exc = fut.exception()
+                if exc is None:
+                    if fut is second:
+                        inc_counter("llm_hedge_wins_total")
+                    return fut.result()
+                errors[fut] = exc
+        raise errors.get(first) or errors[second]
+    finally:
+        # Unlike the sync path, the losing request is actually aborted here.
+        for fut in futures:
+            if not fut.done():
+                fut.cancel()
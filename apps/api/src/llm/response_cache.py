@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import numpy as np
+from redis.exceptions import RedisError
+
+from src.core.metrics import inc_counter
+from src.core.redis_client import get_redis_client
+from src.core.settings import get_settings
+from src.rag.embeddings import aembed_texts, embed_texts
+from src.rag.quantization import approx_dots, decode_vector, dequantize, encode_vector, quantization_mode, quantize
+
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "jc:llmcache"
+_MAX_LOCAL_SCOPES = 64
+# Best entries on the quantized scan that are decoded to float32 for the similarity checked against the threshold.
+_RESCORE_CANDIDATES = 8
+_CACHE_MODE: contextvars.ContextVar[str | None] = contextvars.ContextVar("llm_cache_mode", default=None)
+
+
+@contextmanager
+def llm_cache_mode(mode: str | None):
+    """Tag LLM calls made inside this block with a session mode so per-mode cache flags apply."""
+    token = _CACHE_MODE.set(mode)
+    try:
+        yield
+    finally:
+        _CACHE_MODE.reset(token)
+
+
+def _mode_set(raw: str) -> set[str]:
+    return {item.strip().lower() for item in (raw or "").split(",") if item.strip()}
+
+
+def _normalize_content(value) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip()
+
+
+def _normalize_messages(messages: list[dict]) -> list[dict]:
+    out: list[dict] = []
+    for item in messages or []:
+        if not isinstance(item, dict):
+            continue
+        out.append(
+            {
+                "role": str(item.get("role") or "user").lower(),
+                "content": _normalize_content(item.get("content")),
+            }
+        )
+    return out
+
+
+def _digest(obj) -> str:
+    raw = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _split_last_user(messages: list[dict]) -> tuple[list[dict], str]:
+    for idx in range(len(messages) - 1, -1, -1):
+        if messages[idx]["role"] == "user":
+            return messages[:idx] + messages[idx + 1 :], messages[idx]["content"]
+    return messages, ""
+
+
+def _unit(vec) -> np.ndarray | None:
+    arr = np.asarray(vec, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(arr))
+    if not arr.size or norm == 0.0:
+        return None
+    return arr / norm
+
+
+@dataclass
+class CacheProbe:
+    exact_key: str | None = None
+    scope: str | None = None
+    query_id: str | None = None
+    query_vector: np.ndarray | None = None
+    hit: str | None = None
+    ttl_s: int = 0
+    max_entries: int = 0
+
+
+@dataclass
+class _ScopeIndex:
+    ids: list[str] = field(default_factory=list)
+    scores: list[float] = field(default_factory=list)
+    # Stored as EMBEDDING_QUANTIZATION codes; scales are the per-row int8 scales.
+    vectors: np.ndarray | None = None
+    scales: np.ndarray | None = None
+    watermark: float = 0.0
+
+
+class _SemanticIndexCache:
+    """Per-process mirror of the Redis semantic entries, synced incrementally by timestamp."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scopes: OrderedDict[str, _ScopeIndex] = OrderedDict()
+
+    def _get(self, scope: str) -> _ScopeIndex:
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None:
+                index = _ScopeIndex()
+                self._scopes[scope] = index
+            self._scopes.move_to_end(scope)
+            while len(self._scopes) > _MAX_LOCAL_SCOPES:
+                self._scopes.popitem(last=False)
+            return index
+
+    def sync(self, client, scope: str, *, not_before: float) -> _ScopeIndex:
+        """Add the entries stored since the last sync and drop the ones Redis no longer has.
+
+        A re-stored query id replaces its older row. Entries older than not_before (the TTL) are dropped, and so
+        are those _trim_scope removed; trimming takes the oldest first, so that is everything scored below the
+        oldest member left in the index.
+        """
+        index = self._get(scope)
+        idx_key = _sem_index_key(scope)
+        pipe = client.pipeline(transaction=False)
+        pipe.zrangebyscore(idx_key, f"({index.watermark}", "+inf", withscores=True)
+        pipe.zrange(idx_key, 0, 0, withscores=True)
+        rows, oldest = pipe.execute()
+        floor = max(float(not_before), float(oldest[0][1])) if oldest else float("inf")
+        raw_vectors = client.hmget(_sem_vector_key(scope), [str(member) for member, _score in rows]) if rows else []
+        fresh_ids: list[str] = []
+        fresh_scores: list[float] = []
+        fresh_vectors: list[np.ndarray] = []
+        for (member, score), raw in zip(rows, raw_vectors):
+            if not raw:
+                continue
+            fresh_ids.append(str(member))
+            fresh_scores.append(float(score))
+            fresh_vectors.append(decode_vector(raw))
+        with self._lock:
+            if rows:
+                index.watermark = max(index.watermark, max(float(score) for _m, score in rows))
+            if not fresh_vectors:
+                self._prune(index, floor)
+                return index
+            mode = quantization_mode()
+            codes, scales = quantize(np.vstack(fresh_vectors), mode)
+            if index.vectors is not None and index.vectors.shape[1] == codes.shape[1]:
+                old_codes, old_scales = index.vectors, index.scales
+                if old_codes.dtype != codes.dtype:
+                    # EMBEDDING_QUANTIZATION changed since these were stored.
+                    old_codes, old_scales = quantize(dequantize(old_codes, old_scales), mode)
+                codes = np.vstack([old_codes, codes])
+                scales = np.concatenate([old_scales, scales]) if scales is not None else None
+                fresh_ids = index.ids + fresh_ids
+                fresh_scores = index.scores + fresh_scores
+            index.ids, index.scores, index.vectors, index.scales = fresh_ids, fresh_scores, codes, scales
+            self._prune(index, floor)
+        return index
+
+    @staticmethod
+    def _prune(index: _ScopeIndex, floor: float) -> None:
+        """Keep the latest row of each id, and only rows scored at or above floor."""
+        latest = {cid: i for i, cid in enumerate(index.ids)}
+        keep = [i for i, cid in enumerate(index.ids) if latest[cid] == i and index.scores[i] >= floor]
+        if len(keep) == len(index.ids):
+            return
+        index.ids = [index.ids[i] for i in keep]
+        index.scores = [index.scores[i] for i in keep]
+        if not keep:
+            index.vectors = index.scales = None
+            return
+        index.vectors = index.vectors[keep]
+        index.scales = index.scales[keep] if index.scales is not None else None
+
+    def best_matches(self, index: _ScopeIndex, query: np.ndarray, *, not_before: float) -> list[tuple[str, float]]:
+        """(id, cosine similarity) of the closest fresh entries, best first.
+
+        The codes only shortlist: quantization error also scales a code's norm, so the leaders are decoded to
+        float32 and re-normalised before their similarity is compared with the threshold.
+        """
+        with self._lock:
+            if index.vectors is None or index.vectors.shape[1] != query.shape[0]:
+                return []
+            fresh = np.asarray(index.scores) >= not_before
+            if not fresh.any():
+                return []
+            sims = np.where(fresh, approx_dots(index.vectors, index.scales, query), -np.inf)
+            shortlist = min(_RESCORE_CANDIDATES, int(fresh.sum()))
+            candidates = np.argpartition(-sims, shortlist - 1)[:shortlist]
+            scales = index.scales[candidates] if index.scales is not None else None
+            decoded = dequantize(index.vectors[candidates], scales)
+            exact = (decoded @ query) / np.maximum(np.linalg.norm(decoded, axis=1), 1e-12)
+            return [(index.ids[int(candidates[i])], float(exact[i])) for i in np.argsort(-exact, kind="stable")]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes.clear()
+
+
+_SEMANTIC_INDEX = _SemanticIndexCache()
+
+
+def _exact_key(digest: str) -> str:
+    return f"{_KEY_PREFIX}:exact:{digest}"
+
+
+def _sem_index_key(scope: str) -> str:
+    return f"{_KEY_PREFIX}:sem:{{{scope}}}:idx"
+
+
+def _sem_vector_key(scope: str) -> str:
+    return f"{_KEY_PREFIX}:sem:{{{scope}}}:vec"
+
+
+def _sem_answer_key(scope: str) -> str:
+    return f"{_KEY_PREFIX}:sem:{{{scope}}}:ans"
+
+
+def _plan(messages: list[dict], *, model: str, temperature: float) -> tuple[CacheProbe, str | None]:
+    """Build the cache probe for this call; also returns the text to embed when semantic lookup applies."""
+    cfg = get_settings()
+    mode = (_CACHE_MODE.get() or "").lower()
+    exact_on = mode in _mode_set(cfg.llm_cache_modes)
+    semantic_on = mode in _mode_set(cfg.llm_semantic_cache_modes)
+    probe = CacheProbe(
+        ttl_s=max(1, int(cfg.llm_cache_ttl_s)),
+        max_entries=max(1, int(cfg.llm_semantic_cache_max_entries)),
+    )
+    if not exact_on and not semantic_on:
+        return probe, None
+
+    normalized = _normalize_messages(messages)
+    if exact_on:
+        probe.exact_key = _exact_key(_digest({"model": model, "temperature": temperature, "messages": normalized}))
+    if not semantic_on:
+        return probe, None
+
+    context, question = _split_last_user(normalized)
+    if not question:
+        return probe, None
+    probe.scope = _digest({"model": model, "temperature": temperature, "mode": mode, "context": context})[:32]
+    probe.query_id = _digest(question)[:32]
+    return probe, question
+
+
+def _lookup_exact(client, probe: CacheProbe) -> str | None:
+    if not probe.exact_key:
+        return None
+    value = client.get(probe.exact_key)
+    return str(value) if value else None
+
+
+def _lookup_semantic(client, probe: CacheProbe) -> str | None:
+    if not probe.scope or probe.query_vector is None:
+        return None
+    threshold = float(get_settings().llm_semantic_cache_threshold)
+    not_before = time.time() - probe.ttl_s
+    index = _SEMANTIC_INDEX.sync(client, probe.scope, not_before=not_before)
+    matches = _SEMANTIC_INDEX.best_matches(index, probe.query_vector, not_before=not_before)
+    ids = [cid for cid, similarity in matches if similarity >= threshold]
+    if not ids:
+        return None
+    # An entry trimmed or expired since the sync has no answer left; the next one above the threshold may.
+    for answer in client.hmget(_sem_answer_key(probe.scope), ids):
+        if answer:
+            return str(answer)
+    return None
+
+
+def _lookup(probe: CacheProbe) -> None:
+    if not probe.exact_key and not probe.scope:
+        return
+    try:
+        client = get_redis_client()
+        hit = _lookup_exact(client, probe)
+        if hit is not None:
+            probe.hit = hit
+            inc_counter("llm_cache_hits_total", kind="exact")
+            return
+        hit = _lookup_semantic(client, probe)
+        if hit is not None:
+            probe.hit = hit
+            inc_counter("llm_cache_hits_total", kind="semantic")
+            return
+    except RedisError as exc:
+        logger.warning("llm response cache lookup failed: %s", exc)
+        return
+    inc_counter("llm_cache_misses_total")
+
+
+def probe_response_cache(messages: list[dict], *, model: str, temperature: float) -> CacheProbe:
+    probe, question = _plan(messages, model=model, temperature=temperature)
+    if question:
+        probe.query_vector = _unit(embed_texts([question])[0])
+    _lookup(probe)
+    return probe
+
+
+async def aprobe_response_cache(messages: list[dict], *, model: str, temperature: float) -> CacheProbe:
+    probe, question = _plan(messages, model=model, temperature=temperature)
+    if question:
+        probe.query_vector = _unit((await aembed_texts([question]))[0])
+    await asyncio.to_thread(_lookup, probe)
+    return probe
+
+
+def store_response(probe: CacheProbe, answer: str) -> None:
+    if not answer or (not probe.exact_key and not probe.scope):
+        return
+    try:
+        client = get_redis_client()
+        # The exact key and the semantic scope hash to different cluster slots, so this is a batch, not MULTI.
+        pipe = client.pipeline(transaction=False)
+        if probe.exact_key:
+            pipe.set(probe.exact_key, answer, ex=probe.ttl_s)
+        if probe.scope and probe.query_id and probe.query_vector is not None:
+            idx_key = _sem_index_key(probe.scope)
+            vec_key = _sem_vector_key(probe.scope)
+            ans_key = _sem_answer_key(probe.scope)
+            pipe.hset(vec_key, probe.query_id, encode_vector(probe.query_vector, quantization_mode()))
+            pipe.hset(ans_key, probe.query_id, answer)
+            pipe.zadd(idx_key, {probe.query_id: time.time()})
+            for key in (idx_key, vec_key, ans_key):
+                pipe.expire(key, probe.ttl_s)
+        pipe.execute()
+        if probe.scope:
+            _trim_scope(client, probe.scope, probe.max_entries)
+    except RedisError as exc:
+        logger.warning("llm response cache store failed: %s", exc)
+
+
+async def astore_response(probe: CacheProbe, answer: str) -> None:
+    await asyncio.to_thread(store_response, probe, answer)
+
+
+def _trim_scope(client, scope: str, max_entries: int) -> None:
+    idx_key = _sem_index_key(scope)
+    stale = client.zrange(idx_key, 0, -(max_entries + 1))
+    if not stale:
+        return
+    pipe = client.pipeline()
+    pipe.zrem(idx_key, *stale)
+    pipe.hdel(_sem_vector_key(scope), *stale)
+    pipe.hdel(_sem_answer_key(scope), *stale)
+    pipe.execute()
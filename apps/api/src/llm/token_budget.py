@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import re
+from dataclasses import dataclass
+from typing import Callable
+
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Earlier conversation summary"
+MESSAGE_OVERHEAD_TOKENS = 4
+_SUMMARY_LINE_CHARS = 160
+
+# CJK ideographs, kana, hangul and full-width punctuation are roughly one token per character.
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+_WORD_RE = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+def count_tokens(text: str) -> int:
+    """Cheap local approximation of BPE token counts; good enough for budgeting, not billing."""
+    raw = str(text or "")
+    if not raw:
+        return 0
+    cjk = len(_CJK_RE.findall(raw))
+    rest = _CJK_RE.sub(" ", raw)
+    total = cjk
+    for piece in _WORD_RE.findall(rest):
+        total += max(1, math.ceil(len(piece) / 4)) if piece[0].isalnum() or piece[0] == "_" else 1
+    return total
+
+
+def count_message_tokens(messages: list[dict]) -> int:
+    total = 0
+    for item in messages or []:
+        if isinstance(item, dict):
+            total += MESSAGE_OVERHEAD_TOKENS + count_tokens(item.get("content", ""))
+        else:
+            total += MESSAGE_OVERHEAD_TOKENS + count_tokens(item)
+    return total
+
+
+def is_summary_message(content: str) -> bool:
+    return str(content or "").startswith(SUMMARY_PREFIX)
+
+
+def _role(item) -> str:
+    return str(item.get("role") or "user") if isinstance(item, dict) else "user"
+
+
+def _content(item) -> str:
+    if isinstance(item, dict):
+        return str(item.get("content") or "")
+    return str(item or "")
+
+
+def _is_pinned(item) -> bool:
+    """Tool output and explicitly pinned items carry evidence the model must keep seeing."""
+    return isinstance(item, dict) and (bool(item.get("pinned")) or item.get("role") == "tool")
+
+
+def _digest(items: list) -> str:
+    raw = json.dumps([[_role(item), _content(item)] for item in items], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _tail_start(items: list, keep_last_turns: int) -> int:
+    """Index where the last N user-initiated turns begin."""
+    if keep_last_turns <= 0:
+        return len(items)
+    seen = 0
+    for idx in range(len(items) - 1, -1, -1):
+        if _role(items[idx]) == "user":
+            seen += 1
+            if seen >= keep_last_turns:
+                return idx
+    return 0
+
+
+def extractive_summary(previous: str, items: list, max_tokens: int) -> str:
+    """Append one clipped line per message, then keep the newest lines that fit the budget."""
+    lines = [line for line in (previous or "").splitlines() if line.strip()]
+    for item in items:
+        text = re.sub(r"\s+", " ", _content(item)).strip()
+        if not text:
+            continue
+        if len(text) > _SUMMARY_LINE_CHARS:
+            text = text[: _SUMMARY_LINE_CHARS - 3] + "..."
+        lines.append(f"- {_role(item)}: {text}")
+    kept: list[str] = []
+    used = 0
+    for line in reversed(lines):
+        cost = count_tokens(line) + 1
+        if kept and used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(reversed(kept))
+
+
+@dataclass
+class CompactionResult:
+    messages: list
+    summary_state: dict | None = None
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def compacted(self) -> bool:
+        return self.summary_state is not None or self.tokens_after < self.tokens_before
+
+
+def compact_history(
+    history: list,
+    *,
+    max_tokens: int,
+    keep_last_turns: int,
+    summary_max_tokens: int,
+    previous_summary: dict | None = None,
+    summarize: Callable[[str, list], str] | None = None,
+) -> CompactionResult:
+    """Fit history into max_tokens: keep system items, pinned evidence and the last turns; summarize the rest.
+
+    previous_summary is the summary_state returned for an earlier turn. When it still covers a prefix of the
+    middle section only the new messages are summarized, so the summary does not get rebuilt every turn.
+    """
+    items = list(history or [])
+    before = count_message_tokens(items)
+    if before <= max_tokens:
+        return CompactionResult(messages=items, tokens_before=before, tokens_after=before)
+
+    leading: list = []
+    idx = 0
+    while idx < len(items) and _role(items[idx]) == "system":
+        leading.append(items[idx])
+        idx += 1
+    body = items[idx:]
+    split = _tail_start(body, keep_last_turns)
+    middle, tail = body[:split], body[split:]
+    pinned = [item for item in middle if _is_pinned(item)]
+    to_summarize = [item for item in middle if not _is_pinned(item)]
+
+    summary_state: dict | None = None
+    summary_text = ""
+    if to_summarize:
+        prev = previous_summary if isinstance(previous_summary, dict) else {}
+        count = int(prev.get("count") or 0)
+        prev_text = str(prev.get("text") or "")
+        if not (0 < count <= len(to_summarize) and prev.get("digest") == _digest(to_summarize[:count])):
+            count, prev_text = 0, ""
+        fresh = to_summarize[count:]
+        summary_text = prev_text
+        if fresh or not prev_text:
+            summary_text = ""
+            if summarize is not None:
+                try:
+                    summary_text = str(summarize(prev_text, fresh) or "").strip()
+                except Exception as exc:
+                    logger.warning("history summarizer failed, falling back to extractive summary: %s", exc)
+            if not summary_text:
+                summary_text = extractive_summary(prev_text, fresh, summary_max_tokens)
+        summary_state = {
+            "count": len(to_summarize),
+            "digest": _digest(to_summarize),
+            "text": summary_text,
+        }
+
+    def assemble() -> list:
+        out = list(leading)
+        if summary_text:
+            out.append({"role": "system", "content": f"{SUMMARY_PREFIX}:\n{summary_text}"})
+        return out + pinned + tail
+
+    compacted = assemble()
+    # Still over budget: shed the oldest pinned evidence, then the oldest kept turns, never the latest turn.
+    while count_message_tokens(compacted) > max_tokens and pinned:
+        pinned.pop(0)
+        compacted = assemble()
+    while count_message_tokens(compacted) > max_tokens:
+        next_turn = next((i for i in range(1, len(tail)) if _role(tail[i]) == "user"), None)
+        if next_turn is None:
+            break
+        tail = tail[next_turn:]
+        compacted = assemble()
+
+    return CompactionResult(
+        messages=compacted,
+        summary_state=summary_state,
+        tokens_before=before,
+        tokens_after=count_message_tokens(compacted),
+    )
@@ -1,22 +1,52 @@
 ﻿from __future__ import annotations
 
-import json
-import urllib.request
+import asyncio
+import time
 
+import httpx
+
+from src.core.cancellation import RequestCancelled, check_cancelled
+from src.core.http_client import apost_json, post_json
+from src.core.metrics import inc_counter
 from src.core.settings import get_settings
+from src.llm.errors import LLMRateLimitTimeout, LLMUnavailableError
+from src.llm.rate_limit import (
+    aacquire_llm_slot,
+    acquire_llm_slot,
+    atry_acquire_llm_slot,
+    release_llm_slot,
+    try_acquire_llm_slot,
+)
+from src.llm.resilience import (
+    CLOSED,
+    ahedged_call,
+    get_llm_breaker,
+    get_llm_latency,
+    hedge_delay_s,
+    hedged_call,
+    is_upstream_failure,
+)
+from src.llm.response_cache import (
+    aprobe_response_cache,
+    astore_response,
+    probe_response_cache,
+    store_response,
+)
+from src.llm.token_budget import count_message_tokens
 
 DEFAULT_BASE_URL = "https://open.bigmodel.cn/api/paas/v4"
 DEFAULT_MODEL = "glm-4-flash"
 DEFAULT_TEMPERATURE = 0.2
 DEFAULT_TIMEOUT_S = 30
+_OVERLOAD_STATUS = {429, 503}
 
 
-def chat(
+def _chat_request(
     messages: list[dict],
     *,
-    model: str | None = None,
-    temperature: float | None = None,
-) -> str:
+    model: str | None,
+    temperature: float | None,
+) -> tuple[str, dict, dict, float]:
     settings = get_settings()
     api_key = settings.zhipu_api_key
     if not api_key:
@@ -29,28 +59,16 @@ def chat(
     timeout = float(settings.zhipu_timeout_s)
 
     url = f"{base_url}/chat/completions"
-    payload = json.dumps(
-        {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature,
-        }
-    ).encode("utf-8")
-
-    request = urllib.request.Request(
-        url,
-        data=payload,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
-
-    with urllib.request.urlopen(request, timeout=timeout) as response:
-        body = response.read().decode("utf-8", errors="replace")
-        data = json.loads(body)
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+    }
+    headers = {"Authorization": f"Bearer {api_key}"}
+    return url, payload, headers, timeout
 
+
+def _chat_content(data: dict) -> str:
     choices = data.get("choices") or []
     if not choices:
         raise RuntimeError("ZhipuAI response missing choices")
@@ -63,5 +81,134 @@ def chat(
     return content
 
 
+def _overloaded(exc: httpx.HTTPStatusError) -> LLMUnavailableError:
+    return LLMUnavailableError(f"ZhipuAI overloaded: HTTP {exc.response.status_code}")
+
+
+def _post_chat(url: str, payload: dict, headers: dict, timeout: float, *, hedge: bool = False) -> dict:
+    slot = try_acquire_llm_slot() if hedge else acquire_llm_slot()
+    if slot is None:
+        # A hedge is only worth sending when there is spare capacity.
+        raise LLMRateLimitTimeout("no free LLM slot for hedged request")
+    try:
+        started = time.monotonic()
+        data = post_json(url, payload, headers=headers, timeout=timeout)
+        get_llm_latency().record(time.monotonic() - started)
+        return data
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code in _OVERLOAD_STATUS:
+            raise _overloaded(exc) from exc
+        raise
+    finally:
+        release_llm_slot(slot)
+
+
+async def _apost_chat(url: str, payload: dict, headers: dict, timeout: float, *, hedge: bool = False) -> dict:
+    slot = await atry_acquire_llm_slot() if hedge else await aacquire_llm_slot()
+    if slot is None:
+        raise LLMRateLimitTimeout("no free LLM slot for hedged request")
+    try:
+        started = time.monotonic()
+        data = await apost_json(url, payload, headers=headers, timeout=timeout)
+        get_llm_latency().record(time.monotonic() - started)
+        return data
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code in _OVERLOAD_STATUS:
+            raise _overloaded(exc) from exc
+        raise
+    finally:
+        await asyncio.to_thread(release_llm_slot, slot)
+
+
+def _record_cancelled(messages: list[dict], stage: str) -> None:
+    # Prompt tokens are a floor: a call aborted in flight also skips however long the completion would have been.
+    inc_counter("llm_cancelled_calls_total", stage=stage)
+    inc_counter("llm_tokens_saved_total", count_message_tokens(messages), stage=stage)
+
+
+def _record_outcome(breaker, exc: BaseException | None) -> None:
+    if exc is None:
+        breaker.record_success()
+    elif is_upstream_failure(exc):
+        breaker.record_failure()
+    else:
+        breaker.record_ignored()
+
+
+def chat(
+    messages: list[dict],
+    *,
+    model: str | None = None,
+    temperature: float | None = None,
+) -> str:
+    url, payload, headers, timeout = _chat_request(messages, model=model, temperature=temperature)
+    probe = probe_response_cache(messages, model=payload["model"], temperature=payload["temperature"])
+    if probe.hit is not None:
+        return probe.hit
+    try:
+        check_cancelled()
+    except RequestCancelled:
+        _record_cancelled(messages, "skipped")
+        raise
+    breaker = get_llm_breaker()
+    breaker.before_call()
+    delay = hedge_delay_s() if breaker.state == CLOSED else None
+    try:
+        if delay is None:
+            data = _post_chat(url, payload, headers, timeout)
+        else:
+            data = hedged_call(
+                lambda: _post_chat(url, payload, headers, timeout),
+                lambda: _post_chat(url, payload, headers, timeout, hedge=True),
+                delay,
+            )
+    except RequestCancelled:
+        breaker.record_ignored()
+        _record_cancelled(messages, "in_flight")
+        raise
+    except Exception as exc:
+        _record_outcome(breaker, exc)
+        raise
+    _record_outcome(breaker, None)
+    content = _chat_content(data)
+    store_response(probe, content)
+    return content
+
+
+async def achat(
+    messages: list[dict],
+    *,
+    model: str | None = None,
+    temperature: float | None = None,
+) -> str:
+    url, payload, headers, timeout = _chat_request(messages, model=model, temperature=temperature)
+    probe = await aprobe_response_cache(messages, model=payload["model"], temperature=payload["temperature"])
+    if probe.hit is not None:
+        return probe.hit
+    breaker = get_llm_breaker()
+    breaker.before_call()
+    delay = hedge_delay_s() if breaker.state == CLOSED else None
+    try:
+        if delay is None:
+            data = await _apost_chat(url, payload, headers, timeout)
+        else:
+            data = await ahedged_call(
+                lambda: _apost_chat(url, payload, headers, timeout),
+                lambda: _apost_chat(url, payload, headers, timeout, hedge=True),
+                delay,
+            )
+    except asyncio.CancelledError:
+        breaker.record_ignored()
+        _record_cancelled(messages, "in_flight")
+        raise
+    except Exception as exc:
+        _record_outcome(breaker, exc)
+        raise
+    _record_outcome(breaker, None)
+    content = _chat_content(data)
+    await astore_response(probe, content)
+    return content
+
+
 def chat_completion(*, messages: list[dict]) -> str:
     return chat(messages)
@@ -1,4 +1,5 @@
 import asyncio
+import logging
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,14 +7,22 @@ from fastapi.middleware.cors import CORSMiddleware
 from src.api.routes_chat_stream import router as chat_stream_router
 from src.api.routes_health import router as health_router
 from src.api.routes_ingest import router as ingest_router
+from src.api.routes_metrics import router as metrics_router
 from src.api.routes_retrieve import router as retrieve_router
+from src.api.routes_sessions import router as sessions_router
 from src.api.routes_skills import router as skills_router
 from src.api.routes_sources import router as sources_router
 from src.api.routes_upload import router as upload_router
+from src.core.http_client import aclose_http_client, close_http_client
+from src.core.redis_client import aclose_redis_client
 from src.core.settings import get_settings
+from src.graph.redis_session_store import aclose_release_listener
 from src.ingest.filesystem_sync import sync_filesystem_sources
+from src.rag.migrate_partitions import migrate_to_partitions
 
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 settings = get_settings()
@@ -39,6 +48,8 @@ app.include_router(retrieve_router)
 app.include_router(skills_router)
 app.include_router(sources_router)
 app.include_router(chat_stream_router)
+app.include_router(metrics_router)
+app.include_router(sessions_router)
 
 
 _sync_task: asyncio.Task | None = None
@@ -53,6 +64,11 @@ async def _filesystem_sync_loop(interval_s: float):
 @app.on_event("startup")
 async def _startup_sync():
     global _sync_task
+    try:
+        # A no-op once the single pre-partitioning collection is gone.
+        await asyncio.to_thread(migrate_to_partitions)
+    except Exception:
+        logger.exception("collection partition migration failed; run python -m src.rag.migrate_partitions")
     cfg = get_settings()
     if not cfg.filesystem_sync_enabled:
         return
@@ -71,3 +87,15 @@ async def _shutdown_sync():
     except asyncio.CancelledError:
         pass
     _sync_task = None
+
+
+@app.on_event("shutdown")
+async def _shutdown_http_clients():
+    await aclose_http_client()
+    close_http_client()
+
+
+@app.on_event("shutdown")
+async def _shutdown_redis_clients():
+    await aclose_release_listener()
+    await aclose_redis_client()
@@ -1,58 +1,192 @@
 ﻿from __future__ import annotations
 
 import hashlib
-import json
 import os
-import random
-import urllib.request
+import re
+from functools import lru_cache
 from typing import Iterable
 
+import numpy as np
+
+from src.core.http_client import apost_json, post_json
+from src.core.settings import get_settings
+
 
 DEFAULT_MODEL = "embedding-3"
 DEFAULT_DIM = 1536
 DEFAULT_BASE_URL = "https://open.bigmodel.cn/api/paas/v4"
+DEFAULT_TIMEOUT_S = 30.0
 
 
-def _dummy_embedding(text: str, dim: int = DEFAULT_DIM) -> list[float]:
-    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
-    seed = int(digest[:16], 16)
-    rng = random.Random(seed)
-    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+def embedding_dim() -> int | None:
+    """Output size asked of the embedding model (ZHIPUAI_EMBED_DIM); None keeps the model's default."""
+    dim = get_settings().zhipu_embed_dim
+    return dim if dim > 0 else None
 
 
-def _dummy_embeddings(texts: Iterable[str]) -> list[list[float]]:
-    return [_dummy_embedding(t) for t in texts]
+DUMMY_MODES = ("random", "hashed")
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+# Rows generated per block, which bounds the uint64 scratch matrix to about 12 MB at 1536 dims.
+_DUMMY_BLOCK_ROWS = 1024
+# Latin words (code identifiers included) and runs of CJK characters.
+_TOKEN_RE = re.compile(r"[a-z0-9_+#]+|[\u3400-\u9fff]+")
 
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
-    if not texts:
-        return []
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    # uint64 array arithmetic wraps around, which is what the mixer relies on.
+    z = x + _GOLDEN
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _text_seeds(texts: list[str]) -> np.ndarray:
+    return np.fromiter(
+        (int.from_bytes(hashlib.sha256(t.encode("utf-8")).digest()[:8], "little") for t in texts),
+        dtype=np.uint64,
+        count=len(texts),
+    )
+
+
+def _random_matrix(texts: list[str], dim: int) -> np.ndarray:
+    """Uniform [-1, 1) values from a counter-based hash of (sha256 of the text, column). A text gets the same
+    vector whatever it is batched with, and its first d values are the same at any dim."""
+    out = np.empty((len(texts), dim), dtype=np.float32)
+    columns = np.arange(dim, dtype=np.uint64) * _GOLDEN
+    seeds = _text_seeds(texts)
+    for start in range(0, len(texts), _DUMMY_BLOCK_ROWS):
+        bits = _splitmix64(seeds[start : start + _DUMMY_BLOCK_ROWS, None] + columns) >> np.uint64(11)
+        out[start : start + _DUMMY_BLOCK_ROWS] = bits * (2.0 / 2**53) - 1.0
+    return out
+
+
+def _tokens(text: str) -> list[str]:
+    tokens: list[str] = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if run[0] >= "\u3400":
+            # Chinese has no spaces: count characters and character bigrams.
+            tokens.extend(run)
+            tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+@lru_cache(maxsize=65536)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _hashed_matrix(texts: list[str], dim: int) -> np.ndarray:
+    """Signed feature hashing of the texts' tokens with sublinear term counts, L2-normalised. Texts sharing words
+    land close together, so offline retrieval ranks by lexical overlap instead of at random."""
+    rows: list[int] = []
+    hashes: list[int] = []
+    for row, text in enumerate(texts):
+        for token in _tokens(text):
+            rows.append(row)
+            hashes.append(_token_hash(token))
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    if hashes:
+        h = np.asarray(hashes, dtype=np.uint64)
+        signs = np.where(h >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+        np.add.at(out, (np.asarray(rows, dtype=np.intp), (h % np.uint64(dim)).astype(np.intp)), signs)
+        out = np.sign(out) * np.log1p(np.abs(out))
+    norms = np.linalg.norm(out, axis=1)
+    empty = norms == 0.0
+    if empty.any():
+        # No tokens (or they cancelled out): fall back to the random vector rather than an all-zero one.
+        out[empty] = _random_matrix([texts[i] for i in np.flatnonzero(empty)], dim)
+        norms[empty] = np.linalg.norm(out[empty], axis=1)
+    return out / norms[:, None]
+
+
+def dummy_embedding_mode() -> str:
+    mode = get_settings().dummy_embeddings
+    if mode not in DUMMY_MODES:
+        raise ValueError(f"DUMMY_EMBEDDINGS must be one of {', '.join(DUMMY_MODES)}, got {mode!r}")
+    return mode
+
+
+def dummy_embedding_matrix(texts: list[str], dim: int = DEFAULT_DIM, *, mode: str | None = None) -> np.ndarray:
+    """Deterministic offline embeddings as one (len(texts), dim) float32 array, per DUMMY_EMBEDDINGS."""
+    texts = [str(t) for t in texts]
+    if (mode or dummy_embedding_mode()) == "hashed":
+        return _hashed_matrix(texts, dim)
+    return _random_matrix(texts, dim)
+
 
+def _dummy_embeddings(texts: Iterable[str], dim: int | None = None) -> list[list[float]]:
+    return dummy_embedding_matrix(list(texts), dim or DEFAULT_DIM).tolist()
+
+
+def _fit_dim(embeddings: list[list[float]], dim: int | None) -> list[list[float]]:
+    """Cut vectors longer than dim to their first dim values and re-normalise them, the Matryoshka way of
+    shortening an embedding; a model that honours `dimensions` already returns dim values and passes through."""
+    if not dim:
+        return embeddings
+    fitted: list[list[float]] = []
+    for vector in embeddings:
+        if len(vector) <= dim:
+            fitted.append(vector)
+            continue
+        head = np.asarray(vector[:dim], dtype=np.float32)
+        fitted.append((head / max(float(np.linalg.norm(head)), 1e-12)).tolist())
+    return fitted
+
+
+def _embed_request(texts: list[str], dim: int | None = None) -> tuple[str, dict, dict] | None:
     api_key = os.getenv("ZHIPUAI_API_KEY")
     if not api_key:
-        return _dummy_embeddings(texts)
+        return None
 
     model = os.getenv("ZHIPUAI_EMBED_MODEL", DEFAULT_MODEL)
     base_url = os.getenv("ZHIPUAI_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
 
     url = f"{base_url}/embeddings"
-    payload = json.dumps({"model": model, "input": texts}).encode("utf-8")
-    request = urllib.request.Request(
-        url,
-        data=payload,
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
+    payload = {"model": model, "input": texts}
+    if dim:
+        payload["dimensions"] = dim
+    headers = {"Authorization": f"Bearer {api_key}"}
+    return url, payload, headers
+
+
+def _embeddings_from_response(data: dict) -> list[list[float]]:
+    embeddings = data.get("data", [])
+    return [item.get("embedding", []) for item in embeddings]
+
+
+def embed_texts(texts: list[str], *, dim: int | None = None) -> list[list[float]]:
+    """Embeddings of dim values, defaulting to ZHIPUAI_EMBED_DIM."""
+    if not texts:
+        return []
+
+    dim = dim or embedding_dim()
+    request = _embed_request(texts, dim)
+    if request is None:
+        return _dummy_embeddings(texts, dim)
 
+    url, payload, headers = request
     try:
-        with urllib.request.urlopen(request, timeout=30) as response:
-            body = response.read().decode("utf-8", errors="replace")
-            data = json.loads(body)
-        embeddings = data.get("data", [])
-        return [item.get("embedding", []) for item in embeddings]
+        data = post_json(url, payload, headers=headers, timeout=DEFAULT_TIMEOUT_S)
+        return _fit_dim(_embeddings_from_response(data), dim)
     except Exception:
         # Keep local/dev/test workflow reliable when external embedding API is unavailable.
-        return _dummy_embeddings(texts)
+        return _dummy_embeddings(texts, dim)
+
+
+async def aembed_texts(texts: list[str], *, dim: int | None = None) -> list[list[float]]:
+    if not texts:
+        return []
+
+    dim = dim or embedding_dim()
+    request = _embed_request(texts, dim)
+    if request is None:
+        return _dummy_embeddings(texts, dim)
+
+    url, payload, headers = request
+    try:
+        data = await apost_json(url, payload, headers=headers, timeout=DEFAULT_TIMEOUT_S)
+        return _fit_dim(_embeddings_from_response(data), dim)
+    except Exception:
+        return _dummy_embeddings(texts, dim)
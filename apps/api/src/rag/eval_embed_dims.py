@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.rag.embeddings import embed_texts
+from src.rag.reindex import _pages
+from src.rag.store import logical_collection_names, vector_collection
+
+
+DEFAULT_DIMS = (256, 512, 1024, 1536)
+
+
+def load_labeled_queries(path: str | Path) -> list[dict]:
+    """JSONL of {"query": ..., "relevant_ids": [chunk ids]} and/or {"relevant_source_ids": [source ids]}."""
+    queries: list[dict] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        relevant = [f"id:{cid}" for cid in item.get("relevant_ids") or []]
+        relevant += [f"source:{sid}" for sid in item.get("relevant_source_ids") or []]
+        if item.get("query") and relevant:
+            queries.append({"query": str(item["query"]), "relevant": set(relevant)})
+    return queries
+
+
+def _corpus(batch_size: int) -> tuple[list[str], list[str], list[str | None]]:
+    ids: list[str] = []
+    documents: list[str] = []
+    sources: list[str | None] = []
+    for name in logical_collection_names():
+        for page in _pages(vector_collection(name), batch_size, ["documents", "metadatas"]):
+            metadatas = page.get("metadatas") or [None] * len(page["ids"])
+            ids.extend(page["ids"])
+            documents.extend(str(doc or "") for doc in page.get("documents") or [None] * len(page["ids"]))
+            sources.extend((meta or {}).get("source_id") for meta in metadatas)
+    return ids, documents, sources
+
+
+def _embed_all(texts: list[str], dim: int, batch_size: int) -> np.ndarray:
+    rows: list[list[float]] = []
+    for start in range(0, len(texts), batch_size):
+        rows.extend(embed_texts(texts[start : start + batch_size], dim=dim))
+    return _unit_rows(np.asarray(rows, dtype=np.float32))
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def evaluate(
+    queries: list[dict],
+    *,
+    dims: tuple[int, ...] = DEFAULT_DIMS,
+    k: int = 10,
+    batch_size: int = 64,
+    truncate: bool = False,
+) -> list[dict]:
+    """Recall@k of exact cosine search over the stored chunks, per embedding dimension.
+
+    A query's recall is the share of its relevant keys (chunk ids, or source ids matched by any chunk of that
+    source) found in its top k. The corpus is embedded again at each dimension, which costs one embedding pass per
+    dimension; with truncate it is embedded once at the largest and cut down, the Matryoshka shortcut.
+    """
+    ids, documents, sources = _corpus(max(1, int(batch_size)))
+    if not ids or not queries:
+        return []
+    keys = [({f"id:{cid}"} | ({f"source:{sid}"} if sid else set())) for cid, sid in zip(ids, sources)]
+    k = max(1, min(int(k), len(ids)))
+    texts = [item["query"] for item in queries]
+    full_docs = full_queries = None
+    if truncate:
+        full_docs = _embed_all(documents, max(dims), batch_size)
+        full_queries = _embed_all(texts, max(dims), batch_size)
+
+    rows: list[dict] = []
+    for dim in sorted(dims):
+        if truncate:
+            doc_vectors, query_vectors = _unit_rows(full_docs[:, :dim]), _unit_rows(full_queries[:, :dim])
+        else:
+            doc_vectors, query_vectors = _embed_all(documents, dim, batch_size), _embed_all(texts, dim, batch_size)
+        recalls: list[float] = []
+        latencies_ms: list[float] = []
+        for item, query in zip(queries, query_vectors):
+            started = time.perf_counter()
+            scores = doc_vectors @ query
+            top = np.argpartition(-scores, k - 1)[:k]
+            latencies_ms.append((time.perf_counter() - started) * 1000.0)
+            found = set().union(*(keys[i] for i in top)) & item["relevant"]
+            recalls.append(len(found) / len(item["relevant"]))
+        rows.append(
+            {
+                "dim": int(doc_vectors.shape[1]),
+                "requested_dim": dim,
+                "k": k,
+                "queries": len(queries),
+                "chunks": len(ids),
+                "recall": round(float(np.mean(recalls)), 4),
+                "index_mb": round(doc_vectors.nbytes / 1e6, 3),
+                "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+            }
+        )
+    return rows
+
+
+def _int_tuple(raw: str) -> tuple[int, ...]:
+    return tuple(int(item) for item in raw.split(",") if item.strip())
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Retrieval recall per embedding dimension on a labeled query set.")
+    parser.add_argument("--queries", required=True, help="JSONL with query and relevant_ids / relevant_source_ids")
+    parser.add_argument("--dims", type=_int_tuple, default=DEFAULT_DIMS, help="comma-separated, e.g. 256,512,1024")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64, help="texts per embedding request")
+    parser.add_argument("--truncate", action="store_true", help="embed once at the largest dim and truncate")
+    args = parser.parse_args(argv)
+    queries = load_labeled_queries(args.queries)
+    rows = evaluate(queries, dims=args.dims, k=args.k, batch_size=args.batch_size, truncate=args.truncate)
+    print(json.dumps(rows, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from src.core.deps import get_chroma_client
+from src.core.settings import get_settings
+from src.rag.reindex import _COPY_INCLUDE, _pages, _rows
+from src.rag.store import (
+    COLLECTION_NAME,
+    active_collection_name,
+    get_collection,
+    partition_collection_name,
+    partition_for_metadata,
+    partitioned,
+    switch_collection_alias,
+)
+
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; concurrent runs then rely on idempotent upserts.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+_LOCK_FILE = "migrate_partitions.lock"
+
+
+@contextmanager
+def _migration_lock() -> Iterator[None]:
+    """Serialise migrations among the processes sharing CHROMA_DIR, e.g. every API worker at startup."""
+    if fcntl is None:
+        yield
+        return
+    path = Path(get_settings().chroma_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / _LOCK_FILE, "a+b") as handle:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def _legacy_collection(client):
+    name = active_collection_name(COLLECTION_NAME)
+    if name not in {collection.name for collection in client.list_collections()}:
+        return None
+    return client.get_collection(name=name)
+
+
+def migrate_to_partitions(*, batch_size: int = 500, keep_old: bool = False) -> dict:
+    """Move chunks from the single job_coach collection into the per-source_type collections.
+
+    Embeddings are copied as stored. Upserts make the move idempotent, so an interrupted run can simply run
+    again. Concurrent runs queue on a file lock in CHROMA_DIR, so when every worker calls this at startup one of
+    them copies the chunks and the rest find nothing left to move.
+    """
+    if not partitioned():
+        return {"ok": True, "migrated": 0, "skipped": "CHROMA_PARTITIONING=off"}
+    with _migration_lock():
+        return _migrate(max(1, int(batch_size)), keep_old)
+
+
+def _migrate(batch_size: int, keep_old: bool) -> dict:
+    client = get_chroma_client()
+    legacy = _legacy_collection(client)
+    if legacy is None:
+        return {"ok": True, "migrated": 0}
+
+    counts: dict[str, int] = {}
+    for page in _pages(legacy, batch_size, _COPY_INCLUDE):
+        groups: dict[str, list[int]] = {}
+        for idx, meta in enumerate(page.get("metadatas") or [None] * len(page["ids"])):
+            groups.setdefault(partition_for_metadata(meta), []).append(idx)
+        for partition, positions in groups.items():
+            get_collection(partition_collection_name(partition)).upsert(**_rows(page, positions))
+            counts[partition] = counts.get(partition, 0) + len(positions)
+
+    if not keep_old:
+        client.delete_collection(name=legacy.name)
+        switch_collection_alias(None, COLLECTION_NAME)
+    migrated = sum(counts.values())
+    logger.info("migrated %s chunks from %s into partitions %s", migrated, legacy.name, counts)
+    return {"ok": True, "migrated": migrated, "from": legacy.name, "partitions": counts}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Split the job_coach collection into per-source_type collections.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--keep-old", action="store_true", help="keep the single collection after copying")
+    args = parser.parse_args(argv)
+    print(json.dumps(migrate_to_partitions(batch_size=args.batch_size, keep_old=args.keep_old), indent=2))
+
+
+if __name__ == "__main__":
+    main()
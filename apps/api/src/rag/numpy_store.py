@@ -0,0 +1,578 @@
+from __future__ import annotations
+
+import json
+import operator
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+from src.core.settings import get_settings
+from src.rag.quantization import approx_dots, approx_sq_norms, dequantize, quantization_mode, quantize
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; writes are then only serialised per process.
+    fcntl = None
+
+
+SPACES = ("cosine", "l2", "ip")
+_MANIFEST = "manifest.json"
+# Beside the collection directory rather than in it, so the lock stays put when reindex swaps the directory.
+_LOCK_SUFFIX = ".lock"
+# Compact once this share of stored rows is superseded or deleted, or the segment list grows this long.
+_COMPACT_DEAD_RATIO = 0.3
+_COMPACT_MAX_SEGMENTS = 16
+# Filters matching less than this share of a segment score a gathered copy of the rows instead of all of them.
+_GATHER_SELECTIVITY = 0.5
+_DEFAULT_INCLUDE = ("documents", "metadatas")
+
+
+class _Column:
+    """One metadata key across a segment, dictionary-encoded: codes[row] indexes values, -1 when the key is absent."""
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self, codes: np.ndarray, values: list):
+        self.codes = codes
+        self.values = values
+
+
+def _build_columns(metadatas: list[dict | None]) -> dict[str, _Column]:
+    n = len(metadatas)
+    lookups: dict[str, dict[tuple[type, object], int]] = {}
+    values: dict[str, list] = {}
+    codes: dict[str, np.ndarray] = {}
+    for row, meta in enumerate(metadatas):
+        for key, value in (meta or {}).items():
+            lookup = lookups.get(key)
+            if lookup is None:
+                lookup = lookups[key] = {}
+                values[key] = []
+                codes[key] = np.full(n, -1, dtype=np.int32)
+            # Keyed by type too, so True and 1 stay distinct values as they are in Chroma filters.
+            marker = (type(value), value if isinstance(value, (str, int, float, bool)) else json.dumps(value))
+            code = lookup.get(marker)
+            if code is None:
+                code = lookup[marker] = len(values[key])
+                values[key].append(value)
+            codes[key][row] = code
+    return {key: _Column(codes[key], values[key]) for key in lookups}
+
+
+def _compare(fn, value, arg) -> bool:
+    try:
+        return bool(fn(value, arg))
+    except TypeError:
+        return False
+
+
+_OPERATORS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+}
+
+
+@dataclass
+class _Segment:
+    name: str
+    ids: list[str]
+    documents: list[str | None]
+    metadatas: list[dict | None]
+    # float32 (rows, dim), memory-mapped from the segment's .npy file; normalised rows for the cosine space. None
+    # for a quantized segment written without the float rescoring tier.
+    vectors: np.ndarray | None
+    # What queries scan: the vectors themselves, or their float16 / int8 codes (with per-row scales for int8) when
+    # the segment was written under EMBEDDING_QUANTIZATION. Candidates are then rescored against `vectors`, if kept.
+    codes: np.ndarray
+    scales: np.ndarray | None
+    # Squared norms of the scanned rows, for the l2 space; empty otherwise.
+    sq_norms: np.ndarray
+    columns: dict[str, _Column]
+    # Rows not superseded by a later upsert or delete. Replaced, never mutated, so readers can keep a snapshot.
+    live: np.ndarray
+
+    @property
+    def rescorable(self) -> bool:
+        return self.vectors is not None and self.codes is not self.vectors
+
+    def float_rows(self, rows: np.ndarray) -> np.ndarray:
+        if self.vectors is not None:
+            return np.asarray(self.vectors[rows], dtype=np.float32)
+        return dequantize(self.codes[rows], self.scales[rows] if self.scales is not None else None)
+
+    def field_mask(self, key: str, condition) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        column = self.columns.get(key)
+        mask = np.ones(len(self.ids), dtype=bool)
+        for op, arg in condition.items():
+            fn = _OPERATORS.get(op)
+            if fn is None:
+                raise ValueError(f"unsupported where operator {op!r}")
+            if column is None:
+                # As in Chroma, a row without the key matches no condition on it.
+                return np.zeros(len(self.ids), dtype=bool)
+            matches = np.fromiter((_compare(fn, value, arg) for value in column.values), dtype=bool)
+            present = column.codes >= 0
+            mask &= present & matches[np.where(present, column.codes, 0)]
+        return mask
+
+    def where_mask(self, where: dict) -> np.ndarray:
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.where_mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(len(self.ids), dtype=bool)
+                for clause in condition:
+                    any_mask |= self.where_mask(clause)
+                mask &= any_mask
+            elif str(key).startswith("$"):
+                raise ValueError(f"unsupported where operator {key!r}")
+            else:
+                mask &= self.field_mask(key, condition)
+        return mask
+
+    def selected(self, where: dict | None) -> np.ndarray:
+        return self.live & self.where_mask(where) if where else self.live
+
+
+@dataclass
+class _State:
+    epoch: int
+    space: str
+    dim: int | None
+    segments: list[_Segment]
+    # Segment files already applied, data and delete ones, in manifest order.
+    applied: list[str]
+    locations: dict[str, tuple[int, int]]
+    # (inode, mtime, size) of the manifest this state was built from; os.replace gives each version a new inode.
+    manifest_stamp: tuple
+    # Random per store directory, so a directory swapped in by reindex --embed is loaded from scratch.
+    uid: str = ""
+    metadata: dict = field(default_factory=dict)
+
+
+class NumpyCollection:
+    """Exact-search collection on NumPy arrays, a drop-in for the part of a Chroma collection the store uses.
+
+    Writes append immutable segments: vectors in a float32 .npy file that is memory-mapped back, ids, documents
+    and metadata in a .json file. An upsert supersedes older rows of the same ids and a delete appends a segment of
+    ids only; once enough rows are dead the live ones are compacted into a single segment. manifest.json lists the
+    segments, is replaced atomically and is re-read when its mtime changes, so every worker sees the others' writes.
+    """
+
+    def __init__(self, path: Path, *, name: str, space: str = "cosine"):
+        self.name = name
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._default_space = space if space in SPACES else "cosine"
+        self._state = _State(0, self._default_space, None, [], [], {}, ())
+
+    @property
+    def space(self) -> str:
+        return self._snapshot().space
+
+    @property
+    def metadata(self) -> dict | None:
+        return dict(self._snapshot().metadata) or None
+
+    def _manifest_path(self) -> Path:
+        return self.path / _MANIFEST
+
+    def _read_manifest(self) -> dict:
+        try:
+            return json.loads(self._manifest_path().read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {
+                "uid": uuid.uuid4().hex,
+                "epoch": 0,
+                "space": self._default_space,
+                "dim": None,
+                "next": 0,
+                "segments": [],
+            }
+
+    def _write_manifest(self, manifest: dict) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        tmp = self.path / f"{_MANIFEST}.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp, self._manifest_path())
+
+    @contextmanager
+    def _write_lock(self) -> Iterator[None]:
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self.path.with_name(f"{self.path.name}{_LOCK_SUFFIX}"), "a+b") as handle:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def _write_vectors(self, name: str, vectors: np.ndarray) -> dict:
+        """Save a segment's vectors: float32, or the codes of EMBEDDING_QUANTIZATION in their place. The float32
+        file is kept beside the codes only as the rescoring tier, when VECTOR_RESCORE_FACTOR is above 0."""
+        mode = quantization_mode()
+        float_tier = mode == "none" or int(get_settings().vector_rescore_factor) > 0
+        if float_tier:
+            np.save(self.path / f"{name}.npy", vectors)
+        if mode != "none":
+            codes, scales = quantize(vectors, mode)
+            np.save(self.path / f"{name}.codes.npy", codes)
+            if scales is not None:
+                np.save(self.path / f"{name}.scales.npy", scales)
+        return {"quantization": mode, "float_tier": float_tier}
+
+    def _load_segment(self, entry: dict, space: str) -> _Segment:
+        name = entry["name"]
+        rows = json.loads((self.path / f"{name}.json").read_text(encoding="utf-8"))
+        vectors = np.load(self.path / f"{name}.npy", mmap_mode="r") if entry.get("float_tier", True) else None
+        codes, scales = vectors, None
+        if entry.get("quantization", "none") != "none":
+            codes = np.load(self.path / f"{name}.codes.npy", mmap_mode="r")
+            scales_path = self.path / f"{name}.scales.npy"
+            scales = np.load(scales_path) if scales_path.exists() else None
+        # From the codes, so an l2 segment does not page in its whole float32 tier at load.
+        sq_norms = approx_sq_norms(codes, scales) if space == "l2" else np.empty(0, dtype=np.float32)
+        return _Segment(
+            name=name,
+            ids=rows["ids"],
+            documents=rows["documents"],
+            metadatas=rows["metadatas"],
+            vectors=vectors,
+            codes=codes,
+            scales=scales,
+            sq_norms=sq_norms,
+            columns=_build_columns(rows["metadatas"]),
+            live=np.ones(len(rows["ids"]), dtype=bool),
+        )
+
+    def _stamp(self) -> tuple:
+        try:
+            stat = self._manifest_path().stat()
+        except FileNotFoundError:
+            return ()
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> _State:
+        """Apply segments other workers (or this one) added since the last look; reload fully after a compaction."""
+        with self._lock:
+            stamp = self._stamp()
+            if stamp == self._state.manifest_stamp:
+                return self._state
+            for _ in range(3):
+                manifest = self._read_manifest()
+                try:
+                    self._state = self._apply_manifest(manifest, stamp)
+                    break
+                except FileNotFoundError:
+                    # A compaction removed the files of the manifest just read; read the new one.
+                    stamp = self._stamp()
+            return self._state
+
+    def _apply_manifest(self, manifest: dict, stamp: tuple) -> _State:
+        state = self._state
+        names = [entry["name"] for entry in manifest.get("segments") or []]
+        uid = str(manifest.get("uid") or "")
+        if (
+            uid != state.uid
+            or int(manifest.get("epoch") or 0) != state.epoch
+            or names[: len(state.applied)] != state.applied
+        ):
+            space = str(manifest.get("space") or self._default_space)
+            state = _State(int(manifest.get("epoch") or 0), space, manifest.get("dim"), [], [], {}, stamp, uid)
+        else:
+            state = _State(
+                state.epoch,
+                state.space,
+                manifest.get("dim"),
+                list(state.segments),
+                list(state.applied),
+                dict(state.locations),
+                stamp,
+                uid,
+            )
+        state.metadata = dict(manifest.get("metadata") or {})
+        for entry in (manifest.get("segments") or [])[len(state.applied):]:
+            if entry.get("kind") == "delete":
+                ids = json.loads((self.path / f"{entry['name']}.json").read_text(encoding="utf-8"))["ids"]
+                self._apply_delete(state, ids)
+            else:
+                self._apply_segment(state, self._load_segment(entry, state.space))
+            state.applied.append(entry["name"])
+        return state
+
+    @staticmethod
+    def _kill(state: _State, locations: list[tuple[int, int]]) -> None:
+        by_segment: dict[int, list[int]] = {}
+        for seg_idx, row in locations:
+            by_segment.setdefault(seg_idx, []).append(row)
+        for seg_idx, rows in by_segment.items():
+            segment = state.segments[seg_idx]
+            live = segment.live.copy()
+            live[rows] = False
+            state.segments[seg_idx] = replace(segment, live=live)
+
+    def _apply_segment(self, state: _State, segment: _Segment) -> None:
+        seg_idx = len(state.segments)
+        state.segments.append(segment)
+        dead: list[tuple[int, int]] = []
+        for row, cid in enumerate(segment.ids):
+            previous = state.locations.get(cid)
+            if previous is not None:
+                dead.append(previous)
+            state.locations[cid] = (seg_idx, row)
+        self._kill(state, dead)
+
+    def _apply_delete(self, state: _State, ids: list[str]) -> None:
+        self._kill(state, [loc for loc in (state.locations.pop(cid, None) for cid in ids) if loc is not None])
+
+    def _append(self, kind: str, ids: list[str], vectors: np.ndarray | None = None, **columns) -> None:
+        with self._write_lock():
+            self._refresh()
+            manifest = self._read_manifest()
+            seq = int(manifest.get("next") or 0)
+            name = f"seg-{seq:08d}"
+            entry = {"name": name, "kind": kind, "rows": len(ids)}
+            if vectors is not None:
+                if manifest.get("dim") is None:
+                    manifest["dim"] = int(vectors.shape[1])
+                elif int(manifest["dim"]) != vectors.shape[1]:
+                    raise ValueError(
+                        f"Embedding dimension {vectors.shape[1]} does not match collection dimensionality "
+                        f"{manifest['dim']}"
+                    )
+                entry.update(self._write_vectors(name, vectors))
+            rows = {"ids": ids, **columns}
+            (self.path / f"{name}.json").write_text(json.dumps(rows, ensure_ascii=False), encoding="utf-8")
+            manifest["space"] = manifest.get("space") or self._default_space
+            manifest["next"] = seq + 1
+            manifest.setdefault("segments", []).append(entry)
+            self._write_manifest(manifest)
+            state = self._refresh()
+            total = sum(len(segment.ids) for segment in state.segments)
+            dead = total - sum(int(segment.live.sum()) for segment in state.segments)
+            if len(manifest["segments"]) > _COMPACT_MAX_SEGMENTS or (total and dead / total > _COMPACT_DEAD_RATIO):
+                self._compact(manifest)
+
+    def _compact(self, manifest: dict) -> None:
+        state = self._state
+        seq = int(manifest.get("next") or 0)
+        name = f"seg-{seq:08d}"
+        ids: list[str] = []
+        documents: list = []
+        metadatas: list = []
+        vectors: list[np.ndarray] = []
+        for segment in state.segments:
+            rows = np.flatnonzero(segment.live)
+            ids.extend(segment.ids[i] for i in rows)
+            documents.extend(segment.documents[i] for i in rows)
+            metadatas.extend(segment.metadatas[i] for i in rows)
+            vectors.append(segment.float_rows(rows))
+        segments = []
+        if ids:
+            extra = self._write_vectors(name, np.vstack(vectors))
+            rows_json = {"ids": ids, "documents": documents, "metadatas": metadatas}
+            (self.path / f"{name}.json").write_text(json.dumps(rows_json, ensure_ascii=False), encoding="utf-8")
+            segments.append({"name": name, "kind": "data", "rows": len(ids), **extra})
+        old = [entry["name"] for entry in manifest.get("segments") or []]
+        self._write_manifest(
+            {**manifest, "epoch": int(manifest.get("epoch") or 0) + 1, "next": seq + 1, "segments": segments}
+        )
+        # Open memmaps keep unlinked files readable, so queries running on the old state finish normally.
+        for old_name in old:
+            for suffix in (".npy", ".codes.npy", ".scales.npy", ".json"):
+                (self.path / f"{old_name}{suffix}").unlink(missing_ok=True)
+        self._refresh()
+
+    def modify(self, *, metadata: dict | None = None) -> None:
+        """Replace the collection metadata, as Chroma's Collection.modify does."""
+        with self._write_lock():
+            manifest = self._read_manifest()
+            manifest["metadata"] = dict(metadata or {})
+            manifest["space"] = manifest.get("space") or self._default_space
+            self._write_manifest(manifest)
+            self._refresh()
+
+    def compact(self) -> None:
+        with self._write_lock():
+            self._refresh()
+            self._compact(self._read_manifest())
+
+    def _snapshot(self) -> _State:
+        return self._refresh()
+
+    def _prepare(self, embeddings, space: str) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if space == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def upsert(self, *, ids, embeddings, documents=None, metadatas=None) -> None:
+        ids = [str(cid) for cid in ids]
+        if not ids:
+            return
+        vectors = self._prepare(embeddings, self._snapshot().space)
+        if len(vectors) != len(ids):
+            raise ValueError(f"got {len(vectors)} embeddings for {len(ids)} ids")
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = [meta or None for meta in metadatas] if metadatas is not None else [None] * len(ids)
+        self._append("data", ids, vectors, documents=documents, metadatas=metadatas)
+
+    add = upsert
+
+    def count(self) -> int:
+        return sum(int(segment.live.sum()) for segment in self._snapshot().segments)
+
+    def _matching(self, state: _State, ids, where: dict | None) -> Iterator[tuple[_Segment, np.ndarray]]:
+        wanted = set(ids) if ids is not None else None
+        for segment in state.segments:
+            mask = segment.selected(where)
+            if wanted is not None:
+                mask = mask & np.fromiter((cid in wanted for cid in segment.ids), dtype=bool, count=len(segment.ids))
+            rows = np.flatnonzero(mask)
+            if len(rows):
+                yield segment, rows
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=_DEFAULT_INCLUDE) -> dict:
+        state = self._snapshot()
+        include = list(include or [])
+        skip = max(0, int(offset or 0))
+        remaining = None if limit is None else max(0, int(limit))
+        out: dict = {"ids": [], **{field: [] for field in include if field != "embeddings"}}
+        vectors: list[np.ndarray] = []
+        for segment, rows in self._matching(state, ids, where):
+            if skip >= len(rows):
+                skip -= len(rows)
+                continue
+            rows = rows[skip:]
+            skip = 0
+            if remaining is not None:
+                rows = rows[:remaining]
+                remaining -= len(rows)
+            out["ids"].extend(segment.ids[i] for i in rows)
+            if "documents" in include:
+                out["documents"].extend(segment.documents[i] for i in rows)
+            if "metadatas" in include:
+                out["metadatas"].extend(segment.metadatas[i] for i in rows)
+            if "embeddings" in include:
+                vectors.append(segment.float_rows(rows))
+            if remaining == 0:
+                break
+        if "embeddings" in include:
+            dim = int(state.dim or 0)
+            out["embeddings"] = np.vstack(vectors) if vectors else np.empty((0, dim), dtype=np.float32)
+        return out
+
+    def delete(self, ids=None, where=None) -> None:
+        if ids is None and not where:
+            return
+        state = self._snapshot()
+        doomed = [segment.ids[i] for segment, rows in self._matching(state, ids, where) for i in rows]
+        if doomed:
+            self._append("delete", doomed)
+
+    def _distances(
+        self,
+        segment: _Segment,
+        rows: np.ndarray | None,
+        query: np.ndarray,
+        space: str,
+        *,
+        exact: bool = True,
+    ) -> np.ndarray:
+        """Distances to the rows (all when None): from the float32 tier when exact and the segment has one, else
+        from the scanned codes."""
+        if exact and segment.rescorable:
+            vectors = np.asarray(segment.vectors if rows is None else segment.vectors[rows], dtype=np.float32)
+            dots = vectors @ query
+            sq_norms = np.einsum("ij,ij->i", vectors, vectors) if space == "l2" else None
+        else:
+            codes = segment.codes if rows is None else segment.codes[rows]
+            scales = segment.scales if rows is None or segment.scales is None else segment.scales[rows]
+            dots = approx_dots(codes, scales, query)
+            sq_norms = (segment.sq_norms if rows is None else segment.sq_norms[rows]) if space == "l2" else None
+        if space == "l2":
+            return np.maximum(sq_norms - 2.0 * dots + float(query @ query), 0.0)
+        return 1.0 - dots
+
+    def query(self, query_embeddings, n_results: int = 10, where=None, include=_DEFAULT_INCLUDE) -> dict:
+        state = self._snapshot()
+        include = list(include or [])
+        queries = self._prepare(query_embeddings, state.space)
+        if state.dim is not None and queries.shape[1] != int(state.dim):
+            raise ValueError(
+                f"Query embedding dimension {queries.shape[1]} does not match collection dimensionality {state.dim}"
+            )
+        k = max(1, int(n_results))
+        rescore = max(0, int(get_settings().vector_rescore_factor))
+        masks = [(segment, segment.selected(where)) for segment in state.segments]
+        out: dict = {"ids": [], **{field: [] for field in include if field != "embeddings"}}
+        for query in queries:
+            found: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+            for seg_idx, (segment, mask) in enumerate(masks):
+                rows = np.flatnonzero(mask)
+                if not len(rows):
+                    continue
+                if len(rows) < len(mask) * _GATHER_SELECTIVITY:
+                    distances = self._distances(segment, rows, query, state.space, exact=False)
+                else:
+                    distances = self._distances(segment, None, query, state.space, exact=False)[rows]
+                if segment.rescorable and rescore:
+                    # Shortlist on the quantized codes, then rank the shortlist with the float32 vectors.
+                    if len(distances) > k * rescore:
+                        rows = rows[np.argpartition(distances, k * rescore - 1)[: k * rescore]]
+                    distances = self._distances(segment, rows, query, state.space)
+                if len(distances) > k:
+                    top = np.argpartition(distances, k - 1)[:k]
+                    rows, distances = rows[top], distances[top]
+                found.append((distances, np.full(len(rows), seg_idx), rows))
+            hits: list[tuple[float, int, int]] = []
+            if found:
+                distances, seg_idxs, rows = (np.concatenate(parts) for parts in zip(*found))
+                order = np.argsort(distances, kind="stable")[:k]
+                hits = [(float(distances[i]), int(seg_idxs[i]), int(rows[i])) for i in order]
+            out["ids"].append([state.segments[s].ids[r] for _, s, r in hits])
+            if "documents" in include:
+                out["documents"].append([state.segments[s].documents[r] for _, s, r in hits])
+            if "metadatas" in include:
+                out["metadatas"].append([state.segments[s].metadatas[r] for _, s, r in hits])
+            if "distances" in include:
+                out["distances"].append([d for d, _, _ in hits])
+        return out
+
+
+_COLLECTIONS: dict[Path, NumpyCollection] = {}
+_COLLECTIONS_LOCK = threading.Lock()
+
+
+def get_numpy_collection(name: str, *, space: str | None = None) -> NumpyCollection:
+    """The process-wide NumpyCollection for name under NUMPY_STORE_DIR. space only applies to a new collection."""
+    cfg = get_settings()
+    path = Path(cfg.numpy_store_dir) / name
+    with _COLLECTIONS_LOCK:
+        collection = _COLLECTIONS.get(path)
+        if collection is None:
+            space = str(space or cfg.chroma_space or "cosine").strip().lower()
+            collection = _COLLECTIONS[path] = NumpyCollection(path, name=name, space=space)
+    return collection
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import base64
+
+import numpy as np
+
+from src.core.settings import get_settings
+
+
+QUANTIZATIONS = ("none", "float16", "int8")
+# Rows upcast to float32 at a time when scoring quantized codes, which bounds the temporary copy per query.
+_BLOCK_ROWS = 32768
+_INT8_MAX = 127.0
+
+
+def quantization_mode(mode: str | None = None) -> str:
+    mode = str(mode or get_settings().embedding_quantization or "none").strip().lower()
+    if mode not in QUANTIZATIONS:
+        raise ValueError(f"EMBEDDING_QUANTIZATION must be one of {', '.join(QUANTIZATIONS)}, got {mode!r}")
+    return mode
+
+
+def quantize(vectors, mode: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """(codes, per-row scales) for a float matrix. int8 uses symmetric per-vector scaling, so each row keeps its
+    own range; float16 and none need no scales."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    if mode == "float16":
+        return vectors.astype(np.float16), None
+    if mode == "int8":
+        scales = np.abs(vectors).max(axis=1) / _INT8_MAX
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales[:, None]), -_INT8_MAX, _INT8_MAX).astype(np.int8)
+        return codes, scales
+    return vectors, None
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+    vectors = np.asarray(codes, dtype=np.float32)
+    return vectors * scales[:, None] if scales is not None else vectors
+
+
+def approx_dots(codes: np.ndarray, scales: np.ndarray | None, query: np.ndarray) -> np.ndarray:
+    """codes @ query without materialising the whole dequantized matrix."""
+    if codes.dtype == np.float32:
+        dots = codes @ query
+    else:
+        dots = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK_ROWS):
+            dots[start : start + _BLOCK_ROWS] = codes[start : start + _BLOCK_ROWS].astype(np.float32) @ query
+    return dots * scales if scales is not None else dots
+
+
+def approx_sq_norms(codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+    """Squared norms of the dequantized rows, upcast block by block like approx_dots."""
+    if codes.dtype == np.float32:
+        return np.einsum("ij,ij->i", codes, codes)
+    sq_norms = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), _BLOCK_ROWS):
+        block = codes[start : start + _BLOCK_ROWS].astype(np.float32)
+        sq_norms[start : start + _BLOCK_ROWS] = np.einsum("ij,ij->i", block, block)
+    return sq_norms * scales**2 if scales is not None else sq_norms
+
+
+def bytes_per_vector(dim: int, mode: str) -> int:
+    if mode == "float16":
+        return 2 * dim
+    if mode == "int8":
+        return dim + 4
+    return 4 * dim
+
+
+def encode_vector(vector, mode: str) -> str:
+    """Base64 text for storing one vector in Redis. Quantized forms carry a prefix; bare base64 is float32, which is
+    also how vectors were stored before quantization existed."""
+    codes, scales = quantize(vector, mode)
+    if mode == "float16":
+        return "f16:" + base64.b64encode(codes.tobytes()).decode("ascii")
+    if mode == "int8":
+        return "i8:" + base64.b64encode(scales.tobytes() + codes.tobytes()).decode("ascii")
+    return base64.b64encode(codes.tobytes()).decode("ascii")
+
+
+def decode_vector(raw: str | bytes) -> np.ndarray:
+    text = raw.decode("ascii") if isinstance(raw, bytes) else str(raw)
+    if text.startswith("f16:"):
+        return np.frombuffer(base64.b64decode(text[4:]), dtype=np.float16).astype(np.float32)
+    if text.startswith("i8:"):
+        data = base64.b64decode(text[3:])
+        scale = np.frombuffer(data[:4], dtype=np.float32)[0]
+        return np.frombuffer(data[4:], dtype=np.int8).astype(np.float32) * scale
+    return np.frombuffer(base64.b64decode(text), dtype=np.float32)
@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+from typing import Iterator
+
+import numpy as np
+
+from src.core.deps import get_chroma_client
+from src.rag.embeddings import embed_texts
+from src.rag.numpy_store import NumpyCollection, get_numpy_collection
+from src.rag.store import (
+    COLLECTION_NAME,
+    active_collection_name,
+    check_embedding_dim,
+    collection_space,
+    hnsw_configuration,
+    logical_collection_names,
+    switch_collection_alias,
+    vector_backend,
+)
+
+
+_COPY_INCLUDE = ["embeddings", "documents", "metadatas"]
+
+
+def _pages(collection, batch_size: int, include: list[str]) -> Iterator[dict]:
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            return
+        yield page
+        offset += len(ids)
+        if len(ids) < batch_size:
+            return
+
+
+def _rows(page: dict, positions: list[int] | None = None, *, reembed: bool = False) -> dict:
+    """Rows of a page ready for add/upsert; with reembed the documents are embedded again instead of copied."""
+    ids = page.get("ids") or []
+    positions = list(range(len(ids))) if positions is None else positions
+    documents = page.get("documents") or [None] * len(ids)
+    metadatas = page.get("metadatas") or [None] * len(ids)
+    if reembed:
+        embeddings = embed_texts([str(documents[i] or "") for i in positions])
+    else:
+        embeddings = [page["embeddings"][i] for i in positions]
+    return {
+        "ids": [ids[i] for i in positions],
+        "embeddings": embeddings,
+        "documents": [documents[i] for i in positions],
+        # Chroma rejects empty metadata dicts on insert.
+        "metadatas": [metadatas[i] or None for i in positions],
+    }
+
+
+def _page_include(reembed: bool) -> list[str]:
+    return ["documents", "metadatas"] if reembed else _COPY_INCLUDE
+
+
+def _copy(source, shadow, batch_size: int, *, reembed: bool = False) -> int:
+    copied = 0
+    for page in _pages(source, batch_size, _page_include(reembed)):
+        rows = _rows(page, reembed=reembed)
+        if not copied and rows["ids"]:
+            check_embedding_dim(shadow, len(rows["embeddings"][0]), record=True)
+        shadow.add(**rows)
+        copied += len(page["ids"])
+    return copied
+
+
+def _catch_up(source, shadow, batch_size: int, *, reembed: bool = False, state: dict | None = None) -> dict:
+    """Bring shadow in line with writes that landed on source while it was being built.
+
+    state, when given, is filled with the (document, metadata) of every source row seen, for _late_writes.
+    """
+    seen: set[str] = set()
+    upserted = 0
+    for page in _pages(source, batch_size, _page_include(reembed)):
+        ids = page["ids"]
+        seen.update(ids)
+        current = shadow.get(ids=ids, include=["documents", "metadatas"])
+        have = {
+            cid: (doc, meta or None)
+            for cid, doc, meta in zip(
+                current.get("ids") or [],
+                current.get("documents") or [],
+                current.get("metadatas") or [],
+            )
+        }
+        documents = page.get("documents") or [None] * len(ids)
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        if state is not None:
+            state.update((cid, (documents[i], metadatas[i] or None)) for i, cid in enumerate(ids))
+        changed = [i for i, cid in enumerate(ids) if have.get(cid) != (documents[i], metadatas[i] or None)]
+        if changed:
+            shadow.upsert(**_rows(page, changed, reembed=reembed))
+            upserted += len(changed)
+    stale = [cid for cid in shadow.get(include=[]).get("ids") or [] if cid not in seen]
+    if stale:
+        shadow.delete(ids=stale)
+    return {"upserted": upserted, "deleted": len(stale)}
+
+
+def _late_writes(source, shadow, before: dict, batch_size: int, *, reembed: bool = False) -> dict:
+    """Copy the writes that reached source after its state before was taken.
+
+    Unlike _catch_up this leaves every other shadow row alone, so it can run after the switch, when new writes
+    already go to shadow.
+    """
+    seen: set[str] = set()
+    upserted = 0
+    for page in _pages(source, batch_size, _page_include(reembed)):
+        ids = page["ids"]
+        seen.update(ids)
+        documents = page.get("documents") or [None] * len(ids)
+        metadatas = page.get("metadatas") or [None] * len(ids)
+        changed = [i for i, cid in enumerate(ids) if before.get(cid) != (documents[i], metadatas[i] or None)]
+        if changed:
+            shadow.upsert(**_rows(page, changed, reembed=reembed))
+            upserted += len(changed)
+    gone = [cid for cid in before if cid not in seen]
+    if gone:
+        shadow.delete(ids=gone)
+    return {"upserted": upserted, "deleted": len(gone)}
+
+
+def _exact_distances(vectors: np.ndarray, query: np.ndarray, space: str) -> np.ndarray:
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * max(float(np.linalg.norm(query)), 1e-12)
+        return 1.0 - (vectors @ query) / np.maximum(norms, 1e-12)
+    if space == "ip":
+        return 1.0 - vectors @ query
+    diff = vectors - query
+    return np.einsum("ij,ij->i", diff, diff)
+
+
+def _hnsw_ef_search(collection) -> int | None:
+    configuration = getattr(collection, "configuration", None) or {}
+    value = (configuration.get("hnsw") or {}).get("ef_search")
+    return int(value) if value else None
+
+
+def recall_report(
+    collection,
+    *,
+    ef_search_values: list[int] | None = None,
+    sample: int = 50,
+    k: int = 10,
+    seed: int = 0,
+) -> list[dict]:
+    """Recall@k against brute-force search and query latency, per ef_search value.
+
+    Stored embeddings are the probe queries. ef_search is changed on the collection while measuring and restored
+    afterwards, so a sweep is refused on a collection that serves traffic: it would slow that traffic down, and
+    get_collection() in any worker would reset ef_search under the measurement. reindex sweeps its shadow.
+    """
+    if ef_search_values and collection.name in {active_collection_name(name) for name in logical_collection_names()}:
+        raise ValueError(f"{collection.name} is serving traffic; sweep ef_search on a reindex shadow instead")
+    ids: list[str] = []
+    chunks: list[np.ndarray] = []
+    for page in _pages(collection, 1000, ["embeddings"]):
+        ids.extend(page["ids"])
+        chunks.append(np.asarray(page["embeddings"], dtype=np.float32))
+    if not ids:
+        return []
+    vectors = np.vstack(chunks)
+    space = collection_space(collection)
+    k = max(1, min(int(k), len(ids)))
+    picks = random.Random(seed).sample(range(len(ids)), min(max(1, int(sample)), len(ids)))
+    exact = [
+        {ids[i] for i in np.argsort(_exact_distances(vectors, vectors[idx], space), kind="stable")[:k]}
+        for idx in picks
+    ]
+
+    original = _hnsw_ef_search(collection)
+    current = original
+    rows: list[dict] = []
+    try:
+        for ef_search in ef_search_values or [original]:
+            if ef_search and ef_search != current:
+                collection.modify(configuration={"hnsw": {"ef_search": int(ef_search)}})
+                current = ef_search
+            latencies_ms: list[float] = []
+            hits = 0
+            for expected, idx in zip(exact, picks):
+                started = time.perf_counter()
+                got = collection.query(query_embeddings=[vectors[idx].tolist()], n_results=k, include=[])
+                latencies_ms.append((time.perf_counter() - started) * 1000.0)
+                hits += len(expected.intersection((got.get("ids") or [[]])[0]))
+            rows.append(
+                {
+                    "collection": collection.name,
+                    "space": space,
+                    "ef_search": current,
+                    "k": k,
+                    "queries": len(picks),
+                    "recall": round(hits / (len(picks) * k), 4),
+                    "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+                    "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+                }
+            )
+    finally:
+        if original and current != original:
+            collection.modify(configuration={"hnsw": {"ef_search": original}})
+    return rows
+
+
+def reindex(
+    *,
+    name: str = COLLECTION_NAME,
+    space: str | None = None,
+    m: int | None = None,
+    ef_construction: int | None = None,
+    ef_search: int | None = None,
+    ef_search_sweep: list[int] | None = None,
+    batch_size: int = 500,
+    sample: int = 50,
+    k: int = 10,
+    keep_old: bool = False,
+    reembed: bool = False,
+    settle_s: float = 5.0,
+) -> dict:
+    """Rebuild the collection with new HNSW parameters while it keeps serving.
+
+    Embeddings are copied into a shadow collection (or, with reembed, computed again from the documents at the
+    current ZHIPUAI_EMBED_DIM), which is then caught up with writes made during the build and swapped in by
+    repointing the alias of the logical collection name. Writes that resolved the old name just before the switch
+    are given settle_s to land, then copied across before the old collection is dropped.
+    """
+    client = get_chroma_client()
+    source_name = active_collection_name(name)
+    source = client.get_or_create_collection(name=source_name)
+    configuration = hnsw_configuration(space=space, m=m, ef_construction=ef_construction, ef_search=ef_search)
+    shadow_name = f"{name}_{time.strftime('%Y%m%d%H%M%S')}"
+    # The shadow records its own embedding_dim on the first copied page.
+    metadata = {key: value for key, value in (source.metadata or {}).items() if key != "embedding_dim"} or None
+    shadow = client.create_collection(name=shadow_name, configuration=configuration, metadata=metadata)
+    try:
+        copied = _copy(source, shadow, max(1, int(batch_size)), reembed=reembed)
+        report = {
+            "before": recall_report(source, sample=sample, k=k),
+            "after": recall_report(shadow, ef_search_values=ef_search_sweep, sample=sample, k=k),
+        }
+        state: dict = {}
+        caught_up = _catch_up(source, shadow, max(1, int(batch_size)), reembed=reembed, state=state)
+    except BaseException:
+        client.delete_collection(shadow_name)
+        raise
+
+    switch_collection_alias(shadow_name, name)
+    time.sleep(max(0.0, float(settle_s)))
+    late = _late_writes(source, shadow, state, max(1, int(batch_size)), reembed=reembed)
+    if not keep_old and source_name != shadow_name:
+        client.delete_collection(source_name)
+    return {
+        "collection": name,
+        "previous": source_name,
+        "active": shadow_name,
+        "configuration": configuration,
+        "reembedded": reembed,
+        "copied": copied,
+        "caught_up": caught_up,
+        "late_writes": late,
+        "report": report,
+    }
+
+
+def reembed_numpy(name: str = COLLECTION_NAME, *, batch_size: int = 500) -> dict:
+    """Embed a numpy-backend collection again, e.g. after ZHIPUAI_EMBED_DIM changed.
+
+    The new vectors are built in a sibling directory, caught up with writes made meanwhile, and swapped in by two
+    renames; other workers reload on their next request. The last catch-up and the renames run under the live
+    collection's write lock, so writes made then wait and land in the new directory instead of the retired one.
+    Searches in the instant between the renames see an empty collection.
+    """
+    live = get_numpy_collection(name)
+    batch_size = max(1, int(batch_size))
+    build_path = live.path.with_name(f"{live.path.name}.rebuild")
+    shutil.rmtree(build_path, ignore_errors=True)
+    shadow = NumpyCollection(build_path, name=name, space=live.space)
+    copied = _copy(live, shadow, batch_size, reembed=True)
+    # Most of the catch-up runs without blocking writers; the locked pass only sees what arrived during this one.
+    first = _catch_up(live, shadow, batch_size, reembed=True)
+    old_path = live.path.with_name(f"{live.path.name}.old")
+    with live._write_lock():
+        last = _catch_up(live, shadow, batch_size, reembed=True)
+        shadow.compact()
+        shutil.rmtree(old_path, ignore_errors=True)
+        if live.path.exists():
+            os.replace(live.path, old_path)
+        os.replace(build_path, live.path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    caught_up = {key: first[key] + last[key] for key in first}
+    return {"collection": name, "reembedded": True, "copied": copied, "caught_up": caught_up}
+
+
+def _int_list(raw: str) -> list[int]:
+    return [int(item) for item in raw.split(",") if item.strip()]
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Rebuild the Chroma collection with new HNSW settings.")
+    parser.add_argument("--collection", help="logical collection to rebuild (default: all the store uses)")
+    parser.add_argument("--space", choices=["cosine", "l2", "ip"], help="distance space (default CHROMA_SPACE)")
+    parser.add_argument("--m", type=int, help="HNSW M / max_neighbors (default CHROMA_HNSW_M)")
+    parser.add_argument("--ef-construction", type=int, help="default CHROMA_HNSW_EF_CONSTRUCTION")
+    parser.add_argument("--ef-search", type=int, help="default CHROMA_HNSW_EF_SEARCH")
+    parser.add_argument("--sweep", type=_int_list, help="comma-separated ef_search values to report, e.g. 20,50,100")
+    parser.add_argument("--sample", type=int, default=50, help="probe queries for the recall report")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per probe for recall@k")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--keep-old", action="store_true", help="keep the previous collection after switching")
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds for in-flight writes to land")
+    parser.add_argument("--report-only", action="store_true", help="report on the active collection, no rebuild")
+    parser.add_argument("--embed", action="store_true", help="re-embed documents, e.g. for a new ZHIPUAI_EMBED_DIM")
+    args = parser.parse_args(argv)
+    if args.report_only and args.sweep:
+        parser.error("--sweep changes ef_search on the collection it measures; it runs on the shadow of a rebuild")
+
+    client = get_chroma_client()
+    results: list[dict] = []
+    for name in [args.collection] if args.collection else logical_collection_names():
+        if args.embed and vector_backend() == "numpy":
+            results.append(reembed_numpy(name, batch_size=args.batch_size))
+            continue
+        if args.report_only:
+            collection = client.get_or_create_collection(name=active_collection_name(name))
+            report = recall_report(collection, sample=args.sample, k=args.k)
+            results.append({"collection": name, "report": report})
+            continue
+        results.append(
+            reindex(
+                name=name,
+                space=args.space,
+                m=args.m,
+                ef_construction=args.ef_construction,
+                ef_search=args.ef_search,
+                ef_search_sweep=args.sweep,
+                batch_size=args.batch_size,
+                sample=args.sample,
+                k=args.k,
+                keep_old=args.keep_old,
+                reembed=args.embed,
+                settle_s=args.settle,
+            )
+        )
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
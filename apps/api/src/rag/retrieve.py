@@ -17,7 +17,7 @@ def retrieve(
     top_k: int = 5,
     where: dict | None = None,
 ) -> list[dict]:
-    if count_collection() == 0:
+    if count_collection(where) == 0:
         return []
 
     embedding = embed_texts([query_text])[0]
@@ -1,7 +1,9 @@
 ﻿from __future__ import annotations
 
-from src.rag.embeddings import embed_texts
-from src.rag.store import count_collection, query_collection
+import asyncio
+
+from src.rag.embeddings import aembed_texts, embed_texts
+from src.rag.store import count_collection, distance_to_similarity, query_collection
 
 
 def _ensure_str(value) -> str:
@@ -28,17 +30,13 @@ def _normalize_where(where: dict | None) -> dict | None:
     return {"$and": [{k: {"$eq": v}} for k, v in items]}
 
 
-def retrieve(query: str, top_k: int, where: dict | None) -> list[dict]:
-    if count_collection() == 0:
-        return []
-
-    embedding = embed_texts([query])[0]
-    raw = query_collection(embedding=embedding, top_k=top_k, where=_normalize_where(where))
-
+def _results_from_query(raw: dict) -> list[dict]:
     ids = (raw.get("ids") or [[]])[0]
     documents = (raw.get("documents") or [[]])[0]
     metadatas = (raw.get("metadatas") or [[]])[0]
     distances = (raw.get("distances") or [[]])[0]
+    similarities = (raw.get("similarities") or [[]])[0]
+    space = raw.get("space")
 
     results: list[dict] = []
     for idx, doc_id in enumerate(ids):
@@ -50,6 +48,33 @@ def retrieve(query: str, top_k: int, where: dict | None) -> list[dict]:
                 "text": _ensure_str(documents[idx]) if idx < len(documents) else "",
                 "metadata": metadatas[idx] if idx < len(metadatas) else {},
                 "score": score,
+                "similarity": similarities[idx] if idx < len(similarities) else distance_to_similarity(score, space),
             }
         )
     return results
+
+
+def retrieve(query: str, top_k: int, where: dict | None) -> list[dict]:
+    where = _normalize_where(where)
+    if count_collection(where) == 0:
+        return []
+
+    embedding = embed_texts([query])[0]
+    raw = query_collection(embedding=embedding, top_k=top_k, where=where)
+    return _results_from_query(raw)
+
+
+async def aretrieve(query: str, top_k: int, where: dict | None) -> list[dict]:
+    # The embedding call awaits the HTTP client; Chroma itself is a local, blocking library, so it gets a thread.
+    where = _normalize_where(where)
+    if await asyncio.to_thread(count_collection, where) == 0:
+        return []
+
+    embedding = (await aembed_texts([query]))[0]
+    raw = await asyncio.to_thread(
+        query_collection,
+        embedding=embedding,
+        top_k=top_k,
+        where=where,
+    )
+    return _results_from_query(raw)
@@ -1,21 +1,403 @@
 ﻿from __future__ import annotations
 
-from typing import Iterable
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Protocol
 
 from src.core.deps import get_chroma_client
+from src.core.metrics import inc_counter
+from src.core.settings import get_settings
+from src.rag.numpy_store import get_numpy_collection
 
 
 COLLECTION_NAME = "job_coach"
+CHROMA_SPACES = ("cosine", "l2", "ip")
+# With CHROMA_PARTITIONING=source_type each partition is its own collection, f"{COLLECTION_NAME}_{partition}".
+# QA cards come first because citations and the question bank mostly resolve to them.
+PARTITIONS = ("qa_card", "note", "resume", "jd", "other")
+_ALIAS_FILE = "collection_aliases.json"
+VECTOR_STORES = ("chroma", "numpy")
 
 
-def get_collection():
+class VectorStore(Protocol):
+    """The part of a collection the store functions use. A chromadb Collection satisfies it as is, and so does
+    numpy_store.NumpyCollection; VECTOR_STORE picks which one vector_collection() hands out."""
+
+    name: str
+    metadata: dict | None
+
+    def modify(self, *, metadata: dict | None = None) -> None: ...
+
+    def upsert(self, *, ids, embeddings, documents=None, metadatas=None) -> None: ...
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=...) -> dict: ...
+
+    def delete(self, ids=None, where=None) -> None: ...
+
+    def count(self) -> int: ...
+
+    def query(self, query_embeddings, n_results=10, where=None, include=...) -> dict: ...
+
+
+class _ChunkCache:
+    """Per-process LRU of chunks ({id, text, metadata}) by id.
+
+    Every write through this module bumps the generation and drops all entries; a read that started before the
+    write fetched with the old generation and is not cached. Writes made by other workers age out with the TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.generation = 0
+
+    def get_many(self, ids: list[str], ttl_s: float) -> dict[str, dict]:
+        now = time.monotonic()
+        found: dict[str, dict] = {}
+        with self._lock:
+            for cid in ids:
+                entry = self._entries.get(cid)
+                if entry is None:
+                    continue
+                stored_at, chunk = entry
+                if now - stored_at > ttl_s:
+                    del self._entries[cid]
+                    continue
+                self._entries.move_to_end(cid)
+                found[cid] = chunk
+        return found
+
+    def put_many(self, chunks: Iterable[dict], *, generation: int, max_size: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if generation != self.generation:
+                return
+            for chunk in chunks:
+                self._entries[chunk["id"]] = (now, chunk)
+                self._entries.move_to_end(chunk["id"])
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+_CHUNK_CACHE = _ChunkCache()
+
+
+def hnsw_configuration(
+    *,
+    space: str | None = None,
+    m: int | None = None,
+    ef_construction: int | None = None,
+    ef_search: int | None = None,
+) -> dict:
+    """Chroma HNSW configuration from the CHROMA_* settings, with per-argument overrides."""
+    cfg = get_settings()
+    space = str(space or cfg.chroma_space or "cosine").strip().lower()
+    if space not in CHROMA_SPACES:
+        raise ValueError(f"CHROMA_SPACE must be one of {', '.join(CHROMA_SPACES)}, got {space!r}")
+    return {
+        "hnsw": {
+            "space": space,
+            "max_neighbors": max(2, int(m or cfg.chroma_hnsw_m)),
+            "ef_construction": max(1, int(ef_construction or cfg.chroma_hnsw_ef_construction)),
+            "ef_search": max(1, int(ef_search or cfg.chroma_hnsw_ef_search)),
+        }
+    }
+
+
+def _alias_path() -> Path:
+    return Path(get_settings().chroma_dir) / _ALIAS_FILE
+
+
+_ALIAS_CACHE: dict[str, tuple[float, dict[str, str]]] = {}
+
+
+def _read_aliases() -> dict[str, str]:
+    path = _alias_path()
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return {}
+    cached = _ALIAS_CACHE.get(str(path))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        aliases = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return cached[1] if cached is not None else {}
+    aliases = {str(k): str(v) for k, v in aliases.items()} if isinstance(aliases, dict) else {}
+    _ALIAS_CACHE[str(path)] = (mtime, aliases)
+    return aliases
+
+
+def active_collection_name(name: str = COLLECTION_NAME) -> str:
+    """The physical collection behind a logical name; a reindex repoints it at a freshly built one."""
+    return _read_aliases().get(name, name)
+
+
+def switch_collection_alias(target: str | None, name: str = COLLECTION_NAME) -> None:
+    """Point the logical name at target (None drops the alias). The alias file is replaced atomically, so readers
+    in any worker see either the old or the new collection."""
+    path = _alias_path()
+    aliases = dict(_read_aliases())
+    if target is None:
+        aliases.pop(name, None)
+    else:
+        aliases[name] = target
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(aliases), encoding="utf-8")
+    os.replace(tmp, path)
+    _CHUNK_CACHE.invalidate()
+
+
+def collection_space(collection) -> str:
+    space = getattr(collection, "space", None)
+    if isinstance(space, str) and space in CHROMA_SPACES:
+        return space
+    configuration = getattr(collection, "configuration", None)
+    hnsw = (configuration.get("hnsw") or {}) if isinstance(configuration, dict) else {}
+    space = str(hnsw.get("space") or "l2").lower()
+    return space if space in CHROMA_SPACES else "l2"
+
+
+def distance_to_similarity(distance: float | int | None, space: str | None = None) -> float:
+    """Map a Chroma distance into [0, 1], higher is closer. Unknown spaces use the L2 curve."""
+    if distance is None:
+        return 0.0
+    d = max(0.0, float(distance))
+    if space in {"cosine", "ip"}:
+        # Chroma reports 1 - cos (or 1 - dot), so an identical vector is 0 and an opposite one is 2.
+        return max(0.0, min(1.0, 1.0 - d))
+    return 1.0 / (1.0 + d)
+
+
+def partitioned() -> bool:
+    return str(get_settings().chroma_partitioning or "source_type").strip().lower() != "off"
+
+
+def partition_collection_name(partition: str) -> str:
+    return f"{COLLECTION_NAME}_{partition}"
+
+
+def logical_collection_names() -> list[str]:
+    """The collections the store reads and writes under the current CHROMA_PARTITIONING."""
+    if partitioned():
+        return [partition_collection_name(partition) for partition in PARTITIONS]
+    return [COLLECTION_NAME]
+
+
+def partition_for_metadata(metadata: dict | None) -> str:
+    meta = metadata if isinstance(metadata, dict) else {}
+    if meta.get("doc_kind") == "qa_card":
+        return "qa_card"
+    source_type = meta.get("source_type")
+    return source_type if source_type in {"note", "resume", "jd"} else "other"
+
+
+def _where_clauses(where: dict | None) -> list[dict] | None:
+    """Top-level AND clauses of a where filter, each {key: value}; None when it is not a plain conjunction."""
+    if not where:
+        return []
+    if set(where) == {"$and"} and isinstance(where["$and"], list):
+        clauses: list[dict] = []
+        for item in where["$and"]:
+            sub = _where_clauses(item) if isinstance(item, dict) else None
+            if sub is None:
+                return None
+            clauses.extend(sub)
+        return clauses
+    if any(str(key).startswith("$") for key in where):
+        return None
+    return [{key: value} for key, value in where.items()]
+
+
+def _clause_equality(clause: dict) -> tuple[str, object] | None:
+    ((key, value),) = clause.items()
+    if isinstance(value, dict):
+        if set(value) != {"$eq"}:
+            return None
+        value = value["$eq"]
+    return key, value
+
+
+def _join_where(clauses: list[dict]) -> dict | None:
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def route_where(where: dict | None) -> list[tuple[str, dict | None]]:
+    """(logical collection, where) pairs that together answer a filtered search.
+
+    The source_type and doc_kind clauses a partition already implies are dropped from its filter, so a search
+    such as all QA cards runs unfiltered over the QA card collection.
+    """
+    if not partitioned():
+        return [(COLLECTION_NAME, where)]
+    clauses = _where_clauses(where)
+    if clauses is None:
+        return [(partition_collection_name(partition), where) for partition in PARTITIONS]
+    equalities = dict(eq for eq in (_clause_equality(clause) for clause in clauses) if eq is not None)
+    source_type = equalities.get("source_type")
+    doc_kind = equalities.get("doc_kind")
+    if doc_kind == "qa_card":
+        targets = ["qa_card"]
+    elif source_type in {"resume", "jd"}:
+        targets = [source_type]
+    elif source_type == "note":
+        targets = ["note"] if "doc_kind" in equalities else ["note", "qa_card"]
+    elif "source_type" in equalities:
+        targets = ["other"]
+    else:
+        targets = list(PARTITIONS)
+
+    routed: list[tuple[str, dict | None]] = []
+    for partition in targets:
+        implied = {("source_type", partition)} if partition in {"note", "resume", "jd"} else set()
+        if partition == "qa_card":
+            implied = {("source_type", "note"), ("doc_kind", "qa_card")}
+        kept = [clause for clause in clauses if _clause_equality(clause) not in implied]
+        routed.append((partition_collection_name(partition), _join_where(kept)))
+    return routed
+
+
+def get_collection(name: str = COLLECTION_NAME):
+    """The collection behind a logical name: COLLECTION_NAME, or a partition_collection_name(...) when partitioned."""
     client = get_chroma_client()
-    return client.get_or_create_collection(name=COLLECTION_NAME)
+    collection = client.get_or_create_collection(name=active_collection_name(name), configuration=hnsw_configuration())
+    # Only ef_search can change on a built index; space, M and ef_construction need a reindex.
+    ef_search = int(get_settings().chroma_hnsw_ef_search)
+    hnsw = (getattr(collection, "configuration", None) or {}).get("hnsw") or {}
+    if hnsw and ef_search > 0 and hnsw.get("ef_search") != ef_search:
+        collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+    return collection
+
+
+class EmbeddingDimensionError(ValueError):
+    """Embeddings of one size met a collection built from another, e.g. after ZHIPUAI_EMBED_DIM changed."""
+
+
+def collection_embedding_dim(collection) -> int | None:
+    """The embedding size recorded in the collection metadata on its first write, if any."""
+    metadata = getattr(collection, "metadata", None) or {}
+    try:
+        return int(metadata["embedding_dim"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def check_embedding_dim(collection, dim: int, *, record: bool = False) -> None:
+    """Raise EmbeddingDimensionError when dim differs from the collection's; with record, store it if unset."""
+    stored = collection_embedding_dim(collection)
+    if stored is None:
+        if record and dim:
+            collection.modify(metadata={**(getattr(collection, "metadata", None) or {}), "embedding_dim": int(dim)})
+        return
+    if stored != dim:
+        raise EmbeddingDimensionError(
+            f"collection {collection.name} holds {stored}-dim embeddings but got {dim}-dim ones; "
+            "re-embed it with `python -m src.rag.reindex --embed` after changing ZHIPUAI_EMBED_DIM"
+        )
+
+
+def vector_backend() -> str:
+    backend = str(get_settings().vector_store or "chroma").strip().lower()
+    if backend not in VECTOR_STORES:
+        raise ValueError(f"VECTOR_STORE must be one of {', '.join(VECTOR_STORES)}, got {backend!r}")
+    return backend
+
+
+def vector_collection(name: str = COLLECTION_NAME) -> VectorStore:
+    """The collection the store functions read and write for a logical name, on the VECTOR_STORE backend.
+
+    get_collection() stays Chroma-only for the tools that manage Chroma indexes (reindex, migrate_partitions).
+    """
+    if vector_backend() == "numpy":
+        # Exact search has no index to rebuild, so numpy collections are not aliased.
+        return get_numpy_collection(name)
+    return get_collection(name)
+
+
+def _chunks_from_rows(ids: list, documents: list | None, metadatas: list | None) -> list[dict]:
+    documents = documents or []
+    metadatas = metadatas or []
+    chunks: list[dict] = []
+    for idx, cid in enumerate(ids):
+        if not isinstance(cid, str):
+            continue
+        doc = documents[idx] if idx < len(documents) else None
+        meta = metadatas[idx] if idx < len(metadatas) else None
+        chunks.append(
+            {
+                "id": cid,
+                "text": str(doc) if doc is not None else "",
+                "metadata": meta if isinstance(meta, dict) else {},
+            }
+        )
+    return chunks
+
+
+def _remember_chunks(chunks: list[dict], generation: int) -> None:
+    max_size = int(get_settings().chunk_cache_size)
+    if max_size > 0 and chunks:
+        _CHUNK_CACHE.put_many(chunks, generation=generation, max_size=max_size)
+
+
+def get_chunks(ids: Iterable[str]) -> list[dict]:
+    """Chunks by id, in request order, skipping unknown ids.
+
+    Served from the chunk cache where possible; the misses are fetched with one get per collection, stopping
+    once all of them are found.
+    """
+    wanted = list(dict.fromkeys(cid for cid in ids if isinstance(cid, str) and cid.strip()))
+    if not wanted:
+        return []
+    cfg = get_settings()
+    cached = _CHUNK_CACHE.get_many(wanted, float(cfg.chunk_cache_ttl_s)) if cfg.chunk_cache_size > 0 else {}
+    missing = [cid for cid in wanted if cid not in cached]
+    if cached:
+        inc_counter("chunk_cache_hits_total", len(cached))
+    if missing:
+        inc_counter("chunk_cache_misses_total", len(missing))
+        generation = _CHUNK_CACHE.generation
+        for name in logical_collection_names():
+            raw = vector_collection(name).get(ids=missing, include=["documents", "metadatas"])
+            fetched = _chunks_from_rows(raw.get("ids") or [], raw.get("documents"), raw.get("metadatas"))
+            _remember_chunks(fetched, generation)
+            cached.update((chunk["id"], chunk) for chunk in fetched)
+            missing = [cid for cid in missing if cid not in cached]
+            if not missing:
+                break
+    return [dict(cached[cid]) for cid in wanted if cid in cached]
+
+
+def get_where(where: dict, include: list[str]) -> dict:
+    """collection.get(where=...) across every collection the filter routes to, merged into one result."""
+    merged: dict[str, list] = {"ids": [], **{field: [] for field in include}}
+    for name, routed in route_where(where):
+        raw = vector_collection(name).get(where=routed, include=include)
+        merged["ids"].extend(raw.get("ids") or [])
+        for field in include:
+            merged[field].extend(raw.get(field) or [])
+    return merged
 
 
 def delete_by_source(source_id: str) -> None:
-    collection = get_collection()
-    collection.delete(where={"source_id": source_id})
+    try:
+        for name in logical_collection_names():
+            vector_collection(name).delete(where={"source_id": source_id})
+    finally:
+        _CHUNK_CACHE.invalidate()
 
 
 def upsert_chunks(
@@ -25,18 +407,31 @@ def upsert_chunks(
     embeddings: list[list[float]],
     metadatas: list[dict],
 ) -> None:
-    collection = get_collection()
-    collection.upsert(
-        ids=ids,
-        documents=chunks,
-        embeddings=embeddings,
-        metadatas=metadatas,
-    )
+    groups: dict[str, list[int]] = {}
+    for idx, meta in enumerate(metadatas):
+        name = partition_collection_name(partition_for_metadata(meta)) if partitioned() else COLLECTION_NAME
+        groups.setdefault(name, []).append(idx)
+    try:
+        for name, positions in groups.items():
+            collection = vector_collection(name)
+            check_embedding_dim(collection, len(embeddings[positions[0]]), record=True)
+            collection.upsert(
+                ids=[ids[i] for i in positions],
+                documents=[chunks[i] for i in positions],
+                embeddings=[embeddings[i] for i in positions],
+                metadatas=[metadatas[i] for i in positions],
+            )
+    finally:
+        _CHUNK_CACHE.invalidate()
+
 
+def count_collection(where: dict | None = None) -> int:
+    """Stored chunks across the collections a search with where would read (all of them without a filter).
 
-def count_collection() -> int:
-    collection = get_collection()
-    return collection.count()
+    Only the routed collections are counted, so the empty-store check before a search costs no more collection
+    lookups than the search. The where clauses themselves are not applied.
+    """
+    return sum(vector_collection(name).count() for name, _ in route_where(where))
 
 
 def query_collection(
@@ -45,19 +440,60 @@ def query_collection(
     top_k: int,
     where: dict | None,
 ) -> dict:
-    collection = get_collection()
-    return collection.query(
-        query_embeddings=[embedding],
-        n_results=top_k,
-        where=where,
-        include=["documents", "metadatas", "distances"],
-    )
+    """Top k hits across the routed collections.
+
+    Each hit's distance is also turned into a similarity with its own collection's space, and the hits are merged
+    on that, since partitions built at different times (or reindexed one by one) need not share a space. space
+    in the result is None when they do not.
+    """
+    generation = _CHUNK_CACHE.generation
+    hits: list[tuple[float, float, str, object, object]] = []
+    spaces: set[str] = set()
+    for name, routed in route_where(where):
+        collection = vector_collection(name)
+        check_embedding_dim(collection, len(embedding))
+        raw = collection.query(
+            query_embeddings=[embedding],
+            n_results=top_k,
+            where=routed,
+            include=["documents", "metadatas", "distances"],
+        )
+        space = collection_space(collection)
+        spaces.add(space)
+        ids = (raw.get("ids") or [[]])[0]
+        documents = (raw.get("documents") or [[]])[0]
+        metadatas = (raw.get("metadatas") or [[]])[0]
+        distances = (raw.get("distances") or [[]])[0]
+        for idx, cid in enumerate(ids):
+            distance = float(distances[idx]) if idx < len(distances) and distances[idx] is not None else 0.0
+            hits.append(
+                (
+                    distance_to_similarity(distance, space),
+                    distance,
+                    cid,
+                    documents[idx] if idx < len(documents) else None,
+                    metadatas[idx] if idx < len(metadatas) else None,
+                )
+            )
+    # Distance breaks ties, e.g. among cosine hits that all clamp to similarity 0.
+    hits.sort(key=lambda hit: (-hit[0], hit[1]))
+    hits = hits[:top_k]
+    raw = {
+        "ids": [[hit[2] for hit in hits]],
+        "documents": [[hit[3] for hit in hits]],
+        "metadatas": [[hit[4] for hit in hits]],
+        "distances": [[hit[1] for hit in hits]],
+        "similarities": [[hit[0] for hit in hits]],
+        "space": spaces.pop() if len(spaces) == 1 else None,
+    }
+    # Retrieved chunks (question bank cards, /retrieve hits) are the ones later cited, so keep them for hydration.
+    _remember_chunks(_chunks_from_rows(raw["ids"][0], raw["documents"][0], raw["metadatas"][0]), generation)
+    return raw
 
 
 def find_source_id_by_content_hash(*, source_type: str, content_sha256: str) -> str | None:
-    collection = get_collection()
-    raw = collection.get(
-        where={"content_sha256": content_sha256},
+    raw = get_where(
+        {"$and": [{"content_sha256": {"$eq": content_sha256}}, {"source_type": {"$eq": source_type}}]},
         include=["metadatas"],
     )
     metadatas = raw.get("metadatas") or []
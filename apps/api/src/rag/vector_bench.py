@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import numpy as np
+
+from src.core.settings import get_settings
+from src.rag.numpy_store import get_numpy_collection
+from src.rag.quantization import QUANTIZATIONS, approx_dots, encode_vector, quantize
+from src.rag.reindex import _catch_up
+from src.rag.service import _normalize_where
+from src.rag.store import (
+    collection_space,
+    get_collection,
+    get_where,
+    logical_collection_names,
+    query_collection,
+    vector_collection,
+)
+
+
+def import_from_chroma(*, batch_size: int = 5000) -> dict:
+    """Make the numpy backend mirror the Chroma collections: embeddings are copied as stored, rows changed since a
+    previous import are rewritten and rows gone from Chroma are deleted. Compacts each collection at the end."""
+    counts: dict[str, dict] = {}
+    for name in logical_collection_names():
+        source = get_collection(name)
+        target = get_numpy_collection(name, space=collection_space(source))
+        counts[name] = _catch_up(source, target, max(1, int(batch_size)))
+        target.compact()
+        counts[name]["count"] = target.count()
+    return counts
+
+
+@contextmanager
+def _backend(name: str) -> Iterator[None]:
+    previous = os.environ.get("VECTOR_STORE")
+    os.environ["VECTOR_STORE"] = name
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop("VECTOR_STORE", None)
+        else:
+            os.environ["VECTOR_STORE"] = previous
+
+
+def _probes(sample: int, seed: int) -> list[np.ndarray]:
+    """Stored chunk embeddings standing in for embedded user queries, so the benchmark makes no embedding calls."""
+    vectors: list[np.ndarray] = []
+    with _backend("numpy"):
+        for name in logical_collection_names():
+            page = vector_collection(name).get(include=["embeddings"], limit=max(1, sample))
+            vectors.extend(np.asarray(page["embeddings"], dtype=np.float32))
+    random.Random(seed).shuffle(vectors)
+    return vectors[:sample]
+
+
+def _query_mix(seed: int) -> list[tuple[str, dict | None, int]]:
+    """(kind, where, top_k) of the searches the app runs: question bank, resume profile and /retrieve."""
+    mix: list[tuple[str, dict | None, int]] = [
+        ("question_bank", {"source_type": "note", "doc_kind": "qa_card"}, 15),
+        ("retrieve_notes", {"source_type": "note"}, 5),
+        ("retrieve", None, 5),
+    ]
+    with _backend("numpy"):
+        resumes = sorted(
+            {
+                meta["source_id"]
+                for meta in get_where({"source_type": "resume"}, include=["metadatas"]).get("metadatas") or []
+                if isinstance(meta, dict) and meta.get("source_id")
+            }
+        )
+    if resumes:
+        mix.append(("resume_profile", {"source_type": "resume", "source_id": random.Random(seed).choice(resumes)}, 12))
+    return mix
+
+
+def benchmark(*, sample: int = 100, seed: int = 0, backends: tuple[str, ...] = ("chroma", "numpy")) -> list[dict]:
+    """p50/p95 latency per query kind and backend, through query_collection as retrieval calls it.
+
+    recall is the share of the numpy backend's exact top-k that each backend returned, so it is 1.0 for numpy and
+    measures the approximation of Chroma's HNSW index.
+    """
+    probes = _probes(max(1, int(sample)), seed)
+    rows: list[dict] = []
+    for kind, where, top_k in _query_mix(seed):
+        where = _normalize_where(where)
+        results: dict[str, list[list[str]]] = {}
+        for backend in backends:
+            latencies_ms: list[float] = []
+            results[backend] = []
+            with _backend(backend):
+                for probe in probes:
+                    started = time.perf_counter()
+                    raw = query_collection(embedding=probe.tolist(), top_k=top_k, where=where)
+                    latencies_ms.append((time.perf_counter() - started) * 1000.0)
+                    results[backend].append(raw["ids"][0])
+            rows.append(
+                {
+                    "kind": kind,
+                    "backend": backend,
+                    "top_k": top_k,
+                    "queries": len(probes),
+                    "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3) if latencies_ms else None,
+                    "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3) if latencies_ms else None,
+                }
+            )
+        exact = results.get("numpy")
+        if exact is None:
+            continue
+        for row in rows[-len(backends):]:
+            got = results[row["backend"]]
+            expected = sum(len(ids) for ids in exact)
+            hits = sum(len(set(want).intersection(have)) for want, have in zip(exact, got))
+            row["recall"] = round(hits / expected, 4) if expected else None
+    return rows
+
+
+def _ranked(dots: np.ndarray, sq_norms: np.ndarray, space: str) -> np.ndarray:
+    # Distance up to a per-query constant, which is all a ranking needs.
+    return sq_norms - 2.0 * dots if space == "l2" else -dots
+
+
+def quantization_report(*, sample: int = 100, k: int = 10, rescore: int = 4, seed: int = 0) -> list[dict]:
+    """Recall@k and vector memory per EMBEDDING_QUANTIZATION mode, for each numpy-backend collection.
+
+    recall is measured on the quantized scan alone and after rescoring the top k * rescore candidates with the
+    float32 vectors, as NumpyCollection.query does. redis_bytes is the size of one semantic cache vector in Redis.
+    """
+    rows: list[dict] = []
+    for name in logical_collection_names():
+        collection = get_numpy_collection(name)
+        vectors = np.asarray(collection.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+        if not len(vectors):
+            continue
+        space = collection.space
+        sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+        k_eff = min(max(1, int(k)), len(vectors))
+        shortlist = min(len(vectors), k_eff * max(1, int(rescore)))
+        picks = random.Random(seed).sample(range(len(vectors)), min(max(1, int(sample)), len(vectors)))
+        exact = [set(np.argsort(_ranked(vectors @ vectors[i], sq_norms, space), kind="stable")[:k_eff]) for i in picks]
+        for mode in QUANTIZATIONS:
+            codes, scales = quantize(vectors, mode)
+            scan_hits = rescored_hits = 0
+            latencies_ms: list[float] = []
+            for expected, i in zip(exact, picks):
+                started = time.perf_counter()
+                approx = _ranked(approx_dots(codes, scales, vectors[i]), sq_norms, space)
+                candidates = np.argpartition(approx, shortlist - 1)[:shortlist]
+                exact_rank = _ranked(vectors[candidates] @ vectors[i], sq_norms[candidates], space)
+                rescored = candidates[np.argsort(exact_rank, kind="stable")[:k_eff]]
+                latencies_ms.append((time.perf_counter() - started) * 1000.0)
+                scan_hits += len(expected.intersection(np.argsort(approx, kind="stable")[:k_eff]))
+                rescored_hits += len(expected.intersection(rescored))
+            scanned_bytes = codes.nbytes + (scales.nbytes if scales is not None else 0)
+            rows.append(
+                {
+                    "collection": name,
+                    "mode": mode,
+                    "vectors": len(vectors),
+                    "dim": int(vectors.shape[1]),
+                    "scan_mb": round(scanned_bytes / 1e6, 3),
+                    "redis_bytes": len(encode_vector(vectors[0], mode)),
+                    "recall_scan": round(scan_hits / (len(picks) * k_eff), 4),
+                    "recall_rescored": round(rescored_hits / (len(picks) * k_eff), 4),
+                    "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+                }
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare the Chroma and numpy vector backends on the app's queries.")
+    parser.add_argument("--import", dest="do_import", action="store_true", help="sync Chroma into numpy store first")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--sample", type=int, default=100, help="probe queries per query kind")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quantization", action="store_true", help="also report recall vs memory per quantization")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per probe for the quantization recall@k")
+    args = parser.parse_args(argv)
+
+    result: dict = {}
+    if args.do_import:
+        result["import"] = import_from_chroma(batch_size=args.batch_size)
+    result["benchmark"] = benchmark(sample=args.sample, seed=args.seed)
+    if args.quantization:
+        rescore = int(get_settings().vector_rescore_factor)
+        result["quantization"] = quantization_report(sample=args.sample, k=args.k, rescore=rescore, seed=args.seed)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,9 @@ from __future__ import annotations
 import json
 import re
 
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool, tool
 
-from src.llm.zhipu import chat
+from src.llm.zhipu import achat, chat
 from src.rag.service import retrieve
 
 
@@ -51,13 +51,25 @@ def _build_interviewer_prompt(user_input: str, history: list, topic: str | None
     return messages
 
 
-@tool
-def run_interview_turn(user_input: str, history: list, topic: str | None = None) -> str:
+def _interview_turn(user_input: str, history: list, topic: str | None = None) -> str:
     """Use for mock technical interview turns: evaluate answer briefly and ask one deeper follow-up."""
     messages = _build_interviewer_prompt(user_input=user_input, history=history, topic=topic)
     return _ensure_str(chat(messages))
 
 
+async def _ainterview_turn(user_input: str, history: list, topic: str | None = None) -> str:
+    messages = _build_interviewer_prompt(user_input=user_input, history=history, topic=topic)
+    return _ensure_str(await achat(messages))
+
+
+# Same tool for both graph entry points: invoke() runs func, ainvoke() awaits coroutine.
+run_interview_turn = StructuredTool.from_function(
+    func=_interview_turn,
+    coroutine=_ainterview_turn,
+    name="run_interview_turn",
+)
+
+
 def _build_resume_interviewer_prompt(user_input: str, history: list, contexts: list[dict]) -> list[dict]:
     evidence = "\n".join(
         f"[[{item.get('id', '')}]] {_ensure_str(item.get('text', ''))}" for item in contexts
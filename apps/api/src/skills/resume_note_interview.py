@@ -1,13 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import random
 import re
 from typing import TypedDict
 
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 
-from src.rag.service import retrieve
+from src.rag.service import aretrieve, retrieve
+from src.rag.store import distance_to_similarity, get_chunks
 
 
 class InterviewState(TypedDict):
@@ -168,9 +170,25 @@ def _coerce_state(session: dict | None, source_id: str) -> InterviewState:
     key_points = key_points_raw if isinstance(key_points_raw, list) else []
     state["current_key_points"] = [_ensure_str(item).strip() for item in key_points if _ensure_str(item).strip()]
     state["current_context_id"] = _ensure_str(session.get("current_context_id")).strip() or None
+    if state["current_context_id"] and not (state["current_question"] and state["current_standard_answer"]):
+        _rehydrate_card(state)
     return state
 
 
+def _rehydrate_card(state: InterviewState) -> None:
+    """The session store drops card text when current_context_id is set; re-read it from the collection."""
+    try:
+        got = get_chunks([state["current_context_id"]])
+    except Exception:
+        return
+    card = _normalize_candidate(got[0]) if got else None
+    if not card:
+        return
+    state["current_question"] = state["current_question"] or card["question"]
+    state["current_standard_answer"] = state["current_standard_answer"] or card["standard_answer"]
+    state["current_key_points"] = state["current_key_points"] or card["key_points"]
+
+
 def _jaccard_similarity(a: set[str], b: set[str]) -> float:
     if not a or not b:
         return 0.0
@@ -229,22 +247,14 @@ def _overlap_ratio(a_tokens: set[str], b_tokens: set[str]) -> float:
     return inter / max(1, len(a_tokens))
 
 
-def _distance_to_similarity(distance: float | int | None) -> float:
-    if distance is None:
-        return 0.0
-    d = float(distance)
-    if d < 0:
-        d = 0.0
-    return 1.0 / (1.0 + d)
+_RESUME_PROFILE_QUERY = "\u5019\u9009\u4eba\u7b80\u5386 \u6280\u672f\u6808 \u9879\u76ee \u7ecf\u9a8c \u4ea7\u51fa"
 
 
-def _resume_profile(source_id: str, top_k: int) -> tuple[list[dict], list[str]]:
-    where = {"source_type": "resume", "source_id": source_id}
-    resume_ctx = retrieve(
-        "\u5019\u9009\u4eba\u7b80\u5386 \u6280\u672f\u6808 \u9879\u76ee \u7ecf\u9a8c \u4ea7\u51fa",
-        top_k=max(4, top_k),
-        where=where,
-    )
+def _resume_where(source_id: str) -> dict:
+    return {"source_type": "resume", "source_id": source_id}
+
+
+def _resume_keywords(resume_ctx: list[dict]) -> list[str]:
     merged = "\n".join(_ensure_str(item.get("text", "")) for item in resume_ctx if isinstance(item, dict))
     keywords: list[str] = []
     seen: set[str] = set()
@@ -257,11 +267,32 @@ def _resume_profile(source_id: str, top_k: int) -> tuple[list[dict], list[str]]:
         keywords.append(token)
         if len(keywords) >= 12:
             break
-    return resume_ctx, keywords
+    return keywords
 
 
-def _collect_candidates(topic: str | None, resume_keywords: list[str], top_k: int) -> list[dict]:
-    where = {"source_type": "note", "doc_kind": "qa_card"}
+def _context_refs(items: list[dict]) -> list[dict]:
+    """Chunk references without their text; the route loads the text of whichever ends up cited."""
+    return [
+        {"id": item.get("id"), "metadata": item.get("metadata") or {}, "score": item.get("score", 0.0)}
+        for item in items
+        if isinstance(item, dict) and item.get("id")
+    ]
+
+
+def _resume_profile(source_id: str, top_k: int) -> tuple[list[dict], list[str]]:
+    resume_ctx = retrieve(_RESUME_PROFILE_QUERY, top_k=max(4, top_k), where=_resume_where(source_id))
+    return resume_ctx, _resume_keywords(resume_ctx)
+
+
+async def _aresume_profile(source_id: str, top_k: int) -> tuple[list[dict], list[str]]:
+    resume_ctx = await aretrieve(_RESUME_PROFILE_QUERY, top_k=max(4, top_k), where=_resume_where(source_id))
+    return resume_ctx, _resume_keywords(resume_ctx)
+
+
+_CANDIDATE_WHERE = {"source_type": "note", "doc_kind": "qa_card"}
+
+
+def _candidate_queries(topic: str | None, resume_keywords: list[str]) -> list[str]:
     queries: list[str] = []
     if topic:
         queries.append(f"{topic} interview questions")
@@ -269,10 +300,13 @@ def _collect_candidates(topic: str | None, resume_keywords: list[str], top_k: in
     if resume_keywords:
         queries.append(f"{' '.join(resume_keywords[:6])} interview")
     queries.append("technical interview questions")
+    return queries
 
+
+def _merge_candidates(batches: list[list[dict]]) -> list[dict]:
     merged: dict[str, dict] = {}
-    for query in queries:
-        for item in retrieve(query, top_k=max(top_k, 15), where=where):
+    for batch in batches:
+        for item in batch:
             if not isinstance(item, dict):
                 continue
             cid = _ensure_str(item.get("id")).strip()
@@ -284,6 +318,26 @@ def _collect_candidates(topic: str | None, resume_keywords: list[str], top_k: in
     return list(merged.values())
 
 
+def _collect_candidates(topic: str | None, resume_keywords: list[str], top_k: int) -> list[dict]:
+    return _merge_candidates(
+        [
+            retrieve(query, top_k=max(top_k, 15), where=_CANDIDATE_WHERE)
+            for query in _candidate_queries(topic, resume_keywords)
+        ]
+    )
+
+
+async def _acollect_candidates(topic: str | None, resume_keywords: list[str], top_k: int) -> list[dict]:
+    # The queries are independent, so their embedding round-trips overlap instead of adding up.
+    batches = await asyncio.gather(
+        *(
+            aretrieve(query, top_k=max(top_k, 15), where=_CANDIDATE_WHERE)
+            for query in _candidate_queries(topic, resume_keywords)
+        )
+    )
+    return _merge_candidates(list(batches))
+
+
 def _normalize_candidate(item: dict) -> dict | None:
     meta = item.get("metadata") if isinstance(item.get("metadata"), dict) else {}
     question_id = _ensure_str(meta.get("question_id") or item.get("id")).strip()
@@ -310,18 +364,19 @@ def _normalize_candidate(item: dict) -> dict | None:
         "topic_group": _ensure_str(meta.get("topic_group")).strip(),
         "tags": _ensure_str(meta.get("tags")).strip().lower(),
         "score": float(item.get("score", 0.0)),
+        # Retrieval maps the distance with the collection's space; older callers only pass the raw distance.
+        "similarity": float(item.get("similarity", distance_to_similarity(item.get("score")))),
         "raw": item,
     }
 
 
 def _pick_question(
+    candidates: list[dict],
     *,
     asked_question_ids: set[str],
     topic: str | None,
     resume_keywords: list[str],
-    top_k: int,
 ) -> dict | None:
-    candidates = _collect_candidates(topic=topic, resume_keywords=resume_keywords, top_k=top_k)
     resume_token_set = set(t.lower() for t in resume_keywords)
     topic_norm = _ensure_str(topic).strip().lower()
     ranked: list[tuple[float, dict]] = []
@@ -335,7 +390,7 @@ def _pick_question(
 
         question_tokens = set(_tokenize(card["question"]))
         resume_overlap = _overlap_ratio(question_tokens, resume_token_set)
-        similarity = _distance_to_similarity(card["score"])
+        similarity = card["similarity"]
         haystack = " ".join(
             [
                 _ensure_str(card.get("topic", "")),
@@ -352,10 +407,10 @@ def _pick_question(
         return None
     ranked.sort(key=lambda x: x[0], reverse=True)
     top_n = min(5, len(ranked))
-    candidates = ranked[:top_n]
+    shortlist = ranked[:top_n]
     # Keep the best score dominant but allow diversity across new conversations.
-    weights = [max(0.001, score) * (0.90**idx) for idx, (score, _card) in enumerate(candidates)]
-    selected = random.choices(candidates, weights=weights, k=1)[0]
+    weights = [max(0.001, score) * (0.90**idx) for idx, (score, _card) in enumerate(shortlist)]
+    selected = random.choices(shortlist, weights=weights, k=1)[0]
     return selected[1]
 
 
@@ -397,40 +452,32 @@ def _build_eval_answer(*, result: dict, reference_answer: str, next_question: st
     return "\n".join(lines)
 
 
-def _build_payload(answer: str, used_context: list[dict], citations: list[dict], state: InterviewState) -> str:
-    payload = {
+def _build_payload(
+    answer: str,
+    used_context: list[dict],
+    citations: list[dict],
+    state: InterviewState,
+) -> tuple[str, dict]:
+    """(ToolMessage content, artifact): the model only reads the answer; the graph reads the rest as Python objects."""
+    artifact = {
         "answer": answer,
         "citations": citations,
         "used_context": used_context,
         "session": {"resume_interview_state": state},
     }
-    return json.dumps(payload, ensure_ascii=False)
+    return answer, artifact
 
 
-@tool
-def run_resume_note_interview_turn(
-    user_input: str,
-    history: list,
-    source_id: str,
-    top_k: int = 12,
-    session: dict | None = None,
-) -> str:
-    """Use note QA cards to run resume interview: ask non-repeating question, evaluate answer, and provide reference answer."""
-    _ = history
-    source_id = _ensure_str(source_id).strip()
-    if not source_id:
-        return json.dumps(
-            {
-                "answer": "\u672a\u7ed1\u5b9a\u7b80\u5386 source_id\uff0c\u65e0\u6cd5\u8fdb\u884c\u7b80\u5386\u5b9a\u5411\u63d0\u95ee\u3002",
-                "citations": [],
-                "used_context": [],
-                "session": {"resume_interview_state": {}},
-            },
-            ensure_ascii=False,
-        )
+def _unbound_source_payload() -> tuple[str, dict]:
+    return _build_payload(
+        "\u672a\u7ed1\u5b9a\u7b80\u5386 source_id\uff0c\u65e0\u6cd5\u8fdb\u884c\u7b80\u5386\u5b9a\u5411\u63d0\u95ee\u3002",
+        [],
+        [],
+        {},
+    )
 
-    state = _coerce_state(session, source_id=source_id)
-    user_text = _ensure_str(user_input).strip()
+
+def _apply_topic_command(state: InterviewState, user_text: str) -> None:
     topic_cmd = _extract_topic_command(user_text)
     if topic_cmd:
         state["topic"] = topic_cmd
@@ -440,23 +487,30 @@ def run_resume_note_interview_turn(
         state["current_key_points"] = []
         state["current_context_id"] = None
 
+
+def _complete_turn(
+    state: InterviewState,
+    user_text: str,
+    resume_ctx: list[dict],
+    resume_keywords: list[str],
+    candidates: list[dict],
+) -> tuple[str, dict]:
     asked_set = set(state["asked_question_ids"])
-    resume_ctx, resume_keywords = _resume_profile(source_id=source_id, top_k=top_k)
     command_mode = (state["current_question_id"] is None) or _is_question_request(user_text) or _is_skip_request(user_text)
 
     if command_mode:
         card = _pick_question(
+            candidates,
             asked_question_ids=asked_set,
             topic=state.get("topic"),
             resume_keywords=resume_keywords,
-            top_k=top_k,
         )
         if not card:
             msg = (
                 "\u6ca1\u6709\u5339\u914d\u5230\u53ef\u7528\u9898\u76ee\u3002"
                 "\u8bf7\u8865\u5145 note \u9898\u5e93\uff0c\u6216\u6362\u4e00\u4e2a\u66f4\u5177\u4f53\u7684\u4e3b\u9898\u3002"
             )
-            return _build_payload(msg, resume_ctx[:2], [], state)
+            return _build_payload(msg, _context_refs(resume_ctx[:2]), [], state)
 
         asked_set.add(card["question_id"])
         state["asked_question_ids"] = list(asked_set)
@@ -467,7 +521,7 @@ def run_resume_note_interview_turn(
         state["current_context_id"] = card["id"]
 
         answer = _build_question_only_answer(card["question"], state.get("topic"))
-        used_context = [card["raw"], *resume_ctx[:2]]
+        used_context = [card["raw"], *_context_refs(resume_ctx[:2])]
         citations = [{"id": card["id"], "quote": card["question"]}]
         return _build_payload(answer, used_context, citations, state)
 
@@ -479,10 +533,10 @@ def run_resume_note_interview_turn(
     )
 
     next_card = _pick_question(
+        candidates,
         asked_question_ids=asked_set,
         topic=state.get("topic"),
         resume_keywords=resume_keywords,
-        top_k=top_k,
     )
 
     citations: list[dict] = []
@@ -503,7 +557,7 @@ def run_resume_note_interview_turn(
         state["current_key_points"] = next_card["key_points"]
         state["current_context_id"] = next_card["id"]
         citations.append({"id": next_card["id"], "quote": next_card["question"]})
-        used_context = [next_card["raw"], *resume_ctx[:2]]
+        used_context = [next_card["raw"], *_context_refs(resume_ctx[:2])]
         answer = _build_eval_answer(
             result=eval_result,
             reference_answer=evaluated_reference,
@@ -517,4 +571,56 @@ def run_resume_note_interview_turn(
     state["current_key_points"] = []
     state["current_context_id"] = None
     answer = _build_eval_answer(result=eval_result, reference_answer=evaluated_reference, next_question=None)
-    return _build_payload(answer, resume_ctx[:2], citations, state)
+    return _build_payload(answer, _context_refs(resume_ctx[:2]), citations, state)
+
+
+def _resume_note_interview_turn(
+    user_input: str,
+    history: list,
+    source_id: str,
+    top_k: int = 12,
+    session: dict | None = None,
+) -> tuple[str, dict]:
+    """Use note QA cards to run resume interview: ask non-repeating question, evaluate answer, and provide reference answer."""
+    _ = history
+    source_id = _ensure_str(source_id).strip()
+    if not source_id:
+        return _unbound_source_payload()
+
+    state = _coerce_state(session, source_id=source_id)
+    user_text = _ensure_str(user_input).strip()
+    _apply_topic_command(state, user_text)
+    resume_ctx, resume_keywords = _resume_profile(source_id=source_id, top_k=top_k)
+    candidates = _collect_candidates(topic=state.get("topic"), resume_keywords=resume_keywords, top_k=top_k)
+    return _complete_turn(state, user_text, resume_ctx, resume_keywords, candidates)
+
+
+async def _aresume_note_interview_turn(
+    user_input: str,
+    history: list,
+    source_id: str,
+    top_k: int = 12,
+    session: dict | None = None,
+) -> tuple[str, dict]:
+    _ = history
+    source_id = _ensure_str(source_id).strip()
+    if not source_id:
+        return _unbound_source_payload()
+
+    # _coerce_state may re-read the current card from Chroma; overlap it with the resume lookup.
+    state, (resume_ctx, resume_keywords) = await asyncio.gather(
+        asyncio.to_thread(_coerce_state, session, source_id),
+        _aresume_profile(source_id=source_id, top_k=top_k),
+    )
+    user_text = _ensure_str(user_input).strip()
+    _apply_topic_command(state, user_text)
+    candidates = await _acollect_candidates(topic=state.get("topic"), resume_keywords=resume_keywords, top_k=top_k)
+    return _complete_turn(state, user_text, resume_ctx, resume_keywords, candidates)
+
+
+run_resume_note_interview_turn = StructuredTool.from_function(
+    func=_resume_note_interview_turn,
+    coroutine=_aresume_note_interview_turn,
+    name="run_resume_note_interview_turn",
+    response_format="content_and_artifact",
+)
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.api import routes_chat_stream
+from src.core import http_client
+from src.core.cancellation import CancelScope, RequestCancelled, cancel_scope
+from src.core.metrics import get_value, reset_metrics
+from src.llm import zhipu
+
+
+def test_cancel_aborts_blocking_call_dispatched_to_loop(monkeypatch):
+    async def slow_post(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(http_client, "apost_json", slow_post)
+
+    def worker(scope):
+        with cancel_scope(scope):
+            started = time.monotonic()
+            with pytest.raises(RequestCancelled):
+                http_client.post_json("http://llm.invalid", {})
+            return time.monotonic() - started
+
+    async def scenario():
+        scope = CancelScope(asyncio.get_running_loop())
+        task = asyncio.ensure_future(asyncio.to_thread(worker, scope))
+        await asyncio.sleep(0.05)
+        scope.cancel()
+        return await task
+
+    assert asyncio.run(scenario()) < 1.0
+
+
+def test_cancelled_scope_skips_llm_call_and_counts_saved_tokens(monkeypatch):
+    reset_metrics()
+    monkeypatch.setenv("ZHIPUAI_API_KEY", "test")
+    monkeypatch.setattr(zhipu, "post_json", lambda *args, **kwargs: pytest.fail("LLM must not be called"))
+    scope = CancelScope()
+    scope.cancel()
+    with cancel_scope(scope), pytest.raises(RequestCancelled):
+        zhipu.chat([{"role": "user", "content": "讲讲 Redis 分布式锁"}])
+    assert get_value("llm_cancelled_calls_total", stage="skipped") == 1
+    assert get_value("llm_tokens_saved_total", stage="skipped") > 0
+
+
+def test_disconnect_cancels_graph_thread(monkeypatch):
+    monkeypatch.setenv("GRAPH_ASYNC", "false")
+    stopped = threading.Event()
+
+    def slow_graph(question, history=None, session=None, **kwargs):
+        from src.core.cancellation import check_cancelled
+
+        try:
+            while True:
+                check_cancelled()
+                time.sleep(0.01)
+        except RequestCancelled:
+            stopped.set()
+            raise
+
+    monkeypatch.setattr(routes_chat_stream, "run_graph", slow_graph)
+    payload = routes_chat_stream.ChatStreamRequest(question="hi")
+
+    async def scenario():
+        task = asyncio.ensure_future(
+            routes_chat_stream._invoke_graph(payload, conversation_id="c", resume_state={}, history=[])
+        )
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert stopped.wait(1.0)
+
+
+def test_disconnect_cancels_async_graph_and_counts_llm_call(monkeypatch):
+    reset_metrics()
+    monkeypatch.setenv("ZHIPUAI_API_KEY", "test")
+    started = asyncio.Event()
+
+    async def slow_post(*args, **kwargs):
+        started.set()
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(zhipu, "_apost_chat", slow_post)
+    payload = routes_chat_stream.ChatStreamRequest(question="hi")
+
+    async def scenario():
+        task = asyncio.ensure_future(
+            routes_chat_stream._invoke_graph(payload, conversation_id="c", resume_state={}, history=[])
+        )
+        await asyncio.wait_for(started.wait(), 1.0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert get_value("chat_requests_cancelled_total") == 1
+    assert get_value("llm_cancelled_calls_total", stage="in_flight") == 1
+
+
+def test_disconnect_keeps_coalesced_turn_for_a_last_event_id_reconnect(monkeypatch):
+    reset_metrics()
+    monkeypatch.setenv("REQUEST_COALESCING", "local")
+    monkeypatch.setenv("REQUEST_RESUME_GRACE_S", "5")
+    monkeypatch.setenv("GRAPH_CHECKPOINTER", "off")
+    release = asyncio.Event()
+    calls: list[str] = []
+
+    async def slow_graph(question, history=None, session=None, **kwargs):
+        calls.append(question)
+        await release.wait()
+        return {"answer": "答案", "citations": [], "used_context": []}
+
+    async def fake_append(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(routes_chat_stream, "arun_graph", slow_graph)
+    monkeypatch.setattr(routes_chat_stream, "aappend_conversation_history", fake_append)
+    payload = routes_chat_stream.ChatStreamRequest(
+        question="hi",
+        history=[{"role": "user", "content": "earlier"}],
+        conversation_id="conv_resume",
+        request_id="req_1",
+    )
+
+    async def scenario():
+        first = (await routes_chat_stream.chat_stream(payload, last_event_id=None)).body_iterator
+        seen = [await first.__anext__(), await first.__anext__()]
+        await first.aclose()
+        await asyncio.sleep(0.05)
+        release.set()
+        resumed = await routes_chat_stream.chat_stream(payload, last_event_id="2")
+        return seen, [chunk async for chunk in resumed.body_iterator]
+
+    seen, rest = asyncio.run(scenario())
+    assert seen[-1].startswith("id: 2\n")
+    assert rest[0].startswith("id: 3\nevent: token")
+    assert "event: done" in rest[-1]
+    assert calls == ["hi"]
+    assert get_value("chat_requests_cancelled_total") == 0
+    assert get_value("sse_resumes_total", outcome="resumed") == 1
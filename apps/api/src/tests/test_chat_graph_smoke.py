@@ -1,9 +1,12 @@
 ﻿from fastapi.testclient import TestClient
 
+from src.core import deps
 from src.main import app
 
 
-def test_chat_graph_smoke():
+def test_chat_graph_smoke(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(deps, "_client", None)
     client = TestClient(app)
     ingest = {
         "source_id": "resume_test",
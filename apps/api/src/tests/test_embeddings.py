@@ -0,0 +1,27 @@
+import numpy as np
+
+from src.rag import embeddings
+
+
+def test_random_dummy_embeddings_are_stable_per_text(monkeypatch):
+    monkeypatch.delenv("ZHIPUAI_API_KEY", raising=False)
+    monkeypatch.delenv("DUMMY_EMBEDDINGS", raising=False)
+    texts = [f"chunk {i}" for i in range(5)]
+    matrix = embeddings.dummy_embedding_matrix(texts, 64)
+
+    assert matrix.shape == (5, 64) and matrix.dtype == np.float32
+    assert np.abs(matrix).max() <= 1.0
+    # A text's vector does not depend on its batch, and a smaller dim is a prefix of a larger one.
+    assert np.array_equal(embeddings.dummy_embedding_matrix(texts[3:4], 64)[0], matrix[3])
+    assert np.array_equal(embeddings.dummy_embedding_matrix(texts, 16), matrix[:, :16])
+    assert embeddings.embed_texts(texts[:2], dim=64) == matrix[:2].tolist()
+
+
+def test_hashed_dummy_embeddings_rank_by_shared_tokens(monkeypatch):
+    monkeypatch.delenv("ZHIPUAI_API_KEY", raising=False)
+    monkeypatch.setenv("DUMMY_EMBEDDINGS", "hashed")
+    docs = ["Redis 分布式锁的实现", "MySQL 索引优化", "Java HashMap 源码"]
+    vectors = np.asarray(embeddings.embed_texts(docs + ["redis 锁", ""], dim=256))
+
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    assert int(np.argmax(vectors[:3] @ vectors[3])) == 0
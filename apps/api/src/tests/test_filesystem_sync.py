@@ -2,7 +2,7 @@ from pathlib import Path
 
 from src.core import deps
 from src.ingest.filesystem_sync import list_filesystem_source_ids, sync_filesystem_sources
-from src.rag.store import get_collection
+from src.rag.store import get_collection, get_where, partition_collection_name
 
 
 def test_sync_add_and_delete_by_filesystem(tmp_path, monkeypatch):
@@ -24,15 +24,14 @@ def test_sync_add_and_delete_by_filesystem(tmp_path, monkeypatch):
     assert len(items) == 1
     source_id = items[0]["source_id"]
 
-    collection = get_collection()
-    got = collection.get(where={"source_id": source_id}, include=[])
+    got = get_where({"source_id": source_id}, include=[])
     assert len(got.get("ids") or []) > 0
 
     f.unlink()
     del_result = sync_filesystem_sources(data_root=data_root)
     assert del_result["deleted"] == 1
 
-    got_after = collection.get(where={"source_id": source_id}, include=[])
+    got_after = get_where({"source_id": source_id}, include=[])
     assert len(got_after.get("ids") or []) == 0
 
 
@@ -65,16 +64,16 @@ def test_sync_note_file_ingests_structured_qa_cards(tmp_path, monkeypatch):
     assert len(items) == 1
     source_id = items[0]["source_id"]
 
-    collection = get_collection()
-    got = collection.get(where={"source_id": source_id}, include=["metadatas", "documents"])
+    got = get_where({"source_id": source_id}, include=["metadatas", "documents"])
     ids = got.get("ids") or []
     metadatas = got.get("metadatas") or []
     assert len(ids) == 2
     assert all(isinstance(meta, dict) and meta.get("doc_kind") == "qa_card" for meta in metadatas)
     assert all(isinstance(meta, dict) and meta.get("source_type") == "note" for meta in metadatas)
+    assert get_collection(partition_collection_name("qa_card")).count() == 2
 
     note_file.unlink()
     del_result = sync_filesystem_sources(data_root=data_root)
     assert del_result["deleted"] == 1
-    got_after = collection.get(where={"source_id": source_id}, include=[])
+    got_after = get_where({"source_id": source_id}, include=[])
     assert len(got_after.get("ids") or []) == 0
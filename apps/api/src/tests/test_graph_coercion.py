@@ -1,4 +1,9 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, ToolMessage
+
 from src.graph import job_coach_graph
+from src.skills import resume_note_interview
 
 
 def test_graph_direct_answer(monkeypatch):
@@ -10,3 +15,52 @@ def test_graph_direct_answer(monkeypatch):
     result = job_coach_graph.run_graph("测试问题", history=[])
     assert result.get("answer") == "你好"
     assert result.get("tool_results") == []
+
+
+def test_async_graph_runs_resume_tool_without_sync_calls(monkeypatch):
+    def sync_call(*args, **kwargs):
+        raise AssertionError("the async graph must not make blocking calls")
+
+    async def fake_aretrieve(query, top_k, where):
+        if where.get("source_type") == "resume":
+            return [{"id": "resume:0", "text": "Redis Lua 扣减库存", "metadata": {}, "score": 0.1}]
+        return [
+            {
+                "id": "note:qa:1",
+                "text": "",
+                "metadata": {"question_id": "q1", "question": "Redis 锁如何续期？", "standard_answer": "看门狗续期。"},
+                "score": 0.05,
+            }
+        ]
+
+    monkeypatch.setattr(job_coach_graph, "chat", sync_call)
+    monkeypatch.setattr(resume_note_interview, "retrieve", sync_call)
+    monkeypatch.setattr(resume_note_interview, "aretrieve", fake_aretrieve)
+    session = {"mode": "resume_interview", "active_source_type": "resume", "active_source_id": "resume_1"}
+
+    result = asyncio.run(job_coach_graph.arun_graph("开始面试", history=[], session=session))
+    assert "Redis 锁如何续期？" in result["answer"]
+    assert result["tool_results"][0]["name"] == "run_resume_note_interview_turn"
+    assert result["session"]["resume_interview_state"]["current_question_id"] == "q1"
+
+
+def test_graph_result_reads_tool_artifact_without_parsing_content():
+    artifact = {
+        "answer": "题目：Redis 锁如何续期？",
+        "citations": [{"id": "note:qa:1", "quote": "Redis 锁如何续期？"}],
+        "used_context": [{"id": "note:qa:1", "metadata": {}, "score": 0.05}],
+        "session": {"resume_interview_state": {"current_question_id": "q1"}},
+    }
+    messages = [
+        ToolMessage(
+            content=artifact["answer"],
+            artifact=artifact,
+            tool_call_id="call_1",
+            name="run_resume_note_interview_turn",
+        ),
+        AIMessage(content=artifact["answer"]),
+    ]
+    result = job_coach_graph._graph_result(messages)
+    assert result["citations"] is artifact["citations"]
+    assert result["session"]["resume_interview_state"]["current_question_id"] == "q1"
+    assert result["tool_results"] == [{"name": "run_resume_note_interview_turn", "result": artifact["answer"]}]
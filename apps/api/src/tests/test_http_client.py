@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import httpx
+
+from src.core import http_client
+from src.llm import zhipu
+
+
+def _mock_transport(seen: list[dict]) -> httpx.MockTransport:
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(
+            {
+                "url": str(request.url),
+                "auth": request.headers.get("Authorization"),
+                "body": json.loads(request.content.decode("utf-8")),
+            }
+        )
+        return httpx.Response(200, json={"choices": [{"message": {"content": "pong"}}]})
+
+    return httpx.MockTransport(handler)
+
+
+def test_sync_client_is_shared(monkeypatch):
+    monkeypatch.setattr(http_client, "_SYNC_CLIENT", None)
+    first = http_client.get_http_client()
+    second = http_client.get_http_client()
+    assert first is second
+    http_client.close_http_client()
+    assert http_client._SYNC_CLIENT is None
+
+
+def test_chat_uses_pooled_client(monkeypatch):
+    seen: list[dict] = []
+    monkeypatch.setenv("ZHIPUAI_API_KEY", "test-key")
+    monkeypatch.setenv("ZHIPUAI_BASE_URL", "https://llm.test/v4")
+    monkeypatch.setenv("LLM_LIMITER_BACKEND", "local")
+    monkeypatch.setattr(http_client, "_SYNC_CLIENT", httpx.Client(transport=_mock_transport(seen)))
+
+    assert zhipu.chat([{"role": "user", "content": "ping"}]) == "pong"
+    assert zhipu.chat([{"role": "user", "content": "ping"}]) == "pong"
+    assert len(seen) == 2
+    assert seen[0]["url"] == "https://llm.test/v4/chat/completions"
+    assert seen[0]["auth"] == "Bearer test-key"
+    assert seen[0]["body"]["messages"] == [{"role": "user", "content": "ping"}]
+
+
+def test_achat_uses_async_client(monkeypatch):
+    seen: list[dict] = []
+    monkeypatch.setenv("ZHIPUAI_API_KEY", "test-key")
+    monkeypatch.setenv("ZHIPUAI_BASE_URL", "https://llm.test/v4")
+    monkeypatch.setenv("LLM_LIMITER_BACKEND", "local")
+
+    async def run() -> str:
+        client = httpx.AsyncClient(transport=_mock_transport(seen))
+        http_client._ASYNC_CLIENTS[asyncio.get_running_loop()] = client
+        try:
+            return await zhipu.achat([{"role": "user", "content": "ping"}])
+        finally:
+            await http_client.aclose_http_client()
+
+    assert asyncio.run(run()) == "pong"
+    assert len(seen) == 1
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.core import metrics
+from src.graph import job_coach_graph
+from src.llm import rate_limit
+from src.llm.errors import LLMRateLimitTimeout, LLMUnavailableError
+from src.skills import interview_qa
+
+
+def _settings(**overrides):
+    base = {
+        "llm_limiter_backend": "local",
+        "llm_max_concurrency": 1,
+        "llm_rate_per_s": 0.0,
+        "llm_rate_burst": 1,
+        "llm_queue_timeout_ms": 30,
+        "zhipu_timeout_s": 30.0,
+    }
+    base.update(overrides)
+    return SimpleNamespace(**base)
+
+
+def test_concurrency_cap_times_out_and_releases(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_LOCAL", rate_limit._LocalLimiter())
+    monkeypatch.setattr(rate_limit, "get_settings", lambda: _settings())
+    metrics.reset_metrics()
+
+    first = rate_limit.acquire_llm_slot()
+    with pytest.raises(LLMRateLimitTimeout):
+        rate_limit.acquire_llm_slot()
+    assert metrics.get_value("llm_limiter_timeouts_total") == 1
+    assert metrics.get_value("llm_limiter_queue_depth") == 0
+
+    rate_limit.release_llm_slot(first)
+    with rate_limit.llm_slot() as slot:
+        assert slot.backend == "local"
+
+
+def test_token_bucket_limits_rate(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_LOCAL", rate_limit._LocalLimiter())
+    monkeypatch.setattr(
+        rate_limit,
+        "get_settings",
+        lambda: _settings(llm_max_concurrency=0, llm_rate_per_s=1.0, llm_rate_burst=2),
+    )
+    rate_limit.acquire_llm_slot()
+    rate_limit.acquire_llm_slot()
+    with pytest.raises(LLMRateLimitTimeout):
+        rate_limit.acquire_llm_slot()
+
+
+def test_graph_fallback_does_not_call_llm_again_when_overloaded(monkeypatch):
+    calls: list[list[dict]] = []
+
+    def overloaded_chat(messages):
+        raise LLMUnavailableError("ZhipuAI overloaded: HTTP 429")
+
+    def counting_chat(messages):
+        calls.append(messages)
+        return "should not be called"
+
+    monkeypatch.setattr(job_coach_graph, "chat", overloaded_chat)
+    monkeypatch.setattr(interview_qa, "chat", counting_chat)
+
+    result = job_coach_graph.run_graph("你好", history=[])
+    assert calls == []
+    assert "overloaded" in result.get("answer", "")
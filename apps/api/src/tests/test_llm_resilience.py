@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from src.core.cancellation import CancelScope, RequestCancelled, cancel_scope, current_cancel_scope
+from src.llm import resilience
+from src.llm.errors import LLMCircuitOpenError, LLMRateLimitTimeout
+
+
+def _breaker(**overrides) -> resilience.CircuitBreaker:
+    kwargs = {"failure_threshold": 2, "reset_timeout_s": 0.05, "half_open_probes": 1}
+    kwargs.update(overrides)
+    return resilience.CircuitBreaker("test", **kwargs)
+
+
+def test_breaker_opens_after_threshold_and_recovers_via_probe():
+    breaker = _breaker()
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == resilience.OPEN
+    with pytest.raises(LLMCircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == resilience.HALF_OPEN
+    with pytest.raises(LLMCircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == resilience.CLOSED
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = _breaker(failure_threshold=1)
+    breaker.before_call()
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == resilience.OPEN
+
+
+def test_only_upstream_errors_trip_breaker():
+    request = httpx.Request("POST", "https://llm.test")
+    assert resilience.is_upstream_failure(httpx.ReadTimeout("slow", request=request))
+    assert resilience.is_upstream_failure(
+        httpx.HTTPStatusError("boom", request=request, response=httpx.Response(502, request=request))
+    )
+    assert not resilience.is_upstream_failure(
+        httpx.HTTPStatusError("bad", request=request, response=httpx.Response(400, request=request))
+    )
+    assert not resilience.is_upstream_failure(LLMRateLimitTimeout("queue"))
+
+
+@pytest.fixture
+def request_scope():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    scope = CancelScope(loop)
+    with cancel_scope(scope):
+        yield scope
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_hedged_call_returns_faster_hedge_and_aborts_primary(request_scope):
+    aborted: list[bool] = []
+    callers: list[str] = []
+
+    def slow():
+        callers.append(threading.current_thread().name)
+        try:
+            current_cancel_scope().run(asyncio.sleep(1))
+        except RequestCancelled:
+            aborted.append(True)
+            raise
+        return "slow"
+
+    def fast():
+        return "hedge"
+
+    started = time.monotonic()
+    assert resilience.hedged_call(slow, fast, delay_s=0.02) == "hedge"
+    assert time.monotonic() - started < 0.5
+    assert callers == [threading.current_thread().name]
+    assert aborted == [True]
+    assert not request_scope.cancelled
+
+
+def test_hedged_call_keeps_primary_when_hedge_has_no_slot(request_scope):
+    def primary():
+        time.sleep(0.05)
+        return "primary"
+
+    def no_slot():
+        raise LLMRateLimitTimeout("no free LLM slot for hedged request")
+
+    assert resilience.hedged_call(primary, no_slot, delay_s=0.01) == "primary"
+
+
+def test_hedged_call_propagates_request_cancellation(request_scope):
+    def slow():
+        return current_cancel_scope().run(asyncio.sleep(1))
+
+    threading.Timer(0.05, request_scope.cancel).start()
+    with pytest.raises(RequestCancelled):
+        resilience.hedged_call(slow, slow, delay_s=0.01)
+
+
+def test_async_hedged_call_cancels_loser():
+    cancelled: list[bool] = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "slow"
+
+    async def fast():
+        return "hedge"
+
+    async def run():
+        result = await resilience.ahedged_call(slow, fast, delay_s=0.01)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "hedge"
+    assert cancelled == [True]
@@ -0,0 +1,206 @@
+import numpy as np
+
+from src.llm import response_cache, zhipu
+
+
+class _FakePipeline:
+    def __init__(self, redis_obj):
+        self._r = redis_obj
+        self._ops: list[tuple] = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        out = [getattr(self._r, name)(*args, **kwargs) for name, args, kwargs in self._ops]
+        self._ops.clear()
+        return out
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.kv: dict[str, str] = {}
+        self.h: dict[str, dict[str, str]] = {}
+        self.z: dict[str, dict[str, float]] = {}
+
+    def get(self, key):
+        return self.kv.get(key)
+
+    def set(self, key, value, ex=None):
+        _ = ex
+        self.kv[key] = str(value)
+        return True
+
+    def hget(self, key, field):
+        return self.h.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        self.h.setdefault(key, {})[str(field)] = str(value)
+
+    def hmget(self, key, fields):
+        return [self.h.get(key, {}).get(f) for f in fields]
+
+    def hdel(self, key, *fields):
+        for f in fields:
+            self.h.get(key, {}).pop(f, None)
+
+    def zadd(self, key, mapping):
+        self.z.setdefault(key, {}).update(mapping)
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        _ = high
+        floor = float(str(low).lstrip("("))
+        rows = sorted((s, m) for m, s in self.z.get(key, {}).items() if s > floor)
+        return [(m, s) for s, m in rows] if withscores else [m for _s, m in rows]
+
+    def zrange(self, key, start, end, withscores=False):
+        rows = sorted(self.z.get(key, {}).items(), key=lambda x: x[1])
+        end = len(rows) + end if end < 0 else end
+        rows = rows[start : end + 1]
+        return rows if withscores else [m for m, _s in rows]
+
+    def zrem(self, key, *members):
+        for m in members:
+            self.z.get(key, {}).pop(m, None)
+
+    def expire(self, key, ttl):
+        _ = key, ttl
+        return True
+
+    def pipeline(self, transaction=True):
+        _ = transaction
+        return _FakePipeline(self)
+
+
+def _setup(monkeypatch, *, exact: str = "", semantic: str = "") -> list[dict]:
+    calls: list[dict] = []
+    fake = _FakeRedis()
+    monkeypatch.setenv("ZHIPUAI_API_KEY", "test-key")
+    monkeypatch.setenv("LLM_CACHE_MODES", exact)
+    monkeypatch.setenv("LLM_SEMANTIC_CACHE_MODES", semantic)
+    monkeypatch.setattr(response_cache, "get_redis_client", lambda: fake)
+    monkeypatch.setattr(response_cache, "_SEMANTIC_INDEX", response_cache._SemanticIndexCache())
+
+    def fake_post(url, payload, headers, timeout, *, hedge=False):
+        _ = url, headers, timeout, hedge
+        calls.append(payload)
+        return {"choices": [{"message": {"content": f"answer {len(calls)}"}}]}
+
+    monkeypatch.setattr(zhipu, "_post_chat", fake_post)
+    return calls
+
+
+def test_exact_cache_hits_on_normalized_messages(monkeypatch):
+    calls = _setup(monkeypatch, exact="chat")
+    with response_cache.llm_cache_mode("chat"):
+        first = zhipu.chat([{"role": "user", "content": "HashMap 和 ConcurrentHashMap 区别"}])
+        second = zhipu.chat([{"role": "user", "content": "  HashMap 和   ConcurrentHashMap 区别 "}])
+    assert first == second == "answer 1"
+    assert len(calls) == 1
+
+
+def test_cache_is_off_for_modes_not_enabled(monkeypatch):
+    calls = _setup(monkeypatch, exact="chat")
+    with response_cache.llm_cache_mode("resume_interview"):
+        zhipu.chat([{"role": "user", "content": "same"}])
+        zhipu.chat([{"role": "user", "content": "same"}])
+    assert len(calls) == 2
+
+
+def test_semantic_cache_matches_similar_question_in_same_context(monkeypatch):
+    calls = _setup(monkeypatch, semantic="chat")
+
+    def fake_embed(texts):
+        # Questions mentioning ConcurrentHashMap land on nearly the same vector.
+        return [[1.0, 0.01 * len(t), 0.0] if "ConcurrentHashMap" in t else [0.0, 0.0, 1.0] for t in texts]
+
+    monkeypatch.setattr(response_cache, "embed_texts", fake_embed)
+    system = {"role": "system", "content": "router"}
+    with response_cache.llm_cache_mode("chat"):
+        first = zhipu.chat([system, {"role": "user", "content": "HashMap 和 ConcurrentHashMap 区别"}])
+        second = zhipu.chat([system, {"role": "user", "content": "HashMap 与 ConcurrentHashMap 有什么区别？"}])
+        other = zhipu.chat([system, {"role": "user", "content": "讲讲 Redis"}])
+        new_context = zhipu.chat(
+            [{"role": "system", "content": "interviewer"}, {"role": "user", "content": "HashMap 和 ConcurrentHashMap 区别"}]
+        )
+
+    assert first == second == "answer 1"
+    assert other == "answer 2"
+    assert new_context == "answer 3"
+    assert len(calls) == 3
+
+
+def test_semantic_cache_stores_quantized_vectors_and_reads_float32_ones(monkeypatch):
+    calls = _setup(monkeypatch, semantic="chat")
+    monkeypatch.setenv("EMBEDDING_QUANTIZATION", "int8")
+    monkeypatch.setattr(response_cache, "embed_texts", lambda texts: [[1.0, 0.02, 0.0] for _ in texts])
+    messages = [{"role": "system", "content": "router"}, {"role": "user", "content": "讲讲 Redis 锁"}]
+    with response_cache.llm_cache_mode("chat"):
+        zhipu.chat(messages)
+        fake = response_cache.get_redis_client()
+        (vectors,) = [fields for key, fields in fake.h.items() if key.endswith(":vec")]
+        assert all(raw.startswith("i8:") for raw in vectors.values())
+
+        # An entry written before quantization was enabled (bare float32) still matches.
+        key = next(key for key in fake.h if key.endswith(":vec"))
+        legacy = response_cache.encode_vector([1.0, 0.02, 0.0], "none")
+        fake.h[key] = {member: legacy for member in vectors}
+        monkeypatch.setattr(response_cache, "_SEMANTIC_INDEX", response_cache._SemanticIndexCache())
+        assert zhipu.chat(messages) == "answer 1"
+    assert len(calls) == 1
+
+
+def test_semantic_match_compares_the_decoded_vector_with_the_threshold():
+    cache = response_cache._SemanticIndexCache()
+    # int8 codes whose scale overshoots: the scanned dot product is 1.1, the decoded vector's cosine 1.0.
+    index = response_cache._ScopeIndex(
+        ids=["stale", "near", "far"],
+        scores=[0.0, 10.0, 10.0],
+        vectors=np.array([[127, 0], [127, 0], [90, 90]], dtype=np.int8),
+        scales=np.array([0.0087, 0.0087, 0.0087], dtype=np.float32),
+    )
+    matches = cache.best_matches(index, np.array([1.0, 0.0], dtype=np.float32), not_before=5.0)
+    assert [cid for cid, _similarity in matches] == ["near", "far"]
+    assert abs(matches[0][1] - 1.0) < 1e-6
+
+
+def test_semantic_index_drops_restored_trimmed_and_expired_entries():
+    fake = _FakeRedis()
+    cache = response_cache._SemanticIndexCache()
+    idx, vec = response_cache._sem_index_key("s"), response_cache._sem_vector_key("s")
+    for cid, score in (("a", 1.0), ("b", 2.0), ("c", 3.0)):
+        fake.hset(vec, cid, response_cache.encode_vector([1.0, 0.0], "none"))
+        fake.zadd(idx, {cid: score})
+    assert cache.sync(fake, "s", not_before=0.0).ids == ["a", "b", "c"]
+
+    # "a" is stored again and "b" trimmed away.
+    fake.zadd(idx, {"a": 4.0})
+    fake.zrem(idx, "b")
+    index = cache.sync(fake, "s", not_before=0.0)
+    assert index.ids == ["c", "a"]
+    assert len(index.scores) == index.vectors.shape[0] == 2
+
+    assert cache.sync(fake, "s", not_before=3.5).ids == ["a"]
+    fake.zrem(idx, "a", "c")
+    assert cache.sync(fake, "s", not_before=0.0).ids == []
+
+
+def test_semantic_lookup_falls_through_to_the_next_live_candidate(monkeypatch):
+    calls = _setup(monkeypatch, semantic="chat")
+    vectors = {"讲讲 Redis 锁": [1.0, 0.0, 0.0], "讲讲分布式锁": [0.8, 0.6, 0.0], "Redis 锁怎么实现": [1.0, 0.3, 0.0]}
+    monkeypatch.setattr(response_cache, "embed_texts", lambda texts: [vectors[t] for t in texts])
+    system = {"role": "system", "content": "router"}
+    with response_cache.llm_cache_mode("chat"):
+        assert zhipu.chat([system, {"role": "user", "content": "讲讲 Redis 锁"}]) == "answer 1"
+        assert zhipu.chat([system, {"role": "user", "content": "讲讲分布式锁"}]) == "answer 2"
+        # Both entries now clear the threshold, and the closer one loses its answer after the index last saw it.
+        monkeypatch.setenv("LLM_SEMANTIC_CACHE_THRESHOLD", "0.7")
+        fake = response_cache.get_redis_client()
+        (answers,) = [fields for key, fields in fake.h.items() if key.endswith(":ans")]
+        answers.pop(next(cid for cid, answer in answers.items() if answer == "answer 1"))
+        assert zhipu.chat([system, {"role": "user", "content": "Redis 锁怎么实现"}]) == "answer 2"
+    assert len(calls) == 2
@@ -0,0 +1,117 @@
+import numpy as np
+
+from src.rag import numpy_store, quantization, store
+
+
+def _vectors(n: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_numpy_collection_matches_brute_force_and_filters(tmp_path):
+    collection = numpy_store.NumpyCollection(tmp_path / "c", name="c", space="cosine")
+    vectors = _vectors(40)
+    metas = [{"source_type": "note" if i % 2 else "resume", "n": i} for i in range(40)]
+    collection.upsert(ids=[f"c{i}" for i in range(40)], embeddings=vectors, documents=[str(i) for i in range(40)],
+                      metadatas=metas)
+
+    query = vectors[3]
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = 1.0 - normed @ (query / np.linalg.norm(query))
+    got = collection.query(query_embeddings=[query.tolist()], n_results=5, include=["distances"])
+    assert got["ids"][0] == [f"c{i}" for i in np.argsort(expected)[:5]]
+    assert np.allclose(got["distances"][0], np.sort(expected)[:5], atol=1e-5)
+
+    where = {"$and": [{"source_type": {"$eq": "note"}}, {"n": {"$gte": 30}}]}
+    got = collection.query(query_embeddings=[query.tolist()], n_results=10, where=where, include=["metadatas"])
+    assert sorted(meta["n"] for meta in got["metadatas"][0]) == [31, 33, 35, 37, 39]
+    assert collection.get(where={"n": {"$in": [1, 2]}}, include=[])["ids"] == ["c1", "c2"]
+    assert collection.get(where={"missing": {"$ne": 1}}, include=[])["ids"] == []
+
+
+def test_numpy_collection_upserts_deletes_compacts_and_reloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(numpy_store, "_COMPACT_DEAD_RATIO", 0.5)
+    path = tmp_path / "c"
+    writer = numpy_store.NumpyCollection(path, name="c")
+    reader = numpy_store.NumpyCollection(path, name="c")
+    vectors = _vectors(10)
+    writer.upsert(ids=[f"c{i}" for i in range(10)], embeddings=vectors, documents=["old"] * 10,
+                  metadatas=[{"source_id": "a" if i < 5 else "b"} for i in range(10)])
+    writer.upsert(ids=["c0"], embeddings=vectors[:1], documents=["new"], metadatas=[{"source_id": "a"}])
+    writer.delete(where={"source_id": "b"})
+
+    # Another worker sees the writes through the manifest.
+    assert reader.count() == 5
+    assert reader.get(ids=["c0", "c7"], include=["documents"]) == {"ids": ["c0"], "documents": ["new"]}
+    assert len(list(path.glob("seg-*.npy"))) == 1
+
+    reader.upsert(ids=["c9"], embeddings=vectors[9:], documents=["back"], metadatas=[{"source_id": "b"}])
+    assert writer.count() == 6
+    page = writer.get(include=["embeddings"], limit=2, offset=4)
+    assert page["ids"] == ["c0", "c9"]
+    assert np.allclose(page["embeddings"][1], vectors[9] / np.linalg.norm(vectors[9]), atol=1e-6)
+
+
+def test_store_functions_route_to_numpy_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTOR_STORE", "numpy")
+    monkeypatch.setenv("NUMPY_STORE_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setattr(numpy_store, "_COLLECTIONS", {})
+    monkeypatch.setattr(store, "_CHUNK_CACHE", store._ChunkCache())
+    vectors = _vectors(3)
+    store.upsert_chunks(
+        ids=["card", "note", "cv"],
+        chunks=["Q&A", "note text", "resume text"],
+        embeddings=vectors.tolist(),
+        metadatas=[
+            {"source_type": "note", "doc_kind": "qa_card", "source_id": "n1"},
+            {"source_type": "note", "source_id": "n1"},
+            {"source_type": "resume", "source_id": "r1"},
+        ],
+    )
+
+    assert (tmp_path / "vectors" / "job_coach_qa_card" / "manifest.json").exists()
+    assert store.count_collection() == 3
+    raw = store.query_collection(embedding=vectors[0].tolist(), top_k=5, where={"source_type": "note"})
+    assert sorted(raw["ids"][0]) == ["card", "note"]
+    assert raw["space"] == "cosine"
+    assert [chunk["id"] for chunk in store.get_chunks(["cv", "card"])] == ["cv", "card"]
+
+    store.delete_by_source("n1")
+    assert store.count_collection() == 1
+
+
+def test_quantized_segments_rescore_to_exact_results(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_QUANTIZATION", "int8")
+    monkeypatch.setenv("VECTOR_RESCORE_FACTOR", "3")
+    collection = numpy_store.NumpyCollection(tmp_path / "c", name="c", space="l2")
+    vectors = _vectors(200, dim=16, seed=1)
+    collection.upsert(ids=[f"c{i}" for i in range(200)], embeddings=vectors, metadatas=[{"n": i} for i in range(200)])
+    assert (tmp_path / "c" / "seg-00000000.codes.npy").exists()
+
+    codes, scales = quantization.quantize(vectors, "int8")
+    assert codes.dtype == np.int8
+    assert np.abs(quantization.dequantize(codes, scales) - vectors).max() <= scales.max() / 2 + 1e-6
+
+    query = vectors[7] + 0.05
+    expected = ((vectors - query) ** 2).sum(axis=1)
+    got = collection.query(query_embeddings=[query.tolist()], n_results=5, include=["distances"])
+    assert got["ids"][0] == [f"c{i}" for i in np.argsort(expected)[:5]]
+    assert np.allclose(got["distances"][0], np.sort(expected)[:5], atol=1e-4)
+
+
+def test_quantized_segments_without_float_tier_store_codes_only(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_QUANTIZATION", "int8")
+    monkeypatch.setenv("VECTOR_RESCORE_FACTOR", "0")
+    collection = numpy_store.NumpyCollection(tmp_path / "c", name="c", space="l2")
+    vectors = _vectors(200, dim=16, seed=2)
+    collection.upsert(ids=[f"c{i}" for i in range(200)], embeddings=vectors, metadatas=[{"n": i} for i in range(200)])
+    assert not (tmp_path / "c" / "seg-00000000.npy").exists()
+    assert (tmp_path / "c" / "seg-00000000.codes.npy").exists()
+
+    codes, scales = quantization.quantize(vectors, "int8")
+    decoded = quantization.dequantize(codes, scales)
+    query = vectors[7] + 0.05
+    expected = ((decoded - query) ** 2).sum(axis=1)
+    got = collection.query(query_embeddings=[query.tolist()], n_results=5, include=["distances"])
+    assert got["ids"][0] == [f"c{i}" for i in np.argsort(expected)[:5]]
+    assert np.allclose(got["distances"][0], np.sort(expected)[:5], atol=1e-4)
+    assert np.allclose(collection.get(ids=["c3"], include=["embeddings"])["embeddings"][0], decoded[3], atol=1e-6)
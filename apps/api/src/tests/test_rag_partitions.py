@@ -0,0 +1,74 @@
+import numpy as np
+
+from src.core import deps
+from src.rag import migrate_partitions, numpy_store, store
+
+
+def test_route_where_drops_filters_the_partition_implies(monkeypatch):
+    monkeypatch.setenv("CHROMA_PARTITIONING", "source_type")
+    qa_where = {"$and": [{"source_type": {"$eq": "note"}}, {"doc_kind": {"$eq": "qa_card"}}]}
+    assert store.route_where(qa_where) == [("job_coach_qa_card", None)]
+    assert store.route_where({"$and": [{"source_type": {"$eq": "resume"}}, {"source_id": {"$eq": "r1"}}]}) == [
+        ("job_coach_resume", {"source_id": {"$eq": "r1"}})
+    ]
+    assert store.route_where({"source_type": "note"}) == [("job_coach_note", None), ("job_coach_qa_card", None)]
+    assert store.route_where({"source_type": "blog"}) == [("job_coach_other", {"source_type": "blog"})]
+    assert [name for name, _ in store.route_where({"source_id": "s1"})] == [
+        store.partition_collection_name(partition) for partition in store.PARTITIONS
+    ]
+
+    monkeypatch.setenv("CHROMA_PARTITIONING", "off")
+    assert store.route_where(qa_where) == [("job_coach", qa_where)]
+
+
+def test_migration_splits_single_collection_and_queries_route(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(deps, "_client", None)
+    monkeypatch.setattr(store, "_CHUNK_CACHE", store._ChunkCache())
+    rng = np.random.default_rng(0)
+    legacy = deps.get_chroma_client().create_collection(store.COLLECTION_NAME)
+    legacy.add(
+        ids=["r:0", "n:qa:0", "n:qa:1", "j:0"],
+        embeddings=rng.normal(size=(4, 8)).tolist(),
+        documents=["resume", "card 0", "card 1", "jd"],
+        metadatas=[
+            {"source_type": "resume", "source_id": "r"},
+            {"source_type": "note", "source_id": "n", "doc_kind": "qa_card"},
+            {"source_type": "note", "source_id": "n", "doc_kind": "qa_card"},
+            {"source_type": "jd", "source_id": "j"},
+        ],
+    )
+
+    result = migrate_partitions.migrate_to_partitions()
+
+    assert result["partitions"] == {"resume": 1, "qa_card": 2, "jd": 1}
+    assert store.COLLECTION_NAME not in [c.name for c in deps.get_chroma_client().list_collections()]
+    assert migrate_partitions.migrate_to_partitions()["migrated"] == 0
+    raw = store.query_collection(
+        embedding=rng.normal(size=8).tolist(),
+        top_k=5,
+        where={"$and": [{"source_type": {"$eq": "note"}}, {"doc_kind": {"$eq": "qa_card"}}]},
+    )
+    assert sorted(raw["ids"][0]) == ["n:qa:0", "n:qa:1"]
+    assert store.count_collection() == 4
+    assert [chunk["text"] for chunk in store.get_chunks(["j:0", "n:qa:1"])] == ["jd", "card 1"]
+
+
+def test_partitions_in_different_spaces_merge_on_similarity(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTOR_STORE", "numpy")
+    monkeypatch.setenv("NUMPY_STORE_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setattr(numpy_store, "_COLLECTIONS", {})
+    monkeypatch.setattr(store, "_CHUNK_CACHE", store._ChunkCache())
+    # Squared l2 distance 0.6 (similarity 0.625) against cosine distance 0.5 (similarity 0.5).
+    monkeypatch.setenv("CHROMA_SPACE", "l2")
+    store.upsert_chunks(ids=["jd"], chunks=["jd"], embeddings=[[1.0, 0.6**0.5]], metadatas=[{"source_type": "jd"}])
+    monkeypatch.setenv("CHROMA_SPACE", "cosine")
+    store.upsert_chunks(ids=["cv"], chunks=["cv"], embeddings=[[1.0, 3**0.5]], metadatas=[{"source_type": "resume"}])
+
+    raw = store.query_collection(embedding=[1.0, 0.0], top_k=2, where=None)
+
+    assert raw["ids"] == [["jd", "cv"]]
+    assert np.allclose(raw["similarities"][0], [0.625, 0.5])
+    assert raw["space"] is None
+    assert store.count_collection({"source_type": "jd"}) == 1
+    assert store.count_collection() == 2
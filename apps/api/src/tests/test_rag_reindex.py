@@ -0,0 +1,147 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.core import deps
+from src.rag import embeddings, numpy_store, reindex, store
+
+
+def test_reindex_switches_alias_to_rebuilt_cosine_collection(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setenv("CHROMA_SPACE", "l2")
+    monkeypatch.setattr(deps, "_client", None)
+
+    vectors = np.random.default_rng(0).normal(size=(40, 8)).tolist()
+    store.upsert_chunks(
+        ids=[f"c{i}" for i in range(40)],
+        chunks=[f"chunk {i}" for i in range(40)],
+        embeddings=vectors,
+        metadatas=[{"source_type": "jd", "source_id": "s1", "idx": i} for i in range(40)],
+    )
+    name = store.partition_collection_name("jd")
+    assert store.collection_space(store.get_collection(name)) == "l2"
+
+    result = reindex.reindex(name=name, space="cosine", m=8, ef_search_sweep=[10, 50], sample=10, k=5, settle_s=0)
+
+    assert store.active_collection_name(name) == result["active"] != name
+    collection = store.get_collection(name)
+    assert collection.count() == 40
+    assert store.collection_space(collection) == "cosine"
+    assert [row["ef_search"] for row in result["report"]["after"]] == [10, 50]
+    assert all(0.0 <= row["recall"] <= 1.0 for row in result["report"]["after"])
+    assert store.get_chunks(["c3"])[0]["text"] == "chunk 3"
+    assert name not in [c.name for c in deps.get_chroma_client().list_collections()]
+
+
+def test_writes_to_the_old_collection_around_the_switch_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(deps, "_client", None)
+    vectors = np.random.default_rng(1).normal(size=(12, 8)).tolist()
+    metas = [{"source_type": "jd", "source_id": "s1"} for _ in range(12)]
+    store.upsert_chunks(ids=[f"c{i}" for i in range(10)], chunks=["old"] * 10, embeddings=vectors[:10],
+                        metadatas=metas[:10])
+    name = store.partition_collection_name("jd")
+    old = store.get_collection(name)
+    with pytest.raises(ValueError):
+        reindex.recall_report(old, ef_search_values=[10, 50], sample=3, k=2)
+    switch = store.switch_collection_alias
+
+    def switch_with_traffic(target, logical):
+        switch(target, logical)
+        # A worker that resolved the old name before the switch, and one that already sees the new collection.
+        old.upsert(ids=["c0", "c10"], embeddings=vectors[:1] + vectors[10:11], documents=["late", "late"],
+                   metadatas=metas[:2])
+        old.delete(ids=["c1"])
+        store.upsert_chunks(ids=["c11"], chunks=["new"], embeddings=vectors[11:], metadatas=metas[11:])
+
+    monkeypatch.setattr(reindex, "switch_collection_alias", switch_with_traffic)
+    result = reindex.reindex(name=name, sample=3, k=2, settle_s=0)
+
+    assert result["late_writes"] == {"upserted": 2, "deleted": 1}
+    texts = {chunk["id"]: chunk["text"] for chunk in store.get_chunks([f"c{i}" for i in range(12)])}
+    assert texts["c0"] == texts["c10"] == "late"
+    assert texts["c11"] == "new"
+    assert "c1" not in texts
+    assert len(texts) == 11
+
+
+def test_distance_to_similarity_follows_collection_space():
+    assert store.distance_to_similarity(0.0, "cosine") == 1.0
+    assert store.distance_to_similarity(1.5, "cosine") == 0.0
+    assert store.distance_to_similarity(1.0, "l2") == 0.5
+
+
+def test_changed_embedding_dim_is_rejected_until_reembedded(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setenv("ZHIPUAI_EMBED_DIM", "32")
+    monkeypatch.delenv("ZHIPUAI_API_KEY", raising=False)
+    monkeypatch.setattr(deps, "_client", None)
+    texts = [f"chunk {i}" for i in range(6)]
+    store.upsert_chunks(
+        ids=[f"c{i}" for i in range(6)],
+        chunks=texts,
+        embeddings=embeddings.embed_texts(texts),
+        metadatas=[{"source_type": "jd", "source_id": "s1"} for _ in texts],
+    )
+    name = store.partition_collection_name("jd")
+    assert store.collection_embedding_dim(store.get_collection(name)) == 32
+
+    monkeypatch.setenv("ZHIPUAI_EMBED_DIM", "16")
+    with pytest.raises(store.EmbeddingDimensionError):
+        store.query_collection(embedding=embeddings.embed_texts(["chunk 1"])[0], top_k=3, where={"source_type": "jd"})
+
+    result = reindex.reindex(name=name, reembed=True, sample=3, k=2, settle_s=0)
+    assert result["copied"] == 6
+    assert store.collection_embedding_dim(store.get_collection(name)) == 16
+    raw = store.query_collection(embedding=embeddings.embed_texts(["chunk 1"])[0], top_k=1, where={"source_type": "jd"})
+    assert raw["ids"] == [["c1"]]
+
+
+def test_numpy_reembed_keeps_writes_made_during_the_swap(tmp_path, monkeypatch):
+    monkeypatch.setenv("NUMPY_STORE_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setenv("ZHIPUAI_EMBED_DIM", "8")
+    monkeypatch.delenv("ZHIPUAI_API_KEY", raising=False)
+    monkeypatch.setattr(numpy_store, "_COLLECTIONS", {})
+    live = numpy_store.get_numpy_collection("c")
+    live.upsert(ids=["a"], embeddings=embeddings.embed_texts(["a"]), documents=["a"], metadatas=[{"n": 1}])
+    worker = numpy_store.NumpyCollection(live.path, name="c")
+    catch_up = reindex._catch_up
+    writers: list[threading.Thread] = []
+
+    def write(cid):
+        worker.upsert(ids=[cid], embeddings=embeddings.embed_texts([cid]), documents=[cid], metadatas=[{"n": 2}])
+
+    def racing_catch_up(source, shadow, batch_size, **kwargs):
+        if not writers:
+            result = catch_up(source, shadow, batch_size, **kwargs)
+            write("b")  # after the first pass, picked up by the locked one
+            writers.append(threading.Thread(target=write, args=("c",)))
+            return result
+        writers[0].start()
+        writers[0].join(0.2)
+        assert writers[0].is_alive()  # waits on the write lock until the new directory is in place
+        return catch_up(source, shadow, batch_size, **kwargs)
+
+    monkeypatch.setattr(reindex, "_catch_up", racing_catch_up)
+    result = reindex.reembed_numpy("c")
+    writers[0].join()
+
+    assert result["caught_up"]["upserted"] == 1
+    # The blocked write landed in the new directory once the lock was released.
+    assert live.get(include=["documents"])["documents"] == ["a", "b", "c"]
+    assert not live.path.with_name("c.old").exists()
+
+
+def test_embed_request_asks_for_dimensions_and_truncates_longer_vectors(monkeypatch):
+    monkeypatch.setenv("ZHIPUAI_API_KEY", "test-key")
+    monkeypatch.setenv("ZHIPUAI_EMBED_DIM", "2")
+    sent: list[dict] = []
+
+    def fake_post(url, payload, headers, timeout):
+        sent.append(payload)
+        return {"data": [{"embedding": [3.0, 4.0, 9.0]}]}
+
+    monkeypatch.setattr(embeddings, "post_json", fake_post)
+    assert embeddings.embed_texts(["x"]) == [[0.6000000238418579, 0.800000011920929]]
+    assert sent[0]["dimensions"] == 2
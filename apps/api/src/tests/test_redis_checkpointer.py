@@ -0,0 +1,178 @@
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from redis.exceptions import RedisError
+
+from src.graph import job_coach_graph, redis_checkpointer
+
+
+class _FakePipeline:
+    def __init__(self, redis_obj):
+        self._r = redis_obj
+        self._ops: list = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        results = [getattr(self._r, name)(*args, **kwargs) for name, args, kwargs in self._ops]
+        self._ops.clear()
+        return results
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.h: dict[str, dict[bytes, bytes]] = {}
+        self.ttl: dict[str, int] = {}
+
+    def hgetall(self, key):
+        return dict(self.h.get(key, {}))
+
+    def hset(self, key, mapping=None):
+        bucket = self.h.setdefault(key, {})
+        for field, value in (mapping or {}).items():
+            bucket[field.encode("utf-8")] = value
+        return len(mapping or {})
+
+    def hsetnx(self, key, field, value):
+        bucket = self.h.setdefault(key, {})
+        if field.encode("utf-8") in bucket:
+            return 0
+        bucket[field.encode("utf-8")] = value
+        return 1
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.h.pop(key, None) is not None)
+
+    def expire(self, key, ttl):
+        self.ttl[key] = ttl
+        return True
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+def test_saver_keeps_latest_checkpoint_and_its_writes(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(redis_checkpointer, "get_binary_redis_client", lambda: fake)
+    saver = redis_checkpointer.RedisCheckpointSaver()
+    config = {"configurable": {"thread_id": "conv_1", "checkpoint_ns": ""}}
+
+    first = empty_checkpoint()
+    first["channel_values"] = {"messages": [HumanMessage(content="讲讲 Redis 锁", id="m1")]}
+    saved = saver.put(config, first, {"step": 0}, {})
+    saver.put_writes(saved, [("messages", [AIMessage(content="first")])], "task_a")
+    saver.put_writes(saved, [("messages", [AIMessage(content="retry")])], "task_a")
+
+    got = saver.get_tuple({"configurable": {"thread_id": "conv_1"}})
+    assert got.checkpoint["channel_values"]["messages"][0].content == "讲讲 Redis 锁"
+    assert got.metadata["step"] == 0
+    # A retried task must not overwrite the write its first attempt already recorded.
+    assert [(task, value[0].content) for task, _, value in got.pending_writes] == [("task_a", "first")]
+
+    second = empty_checkpoint()
+    saver.put(saved, second, {"step": 1}, {})
+    got = saver.get_tuple({"configurable": {"thread_id": "conv_1"}})
+    assert got.config["configurable"]["checkpoint_id"] == second["id"]
+    assert got.parent_config["configurable"]["checkpoint_id"] == first["id"]
+    assert got.pending_writes == []
+    assert saver.get_tuple({"configurable": {"thread_id": "conv_1", "checkpoint_id": first["id"]}}) is None
+    assert fake.ttl["jc:{conv_1}:checkpoint"] > 0
+
+
+def test_resumed_turn_appends_question_and_drops_old_tool_calls():
+    stored = [
+        HumanMessage(content="来一道题", id="h1"),
+        AIMessage(content="", id="a1", tool_calls=[{"id": "call_1", "name": "run_interview_turn", "args": {}}]),
+        ToolMessage(content='{"answer": "问题：..."}', tool_call_id="call_1", id="t1"),
+        AIMessage(content="问题：...", id="a2"),
+    ]
+    graph_messages, conversation = job_coach_graph._turn_messages("我的回答", [], stored, True)
+
+    assert [msg.id for msg in graph_messages[:-1]] == ["a1", "t1"]
+    assert all(msg.type == "remove" for msg in graph_messages[:-1])
+    assert graph_messages[-1].content == "我的回答"
+    assert [msg.id for msg in conversation[:-1]] == ["h1", "a2"]
+
+
+class _FailingWrites(_FakeRedis):
+    def __init__(self, *, delete_fails: bool = False):
+        super().__init__()
+        self.delete_fails = delete_fails
+        self.fail_writes = False
+
+    def hset(self, key, mapping=None):
+        if self.fail_writes:
+            raise RedisError("write failed")
+        return super().hset(key, mapping=mapping)
+
+    def delete(self, *keys):
+        if self.fail_writes and self.delete_fails:
+            raise RedisError("delete failed")
+        return super().delete(*keys)
+
+
+def test_failed_checkpoint_write_drops_the_stale_checkpoint(monkeypatch):
+    for delete_fails in (False, True):
+        fake = _FailingWrites(delete_fails=delete_fails)
+        monkeypatch.setattr(redis_checkpointer, "get_binary_redis_client", lambda: fake)
+        saver = redis_checkpointer.RedisCheckpointSaver()
+        config = {"configurable": {"thread_id": "conv_1", "checkpoint_ns": ""}}
+        saved = saver.put(config, empty_checkpoint(), {"step": 0}, {})
+
+        fake.fail_writes = True
+        saver.put(saved, empty_checkpoint(), {"step": 1}, {})
+        assert ("jc:{conv_1}:checkpoint" in fake.h) is delete_fails
+        assert saver.get_tuple({"configurable": {"thread_id": "conv_1"}}) is None
+
+        fake.fail_writes = False
+        latest = empty_checkpoint()
+        saver.put(saved, latest, {"step": 2}, {})
+        assert saver.get_tuple({"configurable": {"thread_id": "conv_1"}}).checkpoint["id"] == latest["id"]
+
+
+class _Tool:
+    def __init__(self, answer: str):
+        self.answer = answer
+
+    def func(self, **kwargs):
+        return self.answer
+
+
+def test_graph_failure_seeds_checkpoint_and_read_failure_falls_back_to_transcript(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(redis_checkpointer, "get_binary_redis_client", lambda: fake)
+    monkeypatch.setenv("GRAPH_CHECKPOINTER", "redis")
+
+    def broken_chat(messages, **kwargs):
+        raise RuntimeError("router down")
+
+    monkeypatch.setattr(job_coach_graph, "chat", broken_chat)
+    monkeypatch.setattr(job_coach_graph, "_TOOLS_BY_NAME", {"run_interview_turn": _Tool("fallback answer")})
+    monkeypatch.setattr(
+        job_coach_graph,
+        "get_conversation_history",
+        lambda thread_id: [{"role": "user", "content": "earlier"}, {"role": "assistant", "content": "reply"}],
+    )
+
+    result = job_coach_graph.run_graph("new question", [], {}, thread_id="conv_9")
+    assert result["answer"] == "fallback answer"
+    state = job_coach_graph._CHECKPOINTED_GRAPH.get_state(job_coach_graph._thread_config("conv_9"))
+    assert [msg.content for msg in state.values["messages"]] == ["earlier", "reply", "new question", "fallback answer"]
+
+    seen: list = []
+
+    def unreadable():
+        raise RedisError("down")
+
+    def fallback_tool_call(exc, question, session, input_messages):
+        seen.append([msg.content for msg in input_messages])
+        return "run_interview_turn", {}
+
+    monkeypatch.setattr(redis_checkpointer, "get_binary_redis_client", unreadable)
+    monkeypatch.setattr(job_coach_graph, "_fallback_tool_call", fallback_tool_call)
+    job_coach_graph.run_graph("next question", [], {}, thread_id="conv_9")
+    assert seen == [["earlier", "reply", "next question"]]
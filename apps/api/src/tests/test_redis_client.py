@@ -0,0 +1,49 @@
+from redis import BlockingConnectionPool
+from redis.sentinel import SentinelConnectionPool
+
+from src.core import redis_client
+
+
+def test_redis_nodes_parse_and_default(monkeypatch):
+    monkeypatch.setenv("REDIS_PORT", "6380")
+    monkeypatch.setenv("REDIS_NODES", "10.0.0.1:7000, 10.0.0.2 ,")
+    assert redis_client.redis_nodes() == [("10.0.0.1", 7000), ("10.0.0.2", 6380)]
+
+    monkeypatch.setenv("REDIS_NODES", "")
+    monkeypatch.setenv("REDIS_HOST", "cache")
+    assert redis_client.redis_nodes() == [("cache", 6380)]
+
+
+def test_standalone_blocking_pool_settings(monkeypatch):
+    monkeypatch.setenv("REDIS_MAX_CONNECTIONS", "7")
+    monkeypatch.setenv("REDIS_POOL_BLOCK", "true")
+    monkeypatch.setenv("REDIS_POOL_TIMEOUT_S", "1.5")
+    pool = redis_client._build_client().connection_pool
+    assert isinstance(pool, BlockingConnectionPool)
+    assert pool.max_connections == 7
+    assert pool.timeout == 1.5
+
+
+def test_cluster_mode_uses_startup_nodes_without_db(monkeypatch):
+    seen: dict = {}
+
+    def fake_cluster(**kwargs):
+        seen.update(kwargs)
+        return "cluster"
+
+    monkeypatch.setattr(redis_client, "RedisCluster", fake_cluster)
+    monkeypatch.setenv("REDIS_MODE", "cluster")
+    monkeypatch.setenv("REDIS_NODES", "n1:7000,n2:7001")
+    assert redis_client._build_client(decode_responses=False) == "cluster"
+    assert [(node.host, node.port) for node in seen["startup_nodes"]] == [("n1", 7000), ("n2", 7001)]
+    assert "db" not in seen and "host" not in seen
+    assert seen["decode_responses"] is False
+
+
+def test_sentinel_mode_resolves_master_by_name(monkeypatch):
+    monkeypatch.setenv("REDIS_MODE", "sentinel")
+    monkeypatch.setenv("REDIS_NODES", "s1:26379,s2:26379")
+    monkeypatch.setenv("REDIS_SENTINEL_MASTER", "sessions")
+    client = redis_client._build_client()
+    assert isinstance(client.connection_pool, SentinelConnectionPool)
+    assert client.connection_pool.service_name == "sessions"
@@ -1,6 +1,15 @@
+import asyncio
 from types import SimpleNamespace
 
+import pytest
+
 from src.graph import redis_session_store
+from src.graph.session_codec import JSON_FORMAT, decode_value
+
+
+def _raw(value):
+    # Binary clients hand back exactly the bytes that were written.
+    return value if isinstance(value, bytes) else str(value)
 
 
 class _FakePipeline:
@@ -16,13 +25,57 @@ class _FakePipeline:
         self._ops.append(("sadd", key, values))
         return self
 
+    def hget(self, key, field):
+        self._ops.append(("hget", key, field))
+        return self
+
+    def smembers(self, key):
+        self._ops.append(("smembers", key, None))
+        return self
+
+    def rpush(self, key, *values):
+        self._ops.append(("rpush", key, values))
+        return self
+
+    def expire(self, key, ttl):
+        self._ops.append(("expire", key, ttl))
+        return self
+
+    def memory_usage(self, key):
+        self._ops.append(("memory_usage", key, None))
+        return self
+
+    def ttl(self, key):
+        self._ops.append(("ttl", key, None))
+        return self
+
+    def ltrim(self, key, start, end):
+        self._ops.append(("ltrim", key, (start, end)))
+        return self
+
     def execute(self):
+        results = []
         for op, key, payload in self._ops:
             if op == "hset":
-                self._r.hset(key, mapping=payload)
+                results.append(self._r.hset(key, mapping=payload))
             elif op == "sadd":
-                self._r.sadd(key, *payload)
+                results.append(self._r.sadd(key, *payload))
+            elif op == "hget":
+                results.append(self._r.hget(key, payload))
+            elif op == "smembers":
+                results.append(self._r.smembers(key))
+            elif op == "rpush":
+                results.append(self._r.rpush(key, *payload))
+            elif op == "ltrim":
+                results.append(self._r.ltrim(key, *payload))
+            elif op == "expire":
+                results.append(self._r.expire(key, payload))
+            elif op == "memory_usage":
+                results.append(self._r.memory_usage(key))
+            elif op == "ttl":
+                results.append(self._r.ttl(key))
         self._ops.clear()
+        return results
 
 
 class _FakeRedis:
@@ -30,6 +83,8 @@ class _FakeRedis:
         self.h: dict[str, dict[str, str]] = {}
         self.s: dict[str, set[str]] = {}
         self.kv: dict[str, str] = {}
+        self.lists: dict[str, list[str]] = {}
+        self.ttls: dict[str, int] = {}
 
     def ping(self):
         return True
@@ -42,9 +97,9 @@ class _FakeRedis:
             self.h[key] = {}
         if mapping is not None:
             for k, v in mapping.items():
-                self.h[key][str(k)] = str(v)
+                self.h[key][str(k)] = _raw(v)
             return
-        self.h[key][str(field)] = str(value)
+        self.h[key][str(field)] = _raw(value)
 
     def smembers(self, key):
         return set(self.s.get(key, set()))
@@ -53,7 +108,56 @@ class _FakeRedis:
         if key not in self.s:
             self.s[key] = set()
         for v in values:
-            self.s[key].add(str(v))
+            self.s[key].add(_raw(v))
+
+    def info(self, section=None):
+        _ = section
+        return {"redis_version": "7.2.4", "used_memory": 2048, "used_memory_human": "2.00K", "maxmemory": 0}
+
+    def register_script(self, source):
+        def store_request(keys, args, client=None):
+            # Stands in for the request-result script: field write plus the TTL refresh.
+            _ = source
+            target = client or self
+            target.hset(keys[0], args[0], args[1])
+            target.expire(keys[0], int(args[5]))
+            return 1
+
+        return store_request
+
+    def expire(self, key, ttl):
+        self.ttls[key] = int(ttl)
+        return True
+
+    def ttl(self, key):
+        exists = key in self.h or key in self.s or key in self.lists or key in self.kv
+        return self.ttls.get(key, -1) if exists else -2
+
+    def memory_usage(self, key):
+        if key in self.h:
+            return 64 + sum(len(k) + len(v) for k, v in self.h[key].items())
+        if key in self.s:
+            return 64 + sum(len(v) for v in self.s[key])
+        if key in self.lists:
+            return 64 + sum(len(v) for v in self.lists[key])
+        return None
+
+    def scan_iter(self, match=None, count=None):
+        _ = match, count
+        yield from [*self.h, *self.s, *self.lists]
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(_raw(v) for v in values)
+
+    def ltrim(self, key, start, end):
+        items = self.lists.get(key, [])
+        stop = len(items) + end + 1 if end < 0 else end + 1
+        self.lists[key] = items[start:stop] if start >= 0 else items[max(0, len(items) + start) : stop]
+
+    def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        stop = len(items) + end + 1 if end < 0 else end + 1
+        return items[start:stop] if start >= 0 else items[max(0, len(items) + start) : stop]
 
     def set(self, key, value, nx=False, px=None):
         _ = px
@@ -62,20 +166,35 @@ class _FakeRedis:
         self.kv[key] = str(value)
         return True
 
-    def eval(self, script, numkeys, key, owner):
-        _ = script, numkeys
+    def eval(self, script, numkeys, key, owner, *args):
+        _ = script, numkeys, args
         if self.kv.get(key) == owner:
             del self.kv[key]
             return 1
         return 0
 
-    def pipeline(self):
+    def pipeline(self, transaction=True):
+        _ = transaction
         return _FakePipeline(self)
 
 
+@pytest.fixture
+def lua_redis(monkeypatch):
+    """An in-memory Redis that runs the store's Lua scripts."""
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    try:
+        client.eval("return 1", 0)
+    except Exception:
+        pytest.skip("fakeredis without Lua support (install fakeredis[lua])")
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: client)
+    monkeypatch.setattr(redis_session_store, "_SCRIPTS", {})
+    return client
+
+
 def test_state_roundtrip_and_permanent_asked(monkeypatch):
     fake = _FakeRedis()
-    monkeypatch.setattr(redis_session_store, "get_redis_client", lambda: fake)
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
 
     state = {
         "source_id": "resume_1",
@@ -98,7 +217,7 @@ def test_state_roundtrip_and_permanent_asked(monkeypatch):
 
 def test_request_result_roundtrip(monkeypatch):
     fake = _FakeRedis()
-    monkeypatch.setattr(redis_session_store, "get_redis_client", lambda: fake)
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
     redis_session_store.set_request_result("conv_2", "req_1", {"answer": "ok"})
     cached = redis_session_store.get_request_result("conv_2", "req_1")
     assert cached == {"answer": "ok"}
@@ -106,7 +225,7 @@ def test_request_result_roundtrip(monkeypatch):
 
 def test_lock_acquire_release(monkeypatch):
     fake = _FakeRedis()
-    monkeypatch.setattr(redis_session_store, "get_redis_client", lambda: fake)
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
     monkeypatch.setattr(
         redis_session_store,
         "get_settings",
@@ -117,3 +236,180 @@ def test_lock_acquire_release(monkeypatch):
     redis_session_store.release_conversation_lock("conv_3", "owner_a")
     assert redis_session_store.acquire_conversation_lock("conv_3", "owner_b") is True
 
+
+def test_conversation_history_is_capped(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
+    monkeypatch.setattr(
+        redis_session_store,
+        "get_settings",
+        lambda: SimpleNamespace(chat_history_max_messages=4, session_ttl_s=60),
+    )
+    for turn in range(3):
+        redis_session_store.append_conversation_history(
+            "conv_4",
+            [{"role": "user", "content": f"q{turn}"}, {"role": "assistant", "content": f"a{turn}"}],
+        )
+    history = redis_session_store.get_conversation_history("conv_4")
+    assert [item["content"] for item in history] == ["q1", "a1", "q2", "a2"]
+
+
+def test_session_keys_get_ttl_and_memory_report(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
+    monkeypatch.setenv("SESSION_TTL_S", "120")
+    redis_session_store.set_resume_interview_state("conv_5", {"source_id": "r", "asked_question_ids": ["q1"]})
+    redis_session_store.set_request_result("conv_5", "req_1", {"answer": "ok"})
+    redis_session_store.set_resume_interview_state("conv_6", {"source_id": "r"})
+
+    assert fake.ttls["jc:{conv_5}:state"] == 120
+    assert fake.ttls["jc:{conv_5}:asked"] == 120
+    assert fake.ttls["jc:{conv_5}:req"] == 120
+
+    one = redis_session_store.session_memory_report("conv_5")
+    assert {item["key"] for item in one["keys"]} == {"jc:{conv_5}:state", "jc:{conv_5}:asked", "jc:{conv_5}:req"}
+    assert one["by_kind"]["state"]["without_ttl"] == 0
+
+    everything = redis_session_store.session_memory_report(sample=100)
+    assert everything["by_kind"]["state"]["keys"] == 2
+    assert everything["used_memory"] == 2048
+
+
+def test_state_is_stored_as_codec_blob_without_card_text(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
+    state = {
+        "source_id": "resume_1",
+        "current_context_id": "card_7",
+        "current_question": "讲讲 Redis 分布式锁",
+        "current_standard_answer": "SET NX PX 加唯一值释放",
+        "current_key_points": ["NX", "PX"],
+    }
+    redis_session_store.set_resume_interview_state("conv_7", state)
+
+    raw = fake.h["jc:{conv_7}:state"]["resume_interview_state"]
+    assert isinstance(raw, bytes) and raw[0] & 0x7F in {JSON_FORMAT, 0x02}
+    assert decode_value(raw) == {"source_id": "resume_1", "current_context_id": "card_7"}
+
+
+def test_legacy_json_state_still_loads(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
+    fake.hset("jc:{conv_8}:state", mapping={"resume_interview_state": b'{"source_id": "resume_1", "topic": "ai"}'})
+    fake.sadd("jc:{conv_8}:asked", b"q1")
+
+    loaded = redis_session_store.get_resume_interview_state("conv_8")
+    assert loaded == {"source_id": "resume_1", "topic": "ai", "asked_question_ids": ["q1"]}
+
+
+def test_near_cache_reads_use_tracking_client(monkeypatch):
+    fake = _FakeRedis()
+    cached = _FakeRedis()
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
+    monkeypatch.setattr(redis_session_store, "get_cached_redis_client", lambda: cached)
+    monkeypatch.setenv("SESSION_NEAR_CACHE", "true")
+    redis_session_store.set_request_result("conv_9", "req_1", {"answer": "ok"})
+    redis_session_store.set_resume_interview_state("conv_9", {"source_id": "r", "asked_question_ids": ["q1"]})
+    cached.h = fake.h
+
+    assert redis_session_store.get_request_result("conv_9", "req_1") == {"answer": "ok"}
+    # Interview state always comes from Redis itself.
+    assert redis_session_store.get_resume_interview_state("conv_9") == {"source_id": "r", "asked_question_ids": ["q1"]}
+
+
+def test_longer_client_history_reseeds_the_transcript(lua_redis, monkeypatch):
+    monkeypatch.setenv("CHAT_HISTORY_MAX_MESSAGES", "6")
+    client_history = [
+        {"role": "user", "content": "q0"},
+        {"role": "assistant", "content": "a0"},
+        {"role": "user", "content": "q1"},
+        {"role": "assistant", "content": "a1"},
+    ]
+    redis_session_store.append_conversation_history(
+        "conv_10", [{"role": "user", "content": "q1"}, {"role": "assistant", "content": "a1"}]
+    )
+    redis_session_store.append_conversation_history(
+        "conv_10", [{"role": "user", "content": "q2"}, {"role": "assistant", "content": "a2"}], seed=client_history
+    )
+    history = redis_session_store.get_conversation_history("conv_10")
+    assert [item["content"] for item in history] == ["q0", "a0", "q1", "a1", "q2", "a2"]
+
+    # A transcript at least as long as the client's copy is kept.
+    redis_session_store.append_conversation_history(
+        "conv_10", [{"role": "user", "content": "q3"}, {"role": "assistant", "content": "a3"}], seed=client_history
+    )
+    history = redis_session_store.get_conversation_history("conv_10")
+    assert [item["content"] for item in history] == ["q1", "a1", "q2", "a2", "q3", "a3"]
+
+    redis_session_store.finish_turn(
+        "conv_11",
+        "owner",
+        resume_state={},
+        request_id="req_1",
+        result={"answer": "a2"},
+        history=[{"role": "user", "content": "q2"}, {"role": "assistant", "content": "a2"}],
+        seed=client_history,
+    )
+    history = redis_session_store.get_conversation_history("conv_11")
+    assert [item["content"] for item in history] == ["q0", "a0", "q1", "a1", "q2", "a2"]
+
+
+def test_request_results_are_capped_and_aged_out(lua_redis, monkeypatch):
+    monkeypatch.setenv("REQUEST_CACHE_MAX", "2")
+    monkeypatch.setenv("REQUEST_CACHE_TTL_S", "60")
+    monkeypatch.setenv("SESSION_TTL_S", "120")
+    for rid in ("req_1", "req_2", "req_3"):
+        redis_session_store.set_request_result("conv_12", rid, {"answer": rid})
+
+    assert redis_session_store.get_request_result("conv_12", "req_1") is None
+    assert redis_session_store.get_request_result("conv_12", "req_3") == {"answer": "req_3"}
+    assert sorted(lua_redis.zrange("jc:{conv_12}:reqidx", 0, -1)) == [b"req_2", b"req_3"]
+    assert 0 < lua_redis.ttl("jc:{conv_12}:req") <= 120
+
+    # An entry stored longer ago than REQUEST_CACHE_TTL_S is dropped by the next write.
+    lua_redis.zadd("jc:{conv_12}:reqidx", {"req_2": 0})
+    redis_session_store.set_request_result("conv_12", "req_4", {"answer": "req_4"})
+    assert redis_session_store.get_request_result("conv_12", "req_2") is None
+    assert sorted(lua_redis.hkeys("jc:{conv_12}:req")) == [b"req_3", b"req_4"]
+
+
+def test_memory_report_skips_llm_limiter_keys(monkeypatch):
+    fake = _FakeRedis()
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: fake)
+    fake.hset("jc:{llm}:bucket", mapping={"tokens": "1"})
+    fake.rpush("jc:{llm}:slots", "slot")
+    redis_session_store.set_resume_interview_state("conv_13", {"source_id": "r", "asked_question_ids": ["q1"]})
+
+    report = redis_session_store.session_memory_report(sample=100)
+    assert set(report["by_kind"]) == {"state", "asked"}
+    assert report["sampled_keys"] == 2
+
+
+def test_cancelled_waiter_leaves_the_lock_queue(lua_redis, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    sync_client = fakeredis.FakeRedis(server=server)
+    async_client = fakeredis.aioredis.FakeRedis(server=server)
+    monkeypatch.setattr(redis_session_store, "get_binary_redis_client", lambda: sync_client)
+    monkeypatch.setattr(redis_session_store, "get_async_binary_redis_client", lambda: async_client)
+    monkeypatch.setattr(redis_session_store, "_ASYNC_SCRIPTS", {})
+    listener = SimpleNamespace(
+        watch=lambda channel: asyncio.Event(),
+        unwatch=lambda channel, event: None,
+        ensure_started=lambda: asyncio.sleep(0),
+    )
+    monkeypatch.setattr(redis_session_store, "_release_listener", lambda: listener)
+    queue = redis_session_store._lock_queue_key("conv_q")
+    assert redis_session_store.begin_turn("conv_q", "owner_a", "req_a").acquired
+
+    async def scenario():
+        waiter = asyncio.create_task(redis_session_store.abegin_turn("conv_q", "owner_b", "req_b"))
+        await asyncio.sleep(0.2)
+        queued = await async_client.zscore(queue, "owner_b")
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return queued
+
+    assert asyncio.run(scenario()) is not None
+    assert sync_client.zscore(queue, "owner_b") is None
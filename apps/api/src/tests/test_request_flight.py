@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from src.graph import request_flight
+from src.graph.request_flight import astart_flight
+
+
+async def _collect(flight, after: int = 0) -> list[tuple]:
+    return [item async for item in flight.follow(after=after)]
+
+
+def test_local_follower_replays_leader_events(monkeypatch):
+    monkeypatch.setenv("REQUEST_COALESCING", "local")
+
+    async def scenario():
+        leader = await astart_flight("conv_1", "req_1")
+        follower = await astart_flight("conv_1", "req_1")
+        assert leader.leader and not follower.leader
+        await leader.publish("token", {"delta": "a"})
+        task = asyncio.create_task(_collect(follower))
+        await asyncio.sleep(0)
+        await leader.publish("token", {"delta": "b"})
+        await leader.publish("done", {"ok": True})
+        await leader.finish()
+        return await task
+
+    seen = asyncio.run(scenario())
+    assert seen == [(1, "token", {"delta": "a"}), (2, "token", {"delta": "b"}), (3, "done", {"ok": True})]
+
+
+def test_follower_gets_error_when_leader_stops_early(monkeypatch):
+    monkeypatch.setenv("REQUEST_COALESCING", "local")
+
+    async def scenario():
+        leader = await astart_flight("conv_2", "req_1")
+        follower = await astart_flight("conv_2", "req_1")
+        task = asyncio.create_task(_collect(follower))
+        await leader.publish("status", {"stage": "generate"})
+        await leader.finish()
+        seen = await task
+        after = await astart_flight("conv_2", "req_1")
+        return seen, after.leader
+
+    seen, next_is_leader = asyncio.run(scenario())
+    assert [event for _, event, _ in seen] == ["status", "error"]
+    assert next_is_leader is True
+
+
+def test_coalescing_off_or_without_ids(monkeypatch):
+    monkeypatch.setenv("REQUEST_COALESCING", "off")
+    assert asyncio.run(astart_flight("conv_3", "req_1")) is None
+    monkeypatch.setenv("REQUEST_COALESCING", "local")
+    assert asyncio.run(astart_flight("conv_3", "")) is None
+
+
+def test_resume_skips_events_the_client_already_has(monkeypatch):
+    monkeypatch.setenv("REQUEST_COALESCING", "local")
+
+    async def scenario():
+        leader = await astart_flight("conv_4", "req_1")
+        for delta in ("a", "b", "c"):
+            await leader.publish("token", {"delta": delta})
+        resumed = await astart_flight("conv_4", "req_1")
+        task = asyncio.create_task(_collect(resumed, after=2))
+        await leader.publish("done", {"ok": True})
+        await leader.finish()
+        return await task
+
+    assert asyncio.run(scenario()) == [(3, "token", {"delta": "c"}), (4, "done", {"ok": True})]
+
+
+def test_led_turn_outlives_a_dropped_response(monkeypatch):
+    monkeypatch.setenv("REQUEST_COALESCING", "local")
+    monkeypatch.setenv("REQUEST_RESUME_GRACE_S", "0.5")
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def events():
+            yield "status", {"stage": "generate"}
+            await gate.wait()
+            yield "done", {"ok": True}
+
+        leader = await astart_flight("conv_5", "req_1")
+        task = leader.lead(events())
+        first = leader.follow()
+        assert await first.__anext__() == (1, "status", {"stage": "generate"})
+        await first.aclose()
+        await asyncio.sleep(0.1)
+        resumed = await astart_flight("conv_5", "req_1")
+        follow = asyncio.create_task(_collect(resumed, after=1))
+        await asyncio.sleep(0)
+        gate.set()
+        seen = await follow
+        await task
+        return seen
+
+    assert asyncio.run(scenario()) == [(2, "done", {"ok": True})]
+
+
+def test_led_turn_is_cancelled_once_nobody_follows(monkeypatch):
+    monkeypatch.setenv("REQUEST_COALESCING", "local")
+    monkeypatch.setenv("REQUEST_RESUME_GRACE_S", "0.2")
+    cancelled: list[bool] = []
+
+    async def scenario():
+        async def events():
+            yield "status", {"stage": "generate"}
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            yield "done", {"ok": True}
+
+        leader = await astart_flight("conv_6", "req_1")
+        task = leader.lead(events())
+        await asyncio.wait({task}, timeout=2.0)
+        return task.cancelled()
+
+    assert asyncio.run(scenario()) is True
+    assert cancelled == [True]
+
+
+def test_lease_outlives_the_flight_ttl_while_the_turn_runs(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    monkeypatch.setenv("REQUEST_COALESCING", "redis")
+    monkeypatch.setenv("REQUEST_FLIGHT_TTL_S", "1")
+    monkeypatch.setenv("REQUEST_RESUME_GRACE_S", "0.4")
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(request_flight, "get_async_redis_client", lambda: client)
+
+    async def slow_turn():
+        yield "status", {"stage": "generate"}
+        await asyncio.sleep(1.6)
+        yield "done", {"ok": True}
+
+    async def scenario():
+        leader = await astart_flight("conv_9", "req_1")
+        leader.lead(slow_turn())
+        reader = asyncio.create_task(_collect(leader))
+        await asyncio.sleep(1.3)
+        # Past the TTL: a retry on another worker still joins the flight instead of restarting it.
+        alive = await client.exists(request_flight._lease_key("conv_9", "req_1"))
+        retry = await client.eval(request_flight._CLAIM_LUA, 2, request_flight._lease_key("conv_9", "req_1"),
+                                  request_flight._events_key("conv_9", "req_1"), "other", 1000)
+        return alive, retry, await reader
+
+    alive, retry, seen = asyncio.run(scenario())
+    assert alive and retry == 0
+    assert [event for _, event, _ in seen] == ["status", "done"]
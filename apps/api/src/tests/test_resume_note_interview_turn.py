@@ -1,5 +1,6 @@
 import json
 
+from src.rag import store
 from src.skills import resume_note_interview
 
 
@@ -53,29 +54,49 @@ def test_resume_note_interview_no_repeat_and_eval(monkeypatch):
 
     monkeypatch.setattr(resume_note_interview, "retrieve", fake_retrieve)
 
-    first_raw = resume_note_interview.run_resume_note_interview_turn.func(
+    first_answer, first = resume_note_interview.run_resume_note_interview_turn.func(
         user_input="开始面试",
         history=[],
         source_id="resume_1",
         top_k=10,
         session={},
     )
-    first = json.loads(first_raw)
+    assert first_answer == first["answer"]
     first_state = first["session"]["resume_interview_state"]
     assert "题目" in first["answer"]
     assert len(first_state["asked_question_ids"]) == 1
     first_qid = first_state["current_question_id"]
 
-    second_raw = resume_note_interview.run_resume_note_interview_turn.func(
+    _, second = resume_note_interview.run_resume_note_interview_turn.func(
         user_input="HashMap 底层是数组和链表，查找会先 hash 再 equals。",
         history=[],
         source_id="resume_1",
         top_k=10,
         session=first_state,
     )
-    second = json.loads(second_raw)
     second_state = second["session"]["resume_interview_state"]
     assert "参考答案" in second["answer"]
     assert len(second_state["asked_question_ids"]) == 2
     assert second_state["current_question_id"] != first_qid
 
+
+def test_coerce_state_rehydrates_card_text_by_context_id(monkeypatch):
+    class _FakeCollection:
+        def get(self, ids, include):
+            _ = include
+            assert ids == ["note:qa:1"]
+            return {
+                "ids": ["note:qa:1"],
+                "documents": ["Question: HashMap 原理？\nStandardAnswer:\n数组+链表/红黑树。"],
+                "metadatas": [{"question_id": "q_hashmap", "key_points_json": json.dumps(["数组+链表/红黑树"])}],
+            }
+
+    monkeypatch.setattr(store, "_CHUNK_CACHE", store._ChunkCache())
+    monkeypatch.setattr(store, "get_collection", lambda name=store.COLLECTION_NAME: _FakeCollection())
+    state = resume_note_interview._coerce_state(
+        {"source_id": "resume_1", "current_question_id": "q_hashmap", "current_context_id": "note:qa:1"},
+        "resume_1",
+    )
+    assert state["current_question"] == "HashMap 原理？"
+    assert state["current_standard_answer"] == "数组+链表/红黑树。"
+    assert state["current_key_points"] == ["数组+链表/红黑树"]
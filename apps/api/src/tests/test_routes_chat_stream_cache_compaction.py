@@ -1,4 +1,7 @@
+import asyncio
+
 from src.api import routes_chat_stream
+from src.rag import store
 
 
 class _FakeCollection:
@@ -22,7 +25,8 @@ def test_compact_result_only_stores_answer_and_citation_ids():
 
 
 def test_cached_payload_hydrates_used_context_by_citation_ids(monkeypatch):
-    monkeypatch.setattr(routes_chat_stream, "get_collection", lambda: _FakeCollection())
+    monkeypatch.setattr(store, "_CHUNK_CACHE", store._ChunkCache())
+    monkeypatch.setattr(store, "get_collection", lambda name=store.COLLECTION_NAME: _FakeCollection())
     parsed = routes_chat_stream._result_from_cached_payload(
         {"answer": "ok", "citation_ids": ["c1", "c2"]}
     )
@@ -32,3 +36,52 @@ def test_cached_payload_hydrates_used_context_by_citation_ids(monkeypatch):
     assert parsed["used_context"][0]["id"] == "c1"
     assert parsed["used_context"][0]["text"] == "doc::c1"
 
+
+def test_cited_context_drops_uncited_entries_and_loads_missing_text(monkeypatch):
+    loaded: list[list[str]] = []
+
+    class _RecordingCollection(_FakeCollection):
+        def get(self, ids, include):
+            loaded.append(list(ids))
+            return super().get(ids, include)
+
+    monkeypatch.setattr(store, "_CHUNK_CACHE", store._ChunkCache())
+    monkeypatch.setattr(store, "get_collection", lambda name=store.COLLECTION_NAME: _RecordingCollection())
+    used_context = [
+        {"id": "c1", "text": "in memory", "metadata": {}, "score": 0.1},
+        {"id": "c2", "metadata": {"filename": "note.md"}, "score": 0.2},
+        {"id": "resume:0", "text": "uncited resume chunk", "metadata": {}, "score": 0.3},
+    ]
+    cited = asyncio.run(routes_chat_stream._cited_context(used_context, [{"id": "c1"}, "c2"]))
+    assert [item["id"] for item in cited] == ["c1", "c2"]
+    assert cited[0]["text"] == "in memory"
+    assert cited[1]["text"] == "doc::c2"
+    assert cited[1]["metadata"] == {"filename": "note.md"}
+    assert loaded == [["c2"]]
+
+
+def test_cached_replays_hydrate_from_chunk_cache_until_a_write(monkeypatch):
+    loaded: list[list[str]] = []
+
+    class _RecordingCollection(_FakeCollection):
+        def get(self, ids, include):
+            loaded.append(list(ids))
+            return super().get(ids, include)
+
+        metadata = {"embedding_dim": 1}
+
+        def upsert(self, **kwargs):
+            pass
+
+    monkeypatch.setattr(store, "_CHUNK_CACHE", store._ChunkCache())
+    monkeypatch.setattr(store, "get_collection", lambda name=store.COLLECTION_NAME: _RecordingCollection())
+    cached = {"answer": "ok", "citation_ids": ["c1", "c2"]}
+
+    routes_chat_stream._result_from_cached_payload(cached)
+    replay = routes_chat_stream._result_from_cached_payload(cached)
+    assert [item["text"] for item in replay["used_context"]] == ["doc::c1", "doc::c2"]
+    assert loaded == [["c1", "c2"]]
+
+    store.upsert_chunks(ids=["c1"], chunks=["new"], embeddings=[[0.0]], metadatas=[{}])
+    routes_chat_stream._result_from_cached_payload(cached)
+    assert loaded == [["c1", "c2"], ["c1", "c2"]]
@@ -0,0 +1,196 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from src.api import routes_chat_stream
+from src.graph.redis_session_store import TurnStart
+from src.main import app
+
+
+@pytest.fixture(autouse=True)
+def _local_coalescing(monkeypatch):
+    monkeypatch.setenv("REQUEST_COALESCING", "local")
+
+
+def _payload(**overrides) -> dict:
+    body = {
+        "question": "我用 Redis 锁防止超卖",
+        "mode": "resume_interview",
+        "active_source_type": "resume",
+        "active_source_id": "resume_1",
+        "conversation_id": "conv_1",
+        "request_id": "req_1",
+    }
+    body.update(overrides)
+    return body
+
+
+def test_resume_turn_uses_one_begin_and_one_finish_call(monkeypatch):
+    monkeypatch.setenv("GRAPH_CHECKPOINTER", "off")
+    calls: list[tuple] = []
+
+    async def fake_begin(cid, owner, rid, *, load_history=False):
+        calls.append(("begin", cid, rid, load_history))
+        return TurnStart(
+            acquired=True,
+            resume_state={"asked_question_ids": ["q1"]},
+            history=[{"role": "assistant", "content": "问题：讲讲库存扣减"}],
+        )
+
+    async def fake_finish(cid, owner, *, resume_state, request_id, result, history=None, seed=None):
+        calls.append(("finish", cid, request_id, resume_state, result, history))
+        return True
+
+    async def fake_run_graph(question, history=None, session=None, **kwargs):
+        calls.append(("graph", history, session["resume_interview_state"]))
+        return {
+            "answer": "分类：正确",
+            "citations": [],
+            "used_context": [],
+            "session": {"resume_interview_state": {"asked_question_ids": ["q1", "q2"]}},
+        }
+
+    async def fake_release(*args):
+        calls.append(("release",))
+
+    monkeypatch.setattr(routes_chat_stream, "abegin_turn", fake_begin)
+    monkeypatch.setattr(routes_chat_stream, "afinish_turn", fake_finish)
+    monkeypatch.setattr(routes_chat_stream, "arun_graph", fake_run_graph)
+    monkeypatch.setattr(routes_chat_stream, "arelease_conversation_lock", fake_release)
+
+    resp = TestClient(app).post("/chat/stream", json=_payload())
+    assert '"history_stored": true' in resp.text
+
+    assert [c[0] for c in calls] == ["begin", "graph", "finish"]
+    assert calls[0] == ("begin", "conv_1", "req_1", True)
+    assert calls[1][1] == [{"role": "assistant", "content": "问题：讲讲库存扣减"}]
+    assert calls[2][3] == {"asked_question_ids": ["q1", "q2"]}
+    assert calls[2][4] == {"answer": "分类：正确", "citation_ids": []}
+    assert calls[2][5][0] == {"role": "user", "content": "我用 Redis 锁防止超卖"}
+
+
+async def _cached_begin(*args, **kwargs):
+    return TurnStart(acquired=True, cached_result={"answer": "cached", "citation_ids": []})
+
+
+def test_replayed_request_skips_graph_and_finish(monkeypatch):
+    calls: list[str] = []
+
+    async def fake_begin(*args, **kwargs):
+        return TurnStart(acquired=True, cached_result={"answer": "cached", "citation_ids": []})
+
+    async def fake_finish(*args, **kwargs):
+        calls.append("finish")
+
+    async def fake_release(*args):
+        calls.append("release")
+
+    monkeypatch.setattr(routes_chat_stream, "abegin_turn", fake_begin)
+    monkeypatch.setattr(routes_chat_stream, "afinish_turn", fake_finish)
+    monkeypatch.setattr(routes_chat_stream, "arun_graph", lambda *args, **kwargs: calls.append("graph"))
+    monkeypatch.setattr(routes_chat_stream, "arelease_conversation_lock", fake_release)
+
+    resp = TestClient(app).post("/chat/stream", json=_payload())
+    assert "cached" in resp.text
+    # The replay appended nothing, so the client must not rely on the server transcript yet.
+    assert '"history_stored": false' in resp.text
+    assert calls == []
+
+
+def test_failed_turn_releases_lock(monkeypatch):
+    calls: list[str] = []
+
+    async def fake_begin(*args, **kwargs):
+        return TurnStart(acquired=True)
+
+    async def fake_release(*args):
+        calls.append("release")
+
+    async def broken_graph(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(routes_chat_stream, "abegin_turn", fake_begin)
+    monkeypatch.setattr(routes_chat_stream, "arun_graph", broken_graph)
+    monkeypatch.setattr(routes_chat_stream, "arelease_conversation_lock", fake_release)
+
+    resp = TestClient(app).post("/chat/stream", json=_payload())
+    assert "event: error" in resp.text
+    assert calls == ["release"]
+
+
+def test_near_cache_hit_skips_lock_and_graph(monkeypatch):
+    calls: list[str] = []
+
+    async def fake_begin(*args, **kwargs):
+        calls.append("begin")
+        return TurnStart(acquired=True)
+
+    monkeypatch.setenv("SESSION_NEAR_CACHE", "true")
+    monkeypatch.setattr(routes_chat_stream, "get_request_result", lambda cid, rid: {"answer": "cached", "citation_ids": []})
+    monkeypatch.setattr(routes_chat_stream, "abegin_turn", fake_begin)
+    monkeypatch.setattr(routes_chat_stream, "arun_graph", lambda *args, **kwargs: calls.append("graph"))
+
+    resp = TestClient(app).post("/chat/stream", json=_payload())
+    assert "cached" in resp.text
+    assert calls == []
+
+
+def test_events_carry_sequence_ids(monkeypatch):
+    monkeypatch.setattr(routes_chat_stream, "abegin_turn", _cached_begin)
+    resp = TestClient(app).post("/chat/stream", json=_payload(request_id="req_ids"))
+    ids = [line for line in resp.text.splitlines() if line.startswith("id: ")]
+    assert ids[0] == "id: 1"
+    assert ids[-1] == f"id: {len(ids)}"
+
+
+def test_checkpointed_chat_turn_takes_the_conversation_lock(monkeypatch):
+    monkeypatch.setenv("GRAPH_CHECKPOINTER", "redis")
+    calls: list[tuple] = []
+
+    async def fake_begin(cid, owner, rid, *, load_history=False):
+        calls.append(("begin", cid, load_history))
+        return TurnStart(acquired=True, resume_state={"asked_question_ids": ["q1"]})
+
+    async def fake_finish(cid, owner, *, resume_state, request_id, result, history=None, seed=None):
+        calls.append(("finish", resume_state, len(history or [])))
+        return True
+
+    async def fake_run_graph(question, history=None, session=None, **kwargs):
+        calls.append(("graph", session["resume_interview_state"], kwargs.get("thread_id")))
+        return {"answer": "回答", "citations": [], "used_context": [], "session": {}}
+
+    monkeypatch.setattr(routes_chat_stream, "abegin_turn", fake_begin)
+    monkeypatch.setattr(routes_chat_stream, "afinish_turn", fake_finish)
+    monkeypatch.setattr(routes_chat_stream, "arun_graph", fake_run_graph)
+
+    resp = TestClient(app).post("/chat/stream", json=_payload(mode="chat", active_source_type=None))
+    assert "event: done" in resp.text
+    assert calls == [
+        ("begin", "conv_1", False),
+        ("graph", {}, "conv_1"),
+        ("finish", {"asked_question_ids": ["q1"]}, 2),
+    ]
+
+
+def test_checkpointed_chat_runs_stateless_when_redis_is_down(monkeypatch):
+    monkeypatch.setenv("GRAPH_CHECKPOINTER", "redis")
+    calls: list[tuple] = []
+
+    async def down(*args, **kwargs):
+        raise RuntimeError("Redis begin turn failed: connection refused")
+
+    async def fake_run_graph(question, history=None, session=None, **kwargs):
+        calls.append(("graph", kwargs.get("thread_id")))
+        return {"answer": "回答", "citations": [], "used_context": [], "session": {}}
+
+    monkeypatch.setattr(routes_chat_stream, "abegin_turn", down)
+    monkeypatch.setattr(routes_chat_stream, "aappend_conversation_history", down)
+    monkeypatch.setattr(routes_chat_stream, "arun_graph", fake_run_graph)
+
+    resp = TestClient(app).post("/chat/stream", json=_payload(mode="chat", active_source_type=None))
+    assert "event: done" in resp.text
+    assert "event: error" not in resp.text
+    assert calls == [("graph", None)]
+
+    # A resume interview cannot go on without its Redis state.
+    resp = TestClient(app).post("/chat/stream", json=_payload(request_id="req_2"))
+    assert "event: error" in resp.text
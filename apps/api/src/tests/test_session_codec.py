@@ -0,0 +1,30 @@
+from src.graph import session_codec
+from src.graph.session_codec import JSON_FORMAT, ZSTD_FLAG, decode_value, encode_value
+
+
+def test_roundtrip_keeps_unicode_and_nesting():
+    value = {"asked": ["q1", "q2"], "answer": "分类：正确", "score": 0.75, "meta": {"ok": True, "none": None}}
+    assert decode_value(encode_value(value)) == value
+
+
+def test_legacy_json_text_and_bytes_decode():
+    assert decode_value('{"answer": "ok"}') == {"answer": "ok"}
+    assert decode_value(b'[1, 2]') == [1, 2]
+    assert decode_value(None) is None
+    assert decode_value(b"\x7fgarbage") is None
+
+
+def test_large_payload_is_compressed_when_zstd_is_available(monkeypatch):
+    monkeypatch.setenv("SESSION_CODEC", "json+zstd")
+    value = {"history": ["我用 Redis 做分布式锁，lease 到期自动释放。" * 4] * 20}
+    blob = encode_value(value)
+    if session_codec._ZSTD_AVAILABLE:
+        assert blob[0] == JSON_FORMAT | ZSTD_FLAG
+        assert len(blob) < len(session_codec._json_dumps(value))
+    assert decode_value(blob) == value
+
+
+def test_small_payload_skips_compression(monkeypatch):
+    monkeypatch.setenv("SESSION_CODEC", "json+zstd")
+    blob = encode_value({"answer": "ok"})
+    assert blob[0] == JSON_FORMAT
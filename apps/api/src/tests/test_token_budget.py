@@ -0,0 +1,65 @@
+from src.llm.token_budget import SUMMARY_PREFIX, compact_history, count_message_tokens, count_tokens
+
+
+def _turns(n: int) -> list[dict]:
+    history: list[dict] = []
+    for i in range(n):
+        history.append({"role": "user", "content": f"第{i}轮回答：" + "我用 Redis 做分布式锁，" * 10})
+        history.append({"role": "assistant", "content": f"下一步问题 {i}: " + "how does the lease expire? " * 10})
+    return history
+
+
+def test_count_tokens_treats_cjk_as_one_token_per_char():
+    assert count_tokens("你好世界") == 4
+    assert count_tokens("ConcurrentHashMap") == 5
+    assert count_tokens("") == 0
+
+
+def test_short_history_is_untouched():
+    history = _turns(2)
+    result = compact_history(history, max_tokens=10_000, keep_last_turns=2, summary_max_tokens=100)
+    assert result.messages == history
+    assert result.summary_state is None
+
+
+def test_compaction_keeps_system_pinned_and_last_turns():
+    system = {"role": "system", "content": "bound resume"}
+    evidence = {"role": "tool", "content": "resume evidence: led payment migration"}
+    history = [system, *_turns(3), evidence, *_turns(6)]
+    result = compact_history(history, max_tokens=900, keep_last_turns=2, summary_max_tokens=120)
+
+    assert result.messages[0] == system
+    assert result.messages[1]["content"].startswith(SUMMARY_PREFIX)
+    assert evidence in result.messages
+    assert result.messages[-4:] == history[-4:]
+    assert count_message_tokens(result.messages) <= 900
+    assert result.tokens_after < result.tokens_before
+
+
+def test_cached_summary_only_summarizes_new_messages():
+    seen: list[int] = []
+
+    def summarize(previous: str, items: list) -> str:
+        seen.append(len(items))
+        return (previous + "\n" if previous else "") + f"- {len(items)} messages"
+
+    first = compact_history(_turns(6), max_tokens=600, keep_last_turns=2, summary_max_tokens=100, summarize=summarize)
+    second = compact_history(
+        _turns(7),
+        max_tokens=600,
+        keep_last_turns=2,
+        summary_max_tokens=100,
+        previous_summary=first.summary_state,
+        summarize=summarize,
+    )
+    again = compact_history(
+        _turns(7),
+        max_tokens=600,
+        keep_last_turns=2,
+        summary_max_tokens=100,
+        previous_summary=second.summary_state,
+        summarize=summarize,
+    )
+
+    assert seen == [8, 2]
+    assert again.summary_state == second.summary_state
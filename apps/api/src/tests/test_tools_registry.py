@@ -1,7 +1,10 @@
-﻿from src.tools.registry import call_tool
+﻿from src.core import deps
+from src.tools.registry import call_tool
 
 
-def test_tools_registry_retrieve():
+def test_tools_registry_retrieve(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(deps, "_client", None)
     call_tool(
         "ingest_text",
         {"text": "工具测试：分布式锁与异步下单", "source_type": "note", "source_id": "tool_note"},
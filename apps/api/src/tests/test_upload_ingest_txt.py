@@ -1,9 +1,12 @@
 ﻿from fastapi.testclient import TestClient
 
+from src.core import deps
 from src.main import app
 
 
-def test_upload_ingest_txt():
+def test_upload_ingest_txt(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(deps, "_client", None)
     client = TestClient(app)
     files = {
         "file": ("sample.txt", "hello world", "text/plain"),
@@ -17,7 +20,9 @@ def test_upload_ingest_txt():
     assert body.get("reused") is False
 
 
-def test_upload_ingest_txt_reuse_same_source():
+def test_upload_ingest_txt_reuse_same_source(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(deps, "_client", None)
     client = TestClient(app)
     files = {"file": ("sample.txt", "same text for dedupe", "text/plain")}
     data = {"source_type": "resume"}
@@ -29,12 +29,16 @@ export async function POST(request: Request) {
     request_id: payload.request_id ?? null,
   });
 
+  const forwardHeaders: Record<string, string> = { "content-type": "application/json" };
+  const lastEventId = request.headers.get("last-event-id");
+  if (lastEventId) {
+    forwardHeaders["last-event-id"] = lastEventId;
+  }
+
   const backendBase = getBackendBase();
   const res = await fetch(`${backendBase}/chat/stream`, {
     method: "POST",
-    headers: {
-      "content-type": "application/json",
-    },
+    headers: forwardHeaders,
     body: forwardBody,
   });
 
@@ -76,6 +76,14 @@ function makeRequestId() {
   return `req_${Date.now().toString(36)}_${Math.random().toString(36).slice(2, 10)}`;
 }
 
+// Reconnects after a dropped stream, resuming from the last event id the server sent.
+const STREAM_RESUME_ATTEMPTS = 3;
+const STREAM_RESUME_DELAY_MS = 1000;
+
+function sleep(ms: number) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
+
 function getErrorMessage(err: unknown): string {
   if (err instanceof Error) return err.message;
   return String(err);
@@ -106,6 +114,8 @@ export default function ChatPage() {
   const evidenceRefs = useRef<Record<string, HTMLDivElement | null>>({});
   const assistantIndexRef = useRef<number | null>(null);
   const streamControllerRef = useRef<AbortController | null>(null);
+  // Conversation whose transcript the server confirmed it stored; such requests only send the new question.
+  const serverHistoryRef = useRef<string | null>(null);
 
   const resetChat = useCallback(() => {
     streamControllerRef.current?.abort();
@@ -347,118 +357,162 @@ export default function ChatPage() {
 
     try {
       const requestId = makeRequestId();
-      const res = await fetch("/api/chat/stream", {
-        method: "POST",
-        headers: { "content-type": "application/json" },
-        body: JSON.stringify({
-          message: userMessage.content,
-          history: historyPayload,
-          mode: nextMode,
-          active_source_id: activeSource?.source_id ?? null,
-          active_source_type: activeSource?.source_type ?? null,
-          conversation_id: conversationId,
-          request_id: requestId,
-        }),
-        signal: controller.signal,
+      const requestBody = JSON.stringify({
+        message: userMessage.content,
+        history: serverHistoryRef.current === conversationId ? [] : historyPayload,
+        mode: nextMode,
+        active_source_id: activeSource?.source_id ?? null,
+        active_source_type: activeSource?.source_type ?? null,
+        conversation_id: conversationId,
+        request_id: requestId,
       });
+      let lastEventId = 0;
+      let finished = false;
 
-      if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
-
-      const reader = res.body.getReader();
-      const decoder = new TextDecoder("utf-8");
-      let buffer = "";
-
-      while (true) {
-        const { value, done } = await reader.read();
-        if (done) break;
-        buffer += decoder.decode(value, { stream: true });
-        const parts = buffer.split("\n\n");
-        buffer = parts.pop() ?? "";
-
-        for (const part of parts) {
-          const lines = part.split("\n");
-          let event = "message";
-          const dataLines: string[] = [];
-          for (const line of lines) {
-            if (line.startsWith("event:")) {
-              event = line.slice(6).trim();
-            } else if (line.startsWith("data:")) {
-              dataLines.push(line.slice(5).trimStart());
-            }
-          }
-          const dataStr = dataLines.join("\n");
-          if (!dataStr) continue;
-
-          let data: unknown;
-          try {
-            data = JSON.parse(dataStr);
-          } catch {
-            continue;
-          }
-          if (!isRecord(data)) continue;
-
-          if (event === "status") {
-            const stageMap: Record<string, string> = {
-              retrieve: "正在检索你的资料...",
-              generate: "正在组织回答...",
-              finalize: "正在整理引用...",
-            };
-            const stage = typeof data.stage === "string" ? data.stage : undefined;
-            const message = typeof data.message === "string" ? data.message : undefined;
-            const mapped = (stage ? stageMap[stage] : undefined) ?? message;
-            updateAssistant((prev) => ({
-              ...prev,
-              stage: stage ?? prev.stage,
-              stageText: mapped ?? prev.stageText,
-              isStreaming: true,
-            }));
-          } else if (event === "token") {
-            const delta = typeof data.delta === "string" ? data.delta : "";
-            updateAssistant((prev) => ({
-              ...prev,
-              content: `${prev.content}${delta}`,
-              isStreaming: true,
-            }));
-          } else if (event === "context") {
-            if (typeof data.conversation_id === "string" && data.conversation_id.trim()) {
-              setConversationId(data.conversation_id);
-            }
-            updateAssistant((prev) => ({
-              ...prev,
-              citations: normalizeCitations(data.citations),
-              used_context: Array.isArray(data.used_context) ? data.used_context : [],
-            }));
-          } else if (event === "done") {
-            if (typeof data.conversation_id === "string" && data.conversation_id.trim()) {
-              setConversationId(data.conversation_id);
+      for (let attempt = 0; !finished; attempt++) {
+        const headers: Record<string, string> = { "content-type": "application/json" };
+        if (lastEventId > 0) {
+          headers["last-event-id"] = String(lastEventId);
+        }
+        let sawEvent = false;
+        try {
+          const res = await fetch("/api/chat/stream", {
+            method: "POST",
+            headers,
+            body: requestBody,
+            signal: controller.signal,
+          });
+
+          if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+
+          const reader = res.body.getReader();
+          const decoder = new TextDecoder("utf-8");
+          let buffer = "";
+
+          while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const parts = buffer.split("\n\n");
+            buffer = parts.pop() ?? "";
+
+            for (const part of parts) {
+              const lines = part.split("\n");
+              let event = "message";
+              let eventId: number | null = null;
+              const dataLines: string[] = [];
+              for (const line of lines) {
+                if (line.startsWith("event:")) {
+                  event = line.slice(6).trim();
+                } else if (line.startsWith("id:")) {
+                  const parsed = Number.parseInt(line.slice(3).trim(), 10);
+                  eventId = Number.isFinite(parsed) ? parsed : null;
+                } else if (line.startsWith("data:")) {
+                  dataLines.push(line.slice(5).trimStart());
+                }
+              }
+              const dataStr = dataLines.join("\n");
+              if (!dataStr) continue;
+
+              let data: unknown;
+              try {
+                data = JSON.parse(dataStr);
+              } catch {
+                continue;
+              }
+              if (!isRecord(data)) continue;
+
+              if (eventId !== null) {
+                if (!sawEvent && lastEventId > 0 && eventId <= lastEventId) {
+                  // The buffered stream expired and the server ran the request again from id 1.
+                  updateAssistant((prev) => ({ ...prev, content: "", citations: [], used_context: [] }));
+                }
+                sawEvent = true;
+                lastEventId = eventId;
+              }
+              if (event === "done" || event === "error") {
+                finished = true;
+              }
+
+              if (event === "status") {
+                const stageMap: Record<string, string> = {
+                  retrieve: "正在检索你的资料...",
+                  generate: "正在组织回答...",
+                  finalize: "正在整理引用...",
+                };
+                const stage = typeof data.stage === "string" ? data.stage : undefined;
+                const message = typeof data.message === "string" ? data.message : undefined;
+                const mapped = (stage ? stageMap[stage] : undefined) ?? message;
+                updateAssistant((prev) => ({
+                  ...prev,
+                  stage: stage ?? prev.stage,
+                  stageText: mapped ?? prev.stageText,
+                  isStreaming: true,
+                }));
+              } else if (event === "token") {
+                const delta = typeof data.delta === "string" ? data.delta : "";
+                updateAssistant((prev) => ({
+                  ...prev,
+                  content: `${prev.content}${delta}`,
+                  isStreaming: true,
+                }));
+              } else if (event === "context") {
+                if (typeof data.conversation_id === "string" && data.conversation_id.trim()) {
+                  setConversationId(data.conversation_id);
+                }
+                updateAssistant((prev) => ({
+                  ...prev,
+                  citations: normalizeCitations(data.citations),
+                  used_context: Array.isArray(data.used_context) ? data.used_context : [],
+                }));
+              } else if (event === "done") {
+                if (typeof data.conversation_id === "string" && data.conversation_id.trim()) {
+                  setConversationId(data.conversation_id);
+                }
+                serverHistoryRef.current =
+                  data.history_stored === true
+                    ? typeof data.conversation_id === "string" && data.conversation_id.trim()
+                      ? data.conversation_id
+                      : conversationId
+                    : null;
+                updateAssistant((prev) => ({
+                  ...prev,
+                  stage: "done",
+                  isStreaming: false,
+                }));
+                setTimeout(() => {
+                  updateAssistant((prev) => ({
+                    ...prev,
+                    stageText: "",
+                  }));
+                }, 800);
+                setLoading(false);
+              } else if (event === "error") {
+                serverHistoryRef.current = null;
+                const errorText =
+                  typeof data.error === "string" && data.error.trim()
+                    ? data.error
+                    : "抱歉，流式生成失败，请稍后重试。";
+                updateAssistant((prev) => ({
+                  ...prev,
+                  content: errorText,
+                  stage: "error",
+                  stageText: "出错",
+                  isStreaming: false,
+                }));
+                setErr(errorText);
+                setLoading(false);
+              }
             }
-            updateAssistant((prev) => ({
-              ...prev,
-              stage: "done",
-              isStreaming: false,
-            }));
-            setTimeout(() => {
-              updateAssistant((prev) => ({
-                ...prev,
-                stageText: "",
-              }));
-            }, 800);
-            setLoading(false);
-          } else if (event === "error") {
-            const errorText =
-              typeof data.error === "string" && data.error.trim()
-                ? data.error
-                : "抱歉，流式生成失败，请稍后重试。";
-            updateAssistant((prev) => ({
-              ...prev,
-              content: errorText,
-              stage: "error",
-              stageText: "出错",
-              isStreaming: false,
-            }));
-            setErr(errorText);
-            setLoading(false);
           }
+        } catch (e: unknown) {
+          if (lastEventId === 0 || attempt + 1 >= STREAM_RESUME_ATTEMPTS || controller.signal.aborted) throw e;
+        }
+        if (!finished) {
+          // Without event ids (coalescing off) there is nothing to resume from.
+          if (lastEventId === 0) break;
+          if (attempt + 1 >= STREAM_RESUME_ATTEMPTS) throw new Error("连接中断，请重试。");
+          await sleep(STREAM_RESUME_DELAY_MS);
         }
       }
     } catch (e: unknown) {
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+API_SRC = REPO_ROOT / "apps" / "api"
+if str(API_SRC) not in sys.path:
+    sys.path.insert(0, str(API_SRC))
+
+from src.graph import session_codec  # noqa: E402
+
+
+def _parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Compare session value size and speed: plain JSON vs SESSION_CODEC.")
+    p.add_argument("--turns", type=int, default=40, help="Chat turns in the sample history.")
+    p.add_argument("--rounds", type=int, default=2000, help="Encode/decode iterations per codec.")
+    p.add_argument(
+        "--codecs",
+        default="json,json+zstd,msgpack,msgpack+zstd",
+        help="Comma-separated SESSION_CODEC values to compare.",
+    )
+    return p
+
+
+def _samples(turns: int) -> dict[str, object]:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"第{i}轮回答：我在项目里用 Redis Lua 脚本扣减库存，避免超卖。"})
+        history.append({"role": "assistant", "content": f"追问 {i}: how do you keep the lock lease from expiring mid-update?"})
+    state = {
+        "source_id": "resume_1",
+        "topic": "redis",
+        "current_question_id": "q_redis_lock",
+        "current_context_id": "note:qa:17",
+    }
+    result = {"answer": "分类：部分正确\n" + "要点：NX、PX、唯一值释放。" * 8, "citation_ids": ["note:qa:17", "resume:3"]}
+    return {"state": state, "result": result, "history_entry": history[0], "history": history}
+
+
+def _bench(name: str, value: object, rounds: int) -> tuple[int, float, float]:
+    blob = session_codec.encode_value(value, codec=name)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        session_codec.encode_value(value, codec=name)
+    enc_us = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        session_codec.decode_value(blob)
+    dec_us = (time.perf_counter() - start) / rounds * 1e6
+    return len(blob), enc_us, dec_us
+
+
+def main() -> int:
+    args = _parser().parse_args()
+    codecs = [item.strip() for item in args.codecs.split(",") if item.strip()]
+    print(f"msgpack={session_codec._MSGPACK_AVAILABLE} zstd={session_codec._ZSTD_AVAILABLE}")
+    for label, value in _samples(max(1, args.turns)).items():
+        baseline = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        print(f"\n{label}: legacy json {baseline} B")
+        for name in codecs:
+            size, enc_us, dec_us = _bench(name, value, max(1, args.rounds))
+            print(f"  {name:<14}{size:>8} B {size / baseline:>6.0%}  encode {enc_us:8.1f} us  decode {dec_us:8.1f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())